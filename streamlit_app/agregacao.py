@@ -0,0 +1,196 @@
+"""Cubos de contagens pré-agregados para as páginas do dashboard.
+
+Depois do prepare_data, o dataframe é reduzido uma única vez a cubos com a
+contagem de pessoas em cada combinação das dimensões abaixo. Cada cubo tem
+só as dimensões que as suas páginas cruzam, então o seu tamanho é limitado
+pelo produto dos domínios dessas dimensões, e não pelo número de linhas. As
+páginas respondem tabelas e gráficos somando células dos cubos, que são
+persistidos em Parquet ao lado do dataset e sobrevivem a reinícios.
+
+Quando o dataset tem o fator de expansão da pesquisa (``DASHBOARD_COLUNA_PESO``),
+cada célula guarda também a soma dos pesos (``peso``). A visão ``ponderado``
+troca a contagem pelo peso, de modo que as mesmas consultas (somas com
+np.bincount) produzem estimativas populacionais sem custo adicional.
+"""
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from dados import COLUNA_PESO, VERSAO_SCHEMA, caminhos_artefato, gravar_parquet, parquet_atualizado
+from modais import num_modais_por_tipo
+
+# Incrementar sempre que as dimensões ou as derivações do prepare_data mudarem
+VERSAO_CUBO = 5
+
+CUBOS = {
+    # Visão geral, estatísticas descritivas, tipo de trajeto e perfil dos usuários de integração
+    'cubo_perfil': [
+        'sexo', 'faixa_etaria', 'renda', 'trabalha_flag', 'estuda_flag', 'usuario_integracao',
+        'tipo_trajeto_trabalho', 'tipo_trajeto_aula', 'tipo_trajeto_filhos',
+    ],
+    # Mapa e modais por bairro, bairros de residência (descritivas, sidebar e simulador)
+    'cubo_localizacao': [
+        'cidade_residencia', 'bairro_residencia', 'usuario_integracao', 'tipo_trajeto_trabalho',
+        'modal_trabalho_mask',
+    ],
+    # Modais por sexo e por renda (perfil demográfico)
+    'cubo_modais': ['sexo', 'renda', 'modal_trabalho_mask'],
+}
+
+
+# Colunas somáveis dos agregados (o peso só existe com o fator de expansão)
+MEDIDAS = ['contagem', 'peso']
+
+N_REAMOSTRAS = 1000
+TAMANHO_LOTE_REAMOSTRAS = 250
+
+
+def contar_grupos(df, chaves):
+    """Contagem de linhas e, se houver fator de expansão, soma dos pesos por combinação das chaves"""
+    grupos = df.groupby(chaves, dropna=False, sort=False, observed=True)
+    if COLUNA_PESO in df.columns:
+        return grupos[COLUNA_PESO].agg(contagem='size', peso='sum').reset_index()
+    return grupos.size().rename('contagem').reset_index()
+
+
+def construir_cubo(df, nome):
+    """Agrega o dataframe preparado em contagens por combinação das dimensões do cubo ``nome``"""
+    return contar_grupos(df, CUBOS[nome])
+
+
+def caminhos_cubo(caminho_csv, nome):
+    """Locais candidatos de um cubo persistido (mesmas regras do Parquet do dataset)"""
+    return caminhos_artefato(caminho_csv, f'{nome}.v{VERSAO_SCHEMA}.{VERSAO_CUBO}.parquet')
+
+
+def carregar_cubo(caminho_csv, identidade, nome, df=None):
+    """Lê o cubo persistido do CSV (com esta identidade) se existir; senão constrói a partir de ``df`` e grava"""
+    destinos = caminhos_cubo(caminho_csv, nome)
+
+    for caminho in destinos:
+        if parquet_atualizado(caminho, identidade):
+            return pd.read_parquet(caminho, engine='pyarrow')
+
+    if df is None:
+        raise ValueError("Cubo não persistido: informe o dataframe preparado para construí-lo")
+    cubo = construir_cubo(df, nome)
+    gravar_parquet(cubo, destinos, identidade)
+    return cubo
+
+
+# ==================== PONDERAÇÃO ====================
+def ponderado(tabela):
+    """Visão com a soma dos pesos no lugar da contagem (a contagem bruta fica em ``registros``)"""
+    return tabela.assign(registros=tabela['contagem'], contagem=tabela['peso'])
+
+
+def _reamostrar(registros, pesos_medios, inicios, tamanho, semente):
+    """Lote de reamostragens: pessoas sorteadas com reposição entre os grupos (categoria, peso médio),
+    cada uma com o peso do seu grupo; ``inicios`` marca o primeiro grupo de cada categoria"""
+    rng = np.random.default_rng(semente)
+    n = registros.sum()
+    sorteios = np.add.reduceat(rng.multinomial(n, registros / n, size=tamanho) * pesos_medios, inicios, axis=1)
+    return sorteios / sorteios.sum(axis=1, keepdims=True)
+
+
+def intervalo_bootstrap(cubo, dimensao, filtro=None, n_reamostras=N_REAMOSTRAS, nivel=0.95, n_jobs=1,
+                        semente=42):
+    """Percentual de cada valor da dimensão com intervalo de confiança bootstrap (percentis).
+
+    As pessoas são reamostradas com reposição (multinomial sobre as células
+    do cubo) e cada uma carrega o peso médio da sua célula, então a variação
+    dos pesos entre as células de uma mesma categoria entra nas reamostras;
+    só a variação dentro de uma célula (pessoas idênticas em todas as
+    dimensões do cubo) fica de fora. Células da mesma categoria com o mesmo
+    peso médio são sorteadas juntas: sem fator de expansão (peso 1), o
+    sorteio é um multinomial sobre as categorias. Os lotes de reamostragens
+    rodam em paralelo com sementes derivadas de ``semente``, então o
+    resultado não depende de n_jobs.
+    """
+    dados = cubo if filtro is None else cubo[filtro]
+    codigos, rotulos = pd.factorize(dados[dimensao], sort=True)
+    validos = codigos >= 0
+    coluna_registros = 'registros' if 'registros' in dados.columns else 'contagem'
+    registros_celulas = dados[coluna_registros].to_numpy(dtype=float)[validos]
+    pesos_celulas = dados['contagem'].to_numpy(dtype=float)[validos]
+    registros = np.bincount(codigos[validos], weights=registros_celulas, minlength=len(rotulos))
+    pesos = np.bincount(codigos[validos], weights=pesos_celulas, minlength=len(rotulos))
+
+    # Grupos (categoria, peso médio da célula), ordenados pela categoria
+    ocupadas = registros_celulas > 0
+    categorias = codigos[validos][ocupadas]
+    pesos_medios = pesos_celulas[ocupadas] / registros_celulas[ocupadas]
+    grupos, inverso = np.unique(np.column_stack([categorias, pesos_medios]), axis=0, return_inverse=True)
+    registros_grupos = np.bincount(inverso.ravel(), weights=registros_celulas[ocupadas], minlength=len(grupos))
+    categorias_grupos = grupos[:, 0].astype(np.int64)
+    inicios = np.searchsorted(categorias_grupos, np.arange(len(rotulos)))
+    # Categorias sem pessoas (inicio no fim ou repetido) recebem zero em todas as reamostras
+    com_pessoas = np.isin(np.arange(len(rotulos)), categorias_grupos)
+
+    lotes = [min(TAMANHO_LOTE_REAMOSTRAS, n_reamostras - i) for i in range(0, n_reamostras, TAMANHO_LOTE_REAMOSTRAS)]
+    sementes = np.random.SeedSequence(semente).spawn(len(lotes))
+    reamostras = np.concatenate(Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_reamostrar)(registros_grupos.astype(np.int64), grupos[:, 1], inicios[com_pessoas], tamanho, s)
+        for tamanho, s in zip(lotes, sementes)
+    ))
+    proporcoes = np.zeros((len(reamostras), len(rotulos)))
+    proporcoes[:, com_pessoas] = reamostras
+
+    alfa = (1 - nivel) / 2
+    limites = np.quantile(proporcoes, [alfa, 1 - alfa], axis=0)
+    return pd.DataFrame({
+        'percentual': pesos / pesos.sum() * 100,
+        'ic_inf': limites[0] * 100,
+        'ic_sup': limites[1] * 100,
+    }, index=pd.Index(rotulos, name=dimensao))
+
+
+# ==================== CONSULTAS ====================
+def total(cubo, filtro=None):
+    """Número de pessoas (opcionalmente só nas células do filtro)"""
+    dados = cubo if filtro is None else cubo[filtro]
+    return int(dados['contagem'].sum())
+
+
+def contar(cubo, dimensoes, filtro=None):
+    """Contagens agrupadas por dimensão; nulos ficam de fora, como no value_counts"""
+    dados = cubo if filtro is None else cubo[filtro]
+    if not isinstance(dimensoes, str):
+        return dados.groupby(dimensoes, observed=True)['contagem'].sum()
+    # Uma dimensão: factorize + bincount, ponderado pela contagem (ou pelo peso)
+    codigos, rotulos = pd.factorize(dados[dimensoes], sort=True)
+    validos = codigos >= 0
+    contagem = dados['contagem'].to_numpy()
+    somas = np.bincount(codigos[validos], weights=contagem[validos], minlength=len(rotulos))
+    if np.issubdtype(contagem.dtype, np.integer):
+        somas = somas.astype(np.int64)
+    # Rótulos como índice simples, mesmo para dimensões categóricas (na ordem das categorias)
+    return pd.Series(somas, index=pd.Index(np.asarray(rotulos), name=dimensoes), name='contagem')
+
+
+def proporcao(cubo, filtro, base=None):
+    """Fração das pessoas da base (todas, por padrão) que atendem ao filtro"""
+    return total(cubo, filtro if base is None else filtro & base) / total(cubo, base)
+
+
+def media(cubo, valores, filtro=None):
+    """Média ponderada pela contagem de ``valores`` (array alinhado às células)"""
+    pesos = cubo['contagem'].to_numpy()
+    valores = np.asarray(valores, dtype=float)
+    if filtro is not None:
+        filtro = np.asarray(filtro)
+        pesos, valores = pesos[filtro], valores[filtro]
+    return float(np.average(valores, weights=pesos))
+
+
+def valor_maximo(cubo, valores):
+    """Maior valor entre as células com alguma pessoa"""
+    return np.asarray(valores)[cubo['contagem'].to_numpy() > 0].max()
+
+
+def num_modais(cubo):
+    """Nº de modais de cada célula: maior valor entre trabalho e aula (como em prepare_data)"""
+    return np.maximum(
+        num_modais_por_tipo(cubo['tipo_trajeto_trabalho']),
+        num_modais_por_tipo(cubo['tipo_trajeto_aula']),
+    )
@@ -1,18 +1,29 @@
-﻿import streamlit as st
+﻿import os
+import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
-from collections import Counter
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression, LogisticRegression
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import (accuracy_score, precision_score, recall_score, f1_score,
-                            confusion_matrix, roc_curve, auc, mean_squared_error, r2_score,
-                            precision_recall_curve, average_precision_score)
+from dados import localizar_csv, versao_dataset
+from mapeamentos import APP_TAXI_MAP, FAIXA_ETARIA_MAP, MODAL_MAP, RENDA_MAP, SEXO_MAP, TERMINAL_MAP
+from modais import contar_combinacoes, crosstab_modais, nomes_combinacoes, top_combinacoes_por_grupo
+from agregacao import (contar, intervalo_bootstrap, media, num_modais, ponderado, proporcao, total,
+                       valor_maximo)
+from modelos import (CONFIG_INCREMENTAL, CONFIG_MODELOS, FEATURES, METRICAS_CV, N_JOBS_PADRAO, PARAMS_BUSCA,
+                     TAMANHO_BLOCO_TREINO, ajustar_regressao_renda, caminho_registro, carregar_ou_buscar,
+                     carregar_ou_treinar, carregar_ou_treinar_incremental, carregar_ou_validar, chave_busca,
+                     chave_registro, config_ajustada)
+from graficos import renderizar
+from artefatos import MODO_PRECOMPUTADO, calcular_artefato, calcular_recorte, carregar_artefatos, carregar_registros
+from atualizacao import RepositorioDados
+from compartilhado import MODO_COMPARTILHADO, abrir_ou_publicar
+from filtros import IndiceFiltros, normalizar_filtro
+from fluxos import CONTEXTOS_OD, MatrizOD
+from mapas import INDICADORES, NIVEIS_DETALHE, CamadaBairros, calcular_indicador, localizar_geojson
+from terminais import IndiceTerminais, nome_terminal
+from previsao import RENDA_MAX, RENDA_MIN, Preditor, curva_renda
+from instrumentacao import (definir_pagina, etapa, iniciar_execucao, iniciar_servidor_metricas, instrumentar,
+                            medir_memoria, metricas_prometheus, registros_execucao)
 
 # ==================== CONFIGURAÇÃO DA PÁGINA ====================
 st.set_page_config(
@@ -34,156 +45,123 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# ==================== DICIONÁRIOS DE MAPEAMENTO ====================
-SEXO_MAP = {1: 'Masculino', 2: 'Feminino'}
+# ==================== FUNÇÕES DE CARREGAMENTO E PREPARAÇÃO ====================
+@st.cache_resource(max_entries=1)
+def load_repository(caminho):
+    """Snapshots do dataset preparado e dos agregados, atualizados pela diferença quando o arquivo muda.
 
-FAIXA_ETARIA_MAP = {
-    1: 'Até 6 anos', 2: '6 a 15 anos', 3: '16 a 24 anos',
-    4: '25 a 39 anos', 5: '40 a 59 anos', 6: 'Acima de 60 anos'
-}
+    Criado uma vez por arquivo: nada do dataframe é hasheado a cada rerun.
+    Os snapshots são compartilhados entre sessões e por isso são somente leitura.
+    """
+    return RepositorioDados(caminho)
 
-RENDA_MAP = {
-    1: 'Até 1 SM', 2: '1 a 2 SM', 3: '2 a 3 SM', 4: '3 a 5 SM',
-    5: '5 a 10 SM', 6: '10 a 20 SM', 7: '+ 20 SM',
-    8: 'Sem rendimento', 9: 'Sem declaração'
-}
+@st.cache_resource(max_entries=10)
+def load_artifact(nome, caminho, identidade, _df):
+    """Artefato de uma página calculado a partir do dataframe preparado (uma vez por versão)"""
+    return calcular_artefato(nome, _df)
 
-MODAL_MAP = {
-    0: "Não declarado", 1: "A pé", 2: "Bicicleta", 3: "Ônibus", 4: "Metrô",
-    5: "Carro (dirigindo)", 6: "Carona familiar", 7: "Carona amigo/colega",
-    8: "Carro com motorista", 9: "Motocicleta", 10: "Transporte escolar",
-    11: "Táxi", 12: "Fretado"
-}
+@st.cache_resource(max_entries=1)
+def load_shared(caminho, identidade):
+    """Dataset preparado e agregados mapeados em memória, compartilhados entre processos (modo compartilhado)"""
+    return abrir_ou_publicar(caminho, identidade)
 
-APP_TAXI_MAP = {0: "Não declarado", 1: "Nunca", 2: "Às vezes", 3: "Sempre"}
+@st.cache_resource
+def load_precomputed():
+    """Artefatos gerados pelo precompute.py (modo precomputado, sem o dataset)"""
+    return carregar_artefatos()
 
-TERMINAL_MAP = {
-    0: "Não declarado", 1: "TI Aeroporto", 2: "TI Afogados", 3: "TI Barro", 4: "TI Cabo",
-    5: "TI Cajueiro Seco", 6: "TI Camaragibe", 7: "TI Cavaleiro", 8: "TI Caxangá",
-    9: "TI Igarassu", 10: "TI Jaboatão", 11: "TI Joana Bezerra", 12: "TI Macaxeira",
-    13: "TI PE-15", 14: "TI Pelópidas Silveira", 15: "TI Recife", 16: "TI Tancredo Neves",
-    17: "TI TIP", 18: "TI Xambá", 19: "TI Rio Doce"
-}
+@st.cache_resource(max_entries=10, show_spinner=False)
+def load_weighted(nome, versao, _tabela):
+    """Visão ponderada de um agregado (soma dos fatores de expansão no lugar da contagem)"""
+    return ponderado(_tabela)
 
-NIVEL_ESTUDO_MAP = {
-    0: "Não declarado", 1: "Fundamental", 2: "Médio", 
-    3: "Graduação", 4: "Pós-Graduação"
-}
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_records(versao):
+    """Registros do build dos artefatos carregados (modo precomputado, lidos só quando o filtro é usado)"""
+    return carregar_registros(build=versao[1])
 
-# ==================== FUNÇÕES DE CARREGAMENTO E PREPARAÇÃO ====================
-@st.cache_data
-def load_data():
-    """Carrega o dataset com cache"""
-    import os
-    
-    # Lista de caminhos possíveis para tentar
-    possible_paths = [
-        '../dados/dataset2.csv',  # Caminho relativo local
-        'dados/dataset2.csv',     # Caminho relativo do Streamlit Cloud
-        '/app/dados/dataset2.csv', # Caminho do Docker
-        os.path.join(os.path.dirname(__file__), '../dados/dataset2.csv')  # Caminho absoluto relativo
-    ]
-    
-    for path in possible_paths:
-        try:
-            if os.path.exists(path):
-                df = pd.read_csv(path, low_memory=False)
-                return df
-        except (FileNotFoundError, PermissionError):
-            continue
-    
-    # Se nenhum caminho funcionou, levanta erro
-    raise FileNotFoundError(
-        f"Arquivo dataset2.csv não encontrado. Tentou os seguintes caminhos: {possible_paths}"
-    )
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_record_index(versao, _registros):
+    """Índice bitmap do filtro global sobre os registros (um por versão dos dados)"""
+    return IndiceFiltros.de_registros(_registros)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def load_filtered(nome, versao, filtros, _registros):
+    """Agregado de uma página recalculado com os registros do recorte (um por versão e filtros normalizados)"""
+    return calcular_recorte(nome, _registros, load_record_index(versao, _registros), *map(dict, filtros))
+
+@st.cache_resource(show_spinner=False)
+def load_classification_results(chave, _X, _y, _n_jobs=N_JOBS_PADRAO):
+    """Modelos de classificação treinados (registro em disco, indexado pela chave)"""
+    return carregar_ou_treinar(_X, _y, chave, n_jobs=_n_jobs)
+
+@st.cache_resource(show_spinner=False)
+def load_incremental_results(chave, _X, _y):
+    """Modelos treinados bloco a bloco (registro em disco, indexado pela chave)"""
+    return carregar_ou_treinar_incremental(_X, _y, chave)
 
-def clean_modal(value):
-    """Limpa valores de modais e corrige erros (ex: 2005 → 5)"""
-    if pd.isna(value):
-        return []
-    raw = str(value).replace(" ", "").split(",")
-    cleaned = []
-    for v in raw:
-        if v.isdigit():
-            num = int(v)
-            if num > 12:
-                num = int(str(num)[-1])
-            if 0 <= num <= 12:
-                cleaned.append(num)
-    return cleaned
+@st.cache_resource(show_spinner=False)
+def load_tuned_results(chave, _X, _y, _n_jobs=N_JOBS_PADRAO):
+    """Modelos com os hiperparâmetros da busca (registro em disco: a busca só roda se a chave não existir)"""
+    return carregar_ou_buscar(_X, _y, chave, n_jobs=_n_jobs)
 
-def classifica_modo(valor):
-    """Classifica trajeto em monomodal/multimodal/sem_resposta"""
-    if pd.isna(valor):
-        return "sem_resposta"
-    valor = str(valor).strip()
-    if valor == "0" or valor == "":
-        return "sem_resposta"
-    if "," in valor:
-        return "multimodal"
-    return "monomodal"
+@st.cache_resource(show_spinner=False)
+def load_cross_validation(chave, k, _X, _y, _n_jobs=N_JOBS_PADRAO, _config=CONFIG_MODELOS):
+    """Validação cruzada k-fold dos modelos (registro em disco, indexado pela chave e k)"""
+    return carregar_ou_validar(_X, _y, k, chave, _config, _n_jobs)
 
-def contar_modais(col):
-    """Conta distribuição de modais em uma coluna"""
-    lista = []
-    for linha in col.dropna():
-        linha = str(linha).strip()
-        if linha == "" or linha == "0":
-            continue
-        for m in linha.split(","):
-            try:
-                codigo = int(m.strip())
-                lista.append(MODAL_MAP.get(codigo, "Outro"))
-            except ValueError:
-                continue
-    if not lista:
-        return pd.Series(dtype=int)
-    return pd.Series(lista).value_counts().sort_values(ascending=False)
+@st.cache_resource(max_entries=32, show_spinner=False)
+def load_od_matrix(chave, contexto, modal, _fluxos):
+    """Matriz O-D esparsa de um contexto/modal (uma por versão, filtro global e ponderação em ``chave``)"""
+    return MatrizOD.de_fluxos(_fluxos, contexto)
 
-@st.cache_data
-def prepare_data(df):
-    """Prepara e enriquece o dataframe com variáveis derivadas"""
-    # Flags trabalho e estudo
-    df['trabalha_flag'] = df['trabalha'] == 1
-    df['estuda_flag'] = df['pesquisado_estuda'] == 1
-    
-    # Classificação de trajetos
-    df['tipo_trajeto_trabalho'] = df['meio_transporte_trab'].map(classifica_modo)
-    df['tipo_trajeto_aula'] = df['transporte_aula'].map(classifica_modo)
-    df['tipo_trajeto_filhos'] = df['meios_transporte_filhos'].map(classifica_modo)
-    
-    # Uso de terminais e integração
-    df['usa_terminal_trabalho'] = df['terminal_int_trabalho'].astype(str).str.strip() != '0'
-    df['usa_integracao_aula'] = df['utiliza_integracao_aula'] == 1
-    
-    # Número de modais
-    def to_num_modais(tipo):
-        if tipo == 'multimodal':
-            return 2
-        if tipo == 'monomodal':
-            return 1
-        return 0
-    
-    df['num_modais_trabalho'] = df['tipo_trajeto_trabalho'].map(to_num_modais)
-    df['num_modais_aula'] = df['tipo_trajeto_aula'].map(to_num_modais)
-    df['num_modais'] = df[['num_modais_trabalho', 'num_modais_aula']].max(axis=1)
-    
-    # Variável binária de integração
-    df['usa_integracao'] = ((df['usa_terminal_trabalho']) | (df['usa_integracao_aula'])).astype(int)
-    
-    # Listas de modais
-    df['modal_trabalho_list'] = df['meio_transporte_trab'].apply(clean_modal)
-    df['modal_aula_list'] = df['transporte_aula'].apply(clean_modal)
-    df['modal_filhos_list'] = df['meios_transporte_filhos'].apply(clean_modal)
-    
-    # Mapeamentos descritivos
-    df['sexo_desc'] = df['sexo'].map(SEXO_MAP)
-    df['faixa_etaria_desc'] = df['faixa_etaria'].map(FAIXA_ETARIA_MAP)
-    df['renda_desc'] = df['renda'].map(RENDA_MAP)
-    
-    return df
+@st.cache_resource(max_entries=32, show_spinner=False)
+def load_terminal_index(chave, contexto, _terminais):
+    """Índice inteiro dos terminais de um contexto (um por versão, filtro global e ponderação em ``chave``)"""
+    return IndiceTerminais(_terminais, contexto)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_predictor(chave, _registro):
+    """Classificadores de um registro prontos para prever lotes (um por versão e fonte dos modelos)"""
+    return Preditor(_registro)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_map_layer(caminho, mtime):
+    """Polígonos dos bairros; as geometrias simplificadas de cada nível ficam guardadas na camada"""
+    return CamadaBairros(caminho)
+
+def contagem_rotulada(cubo, dimensao, mapa, filtro=None):
+    """Contagens de uma dimensão codificada, com os rótulos do mapa (códigos fora do mapa são descartados)"""
+    contagens = contar(cubo, dimensao, filtro)
+    contagens = contagens[contagens.index.isin(list(mapa))]
+    contagens.index = contagens.index.map(mapa)
+    return contagens
+
+def adicionar_intervalos(tabela, cubo, dimensao, filtro=None):
+    """Colunas do IC de 95% (bootstrap) do percentual, para uma tabela indexada pelos códigos da dimensão"""
+    with etapa('bootstrap'):
+        ic = intervalo_bootstrap(cubo, dimensao, filtro, n_jobs=N_JOBS_PADRAO)
+    return tabela.assign(**{
+        'IC 95% inf. (%)': ic['ic_inf'].reindex(tabela.index).round(2).to_numpy(),
+        'IC 95% sup. (%)': ic['ic_sup'].reindex(tabela.index).round(2).to_numpy(),
+    })
 
 # ==================== FUNÇÕES DE VISUALIZAÇÃO ====================
+def mostrar_plotly(fig, **kwargs):
+    """st.plotly_chart medido (serialização do Plotly é uma etapa própria)"""
+    with etapa('st.plotly_chart'):
+        st.plotly_chart(fig, **kwargs)
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def render_chart(nome, *args, **kwargs):
+    """PNG de um gráfico matplotlib, em cache pelos agregados de entrada"""
+    return renderizar(nome, *args, **kwargs)
+
+def mostrar_grafico(nome, *args, **kwargs):
+    """Exibe um gráfico estático pré-renderizado (renderização medida como etapa própria)"""
+    with etapa(f'grafico:{nome}'):
+        st.image(render_chart(nome, *args, **kwargs), use_container_width=True)
+
 def plot_modal_share_pie(series, titulo):
     """Gráfico de pizza para distribuição de modais"""
     if series.empty:
@@ -197,10 +175,13 @@ def plot_modal_share_pie(series, titulo):
         hole=0.4
     )
     fig.update_traces(textposition='inside', textinfo='percent+label')
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
 
 # ==================== MAIN ====================
 def main():
+    iniciar_execucao()
+    iniciar_servidor_metricas()
+    
     st.markdown('<h1 class="main-header">🚌 Dashboard de Mobilidade Urbana - RMR</h1>', 
                 unsafe_allow_html=True)
     
@@ -211,10 +192,49 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Carregar e preparar dados
-    with st.spinner("Carregando dataset..."):
-        df = load_data()
-        df = prepare_data(df)
+    # Carregar e preparar dados (ou apenas os artefatos, no modo precomputado)
+    with st.spinner("Carregando dataset..."), etapa('carregar_dados'):
+        if MODO_PRECOMPUTADO:
+            artefatos = load_precomputed()
+            versao = ('precomputado', artefatos['manifesto']['build'])
+            n_registros = artefatos['manifesto']['n_linhas']
+            n_variaveis = artefatos['manifesto']['n_colunas']
+        elif MODO_COMPARTILHADO:
+            versao = versao_dataset()
+            artefatos = load_shared(*versao)
+            df = artefatos['dados']
+            n_registros, n_variaveis = len(df), len(df.columns)
+        else:
+            repositorio = load_repository(localizar_csv())
+            # Snapshot fixo durante toda a execução, mesmo que uma atualização termine no meio dela
+            snapshot = repositorio.atual()
+            versao = snapshot.versao
+            df = snapshot.dados
+            n_registros, n_variaveis = len(df), len(df.columns)
+            artefatos = {}
+    
+    def registros():
+        """Registros da versão atual (no modo precomputado, lidos na primeira vez que o filtro é usado)"""
+        return load_records(versao) if MODO_PRECOMPUTADO else df
+    
+    def agregado(nome):
+        """Agregado de uma página na versão atual, sem recorte"""
+        with etapa(f'artefato:{nome}'):
+            return artefatos[nome] if nome in artefatos else snapshot.agregado(nome)
+    
+    def artefato(nome, recorte=None):
+        """Agregado de uma página no filtro global e no ``recorte`` da página, na visão ponderada se ligada"""
+        filtros = tuple(f for f in (normalizar_filtro(filtro), normalizar_filtro(recorte or {})) if f)
+        if filtros:
+            with etapa(f'filtro:{nome}'):
+                tabela = load_filtered(nome, versao, filtros, registros())
+        else:
+            tabela = agregado(nome)
+        return load_weighted(nome, (versao, filtros), tabela) if ponderar else tabela
+    
+    def fluxos_od(contexto, modal):
+        """Fluxos O-D; com um modal, só os de quem o declarou no contexto (índice dos modais dos registros)"""
+        return artefato('fluxos', None if modal is None else {CONTEXTOS_OD[contexto][3]: [modal]})
     
     # Sidebar - Navegação
     st.sidebar.title("📊 Navegação")
@@ -228,55 +248,163 @@ def main():
             "🚇 Tipo de Trajeto",
             "🚌 Modal Share",
             "🗺️ Análise por Localização",
+            "🧭 Fluxos Origem-Destino",
             "🔄 Integração Multimodal",
             "👤 Perfil Usuários Integração",
+            "🚏 Terminais de Integração",
             "👴🏼 Perfil Demográfico",
             "📉 Modelos de Regressão",
             "〽️ Modelos de Classificação",
+            "🔮 Simulador",
             "📝 Conclusões"
         ]
     )
     
     st.sidebar.markdown("---")
-    st.sidebar.metric("Total de Registros", f"{len(df):,}")
-    st.sidebar.metric("Número de Variáveis", len(df.columns))
+    st.sidebar.metric("Total de Registros", f"{n_registros:,}")
+    st.sidebar.metric("Número de Variáveis", n_variaveis)
+    if not (MODO_PRECOMPUTADO or MODO_COMPARTILHADO):
+        if repositorio.atualizando:
+            st.sidebar.caption("🔄 Arquivo de dados alterado: atualizando em segundo plano...")
+        elif repositorio.ultimo_erro is not None:
+            st.sidebar.warning(f"⚠️ Falha ao atualizar os dados: {repositorio.ultimo_erro}")
+    
+    # Filtro global: vale para todas as páginas (exceto classificação)
+    localizacao = agregado('cubo_localizacao')
+    filtro = sidebar_global_filter(localizacao)
+    filtro_ativo = bool(normalizar_filtro(filtro))
+    
+    # Estimativas ponderadas, quando o dataset traz o fator de expansão
+    ponderar = 'peso' in localizacao.columns and st.sidebar.toggle(
+        "⚖️ Ponderar pelo fator de expansão", value=True,
+        help="Contagens e percentuais como estimativas da população (exceto classificação)"
+    )
+    
+    perfil = artefato('cubo_perfil')
+    if filtro_ativo:
+        st.sidebar.metric("Registros no Filtro", f"{int(perfil['registros' if ponderar else 'contagem'].sum()):,}")
+    if ponderar:
+        st.sidebar.metric("População Estimada", f"{total(perfil):,}")
+    
+    definir_pagina(page)
+    
+    if filtro_ativo and total(perfil) == 0:
+        st.warning("⚠️ Nenhum registro atende ao filtro global selecionado.")
+        page = None
+    elif filtro_ativo and page == "〽️ Modelos de Classificação":
+        st.info("ℹ️ Os modelos de classificação usam a população completa; o filtro global não se aplica a "
+                "esta página.")
     
     # Roteamento
-    if page == "🏠 Visão Geral":
-        show_overview(df)
+    if page is None:
+        pass
+    elif page == "🏠 Visão Geral":
+        show_overview(perfil)
     elif page == "📊 Estatísticas Descritivas":
-        show_descriptive_stats(df)
+        show_descriptive_stats(perfil, artefato("cubo_localizacao"))
     elif page == "🚇 Tipo de Trajeto":
-        show_trajectory_types(df)
+        show_trajectory_types(perfil)
     elif page == "🚌 Modal Share":
-        show_modal_share(df)
+        show_modal_share(artefato("modal_share"))
     elif page == "🗺️ Análise por Localização":
-        show_location_analysis(df)
+        show_location_analysis(artefato("cubo_localizacao"))
+    elif page == "🧭 Fluxos Origem-Destino":
+        show_od_flows(fluxos_od, (versao, normalizar_filtro(filtro), ponderar))
     elif page == "🔄 Integração Multimodal":
-        show_multimodal_integration(df)
+        show_multimodal_integration(lambda recorte: artefato("combinacoes", recorte))
     elif page == "👤 Perfil Usuários Integração":
-        show_integration_user_profile(df)
+        show_integration_user_profile(perfil)
+    elif page == "🚏 Terminais de Integração":
+        show_terminals(artefato("terminais"), (versao, normalizar_filtro(filtro), ponderar))
     elif page == "👴🏼 Perfil Demográfico":
-        show_demographic_profile(df)
+        show_demographic_profile(artefato("cubo_modais"))
     elif page == "📉 Modelos de Regressão":
-        show_regression_models(df)
+        show_regression_models(artefato("pontos_regressao"))
     elif page == "〽️ Modelos de Classificação":
-        show_classification_models(df)
+        with etapa('artefato:classificacao'):
+            classificacao = artefatos['classificacao'] if MODO_PRECOMPUTADO else load_artifact(
+                'classificacao', *versao, df)
+        show_classification_models(classificacao)
+    elif page == "🔮 Simulador":
+        with etapa('artefato:classificacao'):
+            classificacao = artefatos['classificacao'] if MODO_PRECOMPUTADO else load_artifact(
+                'classificacao', *versao, df)
+        zonas = contar(artefato("cubo_localizacao"), ['cidade_residencia', 'bairro_residencia'])
+        show_simulator(classificacao, artefato("perfis"), zonas,
+                       lambda cidade, bairro: artefato("perfis", {'cidade_residencia': [cidade],
+                                                                  'bairro_residencia': [bairro]}),
+                       versao)
     else:
-        show_conclusions(df)
+        show_conclusions()
+    
+    if os.environ.get('DASHBOARD_DEBUG') == '1' or st.query_params.get('debug') == '1':
+        show_debug_panel()
+
+def sidebar_global_filter(cubo):
+    """Filtro global da sidebar: {dimensão: valores escolhidos}, vazio quando nada é escolhido"""
+    rotulos_contexto = {'trabalho': 'Trabalho', 'aula': 'Aula', 'filhos': 'Filhos'}
+    with st.sidebar.expander("🔎 Filtro global"):
+        cidades = st.multiselect("Município", sorted(cubo['cidade_residencia'].dropna().unique()),
+                                 placeholder="Todos")
+        # Bairros oferecidos: só os dos municípios escolhidos
+        if cidades:
+            opcoes_bairros = cubo.loc[cubo['cidade_residencia'].isin(cidades), 'bairro_residencia']
+        else:
+            opcoes_bairros = cubo['bairro_residencia']
+        bairros = st.multiselect("Bairro", sorted(opcoes_bairros.dropna().unique()), placeholder="Todos")
+        sexos = st.multiselect("Sexo", list(SEXO_MAP), format_func=SEXO_MAP.get, placeholder="Todos")
+        idades = st.multiselect("Faixa etária", list(FAIXA_ETARIA_MAP), format_func=FAIXA_ETARIA_MAP.get,
+                                placeholder="Todas")
+        rendas = st.multiselect("Renda", list(RENDA_MAP), format_func=RENDA_MAP.get, placeholder="Todas")
+        contextos = st.multiselect("Contexto da viagem", list(rotulos_contexto), format_func=rotulos_contexto.get,
+                                   placeholder="Todos",
+                                   help="Pessoas com trajeto declarado em algum dos contextos escolhidos")
+    return {
+        'cidade_residencia': cidades,
+        'bairro_residencia': bairros,
+        'sexo': sexos,
+        'faixa_etaria': idades,
+        'renda': rendas,
+        'contexto': contextos,
+    }
+
+def show_debug_panel():
+    """Painel de desempenho do rerun atual (tempo de parede, CPU e pico de memória por etapa)"""
+    with st.sidebar.expander("🛠️ Desempenho (debug)", expanded=True):
+        memoria = st.checkbox("Medir memória (tracemalloc)", value=medir_memoria(),
+                              help="Vale a partir do próximo rerun e para todas as sessões; deixa o app mais lento")
+        medir_memoria(memoria)
+        
+        registros = pd.DataFrame(registros_execucao())
+        if registros.empty:
+            st.caption("Nenhuma etapa medida neste rerun.")
+            return
+        tabela = registros.groupby('etapa', sort=False).agg(
+            chamadas=('wall_s', 'size'), wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum'),
+            pico_bytes=('pico_bytes', 'max')
+        )
+        st.dataframe(pd.DataFrame({
+            'Chamadas': tabela['chamadas'],
+            'Wall (ms)': (tabela['wall_s'] * 1000).round(1),
+            'CPU (ms)': (tabela['cpu_s'] * 1000).round(1),
+            'Pico (MB)': (tabela['pico_bytes'].astype(float) / 2**20).round(2),
+        }), use_container_width=True)
+        st.download_button("Métricas acumuladas (Prometheus)", metricas_prometheus(),
+                           file_name="metrics.txt", mime="text/plain")
 
 # ==================== PÁGINAS ====================
-def show_overview(df):
+@instrumentar
+def show_overview(cubo):
     st.markdown('<h2 class="sub-header">🏠 Visão Geral dos Dados</h2>', unsafe_allow_html=True)
     
     # KPIs principais
     col1, col2, col3, col4 = st.columns(4)
     
-    pct_trabalham = float(df["trabalha_flag"].mean())
-    pct_estudam = float(df["estuda_flag"].mean())
-    multimodal = ((df['tipo_trajeto_trabalho'] == 'multimodal') | 
-                  (df['tipo_trajeto_aula'] == 'multimodal')).sum()
-    avg_modais = df['num_modais'].mean()
+    pct_trabalham = proporcao(cubo, cubo["trabalha_flag"])
+    pct_estudam = proporcao(cubo, cubo["estuda_flag"])
+    multimodal = total(cubo, (cubo['tipo_trajeto_trabalho'] == 'multimodal') | 
+                             (cubo['tipo_trajeto_aula'] == 'multimodal'))
+    avg_modais = media(cubo, num_modais(cubo))
     
     with col1:
         st.metric("👥 Trabalham", f"{pct_trabalham*100:.1f}%")
@@ -294,41 +422,48 @@ def show_overview(df):
     
     with col1:
         st.markdown("### 🎯 Distribuição por Sexo")
-        sexo_dist = df['sexo_desc'].value_counts()
+        sexo_dist = contagem_rotulada(cubo, 'sexo', SEXO_MAP).sort_values(ascending=False)
         fig = px.pie(values=sexo_dist.values, names=sexo_dist.index, hole=0.4)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig, use_container_width=True)
     
     with col2:
         st.markdown("### 📅 Distribuição por Faixa Etária")
-        idade_dist = df['faixa_etaria_desc'].value_counts().sort_index()
+        idade_dist = contagem_rotulada(cubo, 'faixa_etaria', FAIXA_ETARIA_MAP).sort_index()
         fig = px.bar(x=idade_dist.index, y=idade_dist.values)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig, use_container_width=True)
 
-def show_descriptive_stats(df):
+@instrumentar
+def show_descriptive_stats(cubo, localizacao):
     st.markdown('<h2 class="sub-header">📊 Estatísticas Descritivas</h2>', unsafe_allow_html=True)
     st.markdown("""
     <div class="insight-box">
     <b>📌 Nota:</b> Esta é uma análise geral de todos os respondentes da Pesquisa Origem-Destino 2016 da RMR.
     </div>
     """, unsafe_allow_html=True)
+    mostrar_ic = st.checkbox("Intervalos de confiança de 95% (bootstrap)", key='ic_descritivas')
+    
     # Estatísticas de Sexo
     st.markdown("### 1️⃣ Sexo")
-    sexo_counts = df['sexo'].value_counts()
-    sexo_pct = df['sexo'].value_counts(normalize=True) * 100
-    sexo_df = pd.DataFrame({'Quantidade': sexo_counts, 'Percentual (%)': sexo_pct.round(2)})
+    sexo_counts = contar(cubo, 'sexo').sort_values(ascending=False)
+    sexo_pct = sexo_counts / sexo_counts.sum() * 100
+    sexo_df = pd.DataFrame({'Quantidade': sexo_counts.round(), 'Percentual (%)': sexo_pct.round(2)})
+    if mostrar_ic:
+        sexo_df = adicionar_intervalos(sexo_df, cubo, 'sexo')
     sexo_df.index = sexo_df.index.map(SEXO_MAP)
     st.dataframe(sexo_df)
     
     fig = px.bar(x=sexo_df.index, y=sexo_df['Quantidade'], 
                  labels={'x': 'Sexo', 'y': 'Quantidade'},
                  title='Distribuição por Sexo')
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
     
     # Faixa Etária
     st.markdown("### 2️⃣ Faixa Etária")
-    idade_counts = df['faixa_etaria'].value_counts().sort_index()
-    idade_pct = df['faixa_etaria'].value_counts(normalize=True).sort_index() * 100
-    idade_df = pd.DataFrame({'Quantidade': idade_counts, 'Percentual (%)': idade_pct.round(2)})
+    idade_counts = contar(cubo, 'faixa_etaria')
+    idade_pct = idade_counts / idade_counts.sum() * 100
+    idade_df = pd.DataFrame({'Quantidade': idade_counts.round(), 'Percentual (%)': idade_pct.round(2)})
+    if mostrar_ic:
+        idade_df = adicionar_intervalos(idade_df, cubo, 'faixa_etaria')
     idade_df.index = idade_df.index.map(FAIXA_ETARIA_MAP)
     st.dataframe(idade_df)
     
@@ -336,13 +471,15 @@ def show_descriptive_stats(df):
                  labels={'x': 'Faixa Etária', 'y': 'Quantidade'},
                  title='Distribuição por Faixa Etária')
     fig.update_layout(xaxis_tickangle=45)
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
     
     # Renda
     st.markdown("### 3️⃣ Renda (Salário Mínimo)")
-    renda_counts = df['renda'].value_counts().sort_index()
-    renda_pct = df['renda'].value_counts(normalize=True).sort_index() * 100
-    renda_df = pd.DataFrame({'Quantidade': renda_counts, 'Percentual (%)': renda_pct.round(2)})
+    renda_counts = contar(cubo, 'renda')
+    renda_pct = renda_counts / renda_counts.sum() * 100
+    renda_df = pd.DataFrame({'Quantidade': renda_counts.round(), 'Percentual (%)': renda_pct.round(2)})
+    if mostrar_ic:
+        renda_df = adicionar_intervalos(renda_df, cubo, 'renda')
     renda_df.index = renda_df.index.map(RENDA_MAP)
     st.dataframe(renda_df)
     
@@ -350,34 +487,36 @@ def show_descriptive_stats(df):
                  labels={'x': 'Faixa de Renda', 'y': 'Quantidade'},
                  title='Distribuição por Renda')
     fig.update_layout(xaxis_tickangle=45)
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
     
     # Top 10 Bairros
     st.markdown("### 4️⃣ Bairros (Top 10)")
     
-    top_bairros = df['bairro_residencia'].value_counts().head(10)
-    top_bairros_pct = df['bairro_residencia'].value_counts(normalize=True).head(10) * 100
+    bairros_counts = contar(localizacao, 'bairro_residencia').sort_values(ascending=False)
+    top_bairros = bairros_counts.head(10)
+    top_bairros_pct = top_bairros / bairros_counts.sum() * 100
     bairros_df = pd.DataFrame({'Qtd': top_bairros, '%': top_bairros_pct.round(2)})
     
     # Inverter a ordem para mostrar do mais frequente (topo) para o menos frequente (embaixo)
     fig = px.bar(x=top_bairros.values[::-1], y=top_bairros.index[::-1], orientation='h',
                  labels={'x': 'Número de respondentes', 'y': 'Bairro'},
                  title='Top 10 bairros de residência (do mais para o menos frequente)')
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
     st.dataframe(bairros_df)
 
-def show_trajectory_types(df):
+@instrumentar
+def show_trajectory_types(cubo):
     st.markdown('<h2 class="sub-header">🚇 Tipo de Trajeto (Monomodal vs Multimodal)</h2>', 
                 unsafe_allow_html=True)
     
     # Métricas sobre multimodalidade
-    total_multimodal = ((df['tipo_trajeto_trabalho'] == 'multimodal') | 
-                        (df['tipo_trajeto_aula'] == 'multimodal')).sum()
-    pct_multimodal = ((df['tipo_trajeto_trabalho'] == 'multimodal') | 
-                      (df['tipo_trajeto_aula'] == 'multimodal')).mean()
-    total_monomodal = ((df['tipo_trajeto_trabalho'] == 'monomodal') | 
-                       (df['tipo_trajeto_aula'] == 'monomodal')).sum()
-    max_modais = int(df['num_modais'].max())
+    multimodais = ((cubo['tipo_trajeto_trabalho'] == 'multimodal') | 
+                   (cubo['tipo_trajeto_aula'] == 'multimodal'))
+    total_multimodal = total(cubo, multimodais)
+    pct_multimodal = proporcao(cubo, multimodais)
+    total_monomodal = total(cubo, (cubo['tipo_trajeto_trabalho'] == 'monomodal') | 
+                                  (cubo['tipo_trajeto_aula'] == 'monomodal'))
+    max_modais = int(valor_maximo(cubo, num_modais(cubo)))
     
     c1, c2, c3, c4 = st.columns(4)
     with c1:
@@ -392,39 +531,45 @@ def show_trajectory_types(df):
     st.markdown("---")
     
     # Distribuições por contexto
-    def percent_series(series):
+    mostrar_ic = st.checkbox("Intervalos de confiança de 95% (bootstrap)", key='ic_trajetos')
+    
+    def percent_series(dimensao, filtro=None):
         ordem = ['monomodal', 'multimodal', 'sem_resposta']
-        s = series.value_counts(normalize=True).reindex(ordem).fillna(0) * 100
+        contagens = contar(cubo, dimensao, filtro)
+        s = (contagens / contagens.sum()).reindex(ordem).fillna(0) * 100
         return s.round(1)
     
+    def tabela_percentual(s, dimensao, filtro=None):
+        tabela = s.rename('Percentual (%)').to_frame()
+        return adicionar_intervalos(tabela, cubo, dimensao, filtro) if mostrar_ic else tabela
+    
     cols = st.columns(3)
     
     with cols[0]:
         st.markdown("#### Trabalho")
-        workers = df[df['trabalha_flag'] == True]
-        s = percent_series(workers['tipo_trajeto_trabalho'])
+        s = percent_series('tipo_trajeto_trabalho', cubo['trabalha_flag'])
         fig = px.bar(x=s.index, y=s.values, labels={'x': 'Tipo', 'y': '%'})
         fig.update_traces(text=[f"{v:.1f}%" for v in s.values], textposition='outside')
-        st.plotly_chart(fig, use_container_width=True)
-        st.dataframe(s.rename('Percentual (%)'))
+        mostrar_plotly(fig, use_container_width=True)
+        st.dataframe(tabela_percentual(s, 'tipo_trajeto_trabalho', cubo['trabalha_flag']))
     
     with cols[1]:
         st.markdown("#### Aula")
-        students = df[df['estuda_flag'] == True]
-        s = percent_series(students['tipo_trajeto_aula'])
+        s = percent_series('tipo_trajeto_aula', cubo['estuda_flag'])
         fig = px.bar(x=s.index, y=s.values, labels={'x': 'Tipo', 'y': '%'})
         fig.update_traces(text=[f"{v:.1f}%" for v in s.values], textposition='outside')
-        st.plotly_chart(fig, use_container_width=True)
-        st.dataframe(s.rename('Percentual (%)'))
+        mostrar_plotly(fig, use_container_width=True)
+        st.dataframe(tabela_percentual(s, 'tipo_trajeto_aula', cubo['estuda_flag']))
     
     with cols[2]:
         st.markdown("#### Filhos")
-        s = percent_series(df['tipo_trajeto_filhos'])
+        s = percent_series('tipo_trajeto_filhos')
         fig = px.bar(x=s.index, y=s.values, labels={'x': 'Tipo', 'y': '%'})
         fig.update_traces(text=[f"{v:.1f}%" for v in s.values], textposition='outside')
-        st.plotly_chart(fig, use_container_width=True)
-        st.dataframe(s.rename('Percentual (%)'))
+        mostrar_plotly(fig, use_container_width=True)
+        st.dataframe(tabela_percentual(s, 'tipo_trajeto_filhos'))
 
+@instrumentar
 def show_transport_apps(df):
     st.markdown('<h2 class="sub-header">🚕 Uso de Aplicativos de Transporte</h2>', 
                 unsafe_allow_html=True)
@@ -463,9 +608,10 @@ def show_transport_apps(df):
     
     fig = px.bar(df_plot, x="Categoria", y="Proporção", color="Resposta",
                  barmode='group', title="Intensidade de Uso dos Apps de Transporte")
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
 
-def show_modal_share(df):
+@instrumentar
+def show_modal_share(modal_share):
     st.markdown('<h2 class="sub-header">🚌 Modal Share</h2>', unsafe_allow_html=True)
     
     st.markdown("""
@@ -476,9 +622,16 @@ def show_modal_share(df):
     </div>
     """, unsafe_allow_html=True)
     
-    modal_trabalho = contar_modais(df['meio_transporte_trab'])
-    modal_aula = contar_modais(df['transporte_aula'])
-    modal_filhos = contar_modais(df['meios_transporte_filhos'])
+    # Soma dos recortes de cada contexto, da maior para a menor contagem. No modo compartilhado o modal
+    # é categórico: só os modais presentes entram, e um contexto vazio no recorte fica sem tabela (sem 0/0)
+    def contagens(contexto):
+        linhas = modal_share[modal_share['contexto'] == contexto]
+        somas = linhas.groupby('modal', sort=False, observed=True)['contagem'].sum()
+        return somas[somas > 0].sort_values(ascending=False, kind='stable')
+    
+    modal_trabalho = contagens('trabalho')
+    modal_aula = contagens('aula')
+    modal_filhos = contagens('filhos')
     
     cols = st.columns(3)
     
@@ -512,33 +665,32 @@ def show_modal_share(df):
                 st.write(f"• {modal}: {pct:.1f}% ({qtd} registros)")
             plot_modal_share_pie(top8, "Modal Share - Filhos")
 
-def show_location_analysis(df):
+@instrumentar
+def show_location_analysis(cubo):
     st.markdown('<h2 class="sub-header">🗺️ Análise por Localização</h2>', 
                 unsafe_allow_html=True)
     
-    st.markdown("### 🚇 Heatmap: Modal por Bairro (Trabalho)")
+    st.markdown("### 🗺️ Mapa por Bairro")
+    caminho_geojson = localizar_geojson()
+    if caminho_geojson is None:
+        st.info("ℹ️ Mapa indisponível: coloque os polígonos dos bairros em `dados/bairros.geojson` "
+                "(propriedades `cidade` e `bairro`) ou defina `DASHBOARD_BAIRROS_GEOJSON`.")
+    else:
+        with etapa('camada_bairros'):
+            camada = load_map_layer(caminho_geojson, os.stat(caminho_geojson).st_mtime_ns)
+        mostrar_mapa_bairros(cubo, camada)
     
-    # Preparar dados explodidos
-    df_exploded = df.copy()
-    df_exploded = df_exploded.explode("modal_trabalho_list")
-    df_exploded = df_exploded[df_exploded["modal_trabalho_list"].notna()]
-    df_exploded["modal_trabalho_list"] = df_exploded["modal_trabalho_list"].astype(int)
-    df_exploded["modal_nome"] = df_exploded["modal_trabalho_list"].map(MODAL_MAP)
+    st.markdown("### 🚇 Heatmap: Modal por Bairro (Trabalho)")
     
-    # Crosstab
-    tabela = pd.crosstab(df_exploded["bairro_residencia"], df_exploded["modal_nome"])
+    # Crosstab bairro x modal direto das bitmasks
+    with etapa('crosstab'):
+        tabela = crosstab_modais(cubo["bairro_residencia"], cubo["modal_trabalho_mask"], pesos=cubo["contagem"])
+    tabela = tabela.rename(columns=MODAL_MAP).sort_index(axis=1)
     top_bairros = tabela.sum(axis=1).sort_values(ascending=False).head(20).index
     tabela_top = tabela.loc[top_bairros]
     
     # Plotar heatmap
-    fig, ax = plt.subplots(figsize=(14, 8))
-    sns.heatmap(tabela_top, cmap='YlOrRd', annot=False, fmt='d', ax=ax)
-    plt.title("Heatmap – Modal por Bairro (Trabalho)")
-    plt.xlabel("Modal")
-    plt.ylabel("Bairro")
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    st.pyplot(fig)
+    mostrar_grafico('heatmap_modal_bairro', tabela_top)
     
     st.markdown("""
     <div class="insight-box">
@@ -547,7 +699,157 @@ def show_location_analysis(df):
     </div>
     """, unsafe_allow_html=True)
 
-def show_multimodal_integration(df):
+def mostrar_mapa_bairros(cubo, camada):
+    """Coroplético de um indicador por bairro; a figura leva só códigos e valores (geometria por URL)"""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        indicador = st.selectbox("Indicador", list(INDICADORES), format_func=lambda i: INDICADORES[i][0],
+                                 key='mapa_indicador')
+    with col2:
+        modal = st.selectbox("Modal", [m for m in MODAL_MAP if m > 0], index=2, format_func=MODAL_MAP.get,
+                             key='mapa_modal', disabled=indicador != 'modal_share')
+    with col3:
+        rotulos_detalhe = {'regiao': 'Região', 'municipio': 'Município', 'bairro': 'Bairro'}
+        nivel = st.select_slider("Detalhe das geometrias", list(NIVEIS_DETALHE), value='municipio',
+                                 format_func=rotulos_detalhe.get, key='mapa_detalhe')
+    
+    with etapa('indicador_bairros'):
+        valores, base = calcular_indicador(camada, cubo, indicador, modal)
+    zonas = np.flatnonzero(base > 0)
+    if not len(zonas):
+        st.info("📊 Nenhum bairro do recorte tem polígono no mapa.")
+        return
+    
+    # Com o static serving, o navegador baixa o GeoJSON uma vez e os redesenhos levam só as cores
+    url = camada.url(nivel) if st.get_option('server.enableStaticServing') else None
+    rotulos = camada.rotulos()
+    fig = go.Figure(go.Choroplethmap(
+        geojson=url or camada.geojson(nivel),
+        featureidkey='id',
+        locations=zonas,
+        z=valores[zonas],
+        text=[rotulos[i] for i in zonas],
+        customdata=base[zonas],
+        colorscale='YlOrRd',
+        marker_line_width=0.3,
+        colorbar_title='%',
+        hovertemplate="%{text}<br>%{z:.1f}%<br>Base: %{customdata:,.0f}<extra></extra>",
+    ))
+    zoom = {'regiao': 9, 'municipio': 10.5, 'bairro': 12}[nivel]
+    fig.update_layout(map=dict(style='carto-positron', center=camada.centro, zoom=zoom), height=600,
+                      margin=dict(l=0, r=0, t=30, b=0), uirevision=nivel,
+                      title=f"{INDICADORES[indicador][0]} por bairro")
+    mostrar_plotly(fig, use_container_width=True)
+    
+    legenda = f"Percentual sobre {INDICADORES[indicador][1]}; base = denominador de cada bairro."
+    sem_poligono = cubo.loc[camada.codigos(cubo) < 0, 'contagem'].sum()
+    if sem_poligono:
+        legenda += f" {sem_poligono:,.0f} registros do recorte são de bairros sem polígono no arquivo."
+    if url is None:
+        legenda += " Static serving desligado: o GeoJSON é enviado junto com cada figura."
+    st.caption(legenda)
+
+@instrumentar
+def show_od_flows(fluxos, chave):
+    st.markdown('<h2 class="sub-header">🧭 Fluxos Origem-Destino</h2>', 
+                unsafe_allow_html=True)
+    
+    st.markdown("""
+    <div class="insight-box">
+    <b>📌 Sobre esta análise:</b> Viagens da zona de residência (origem) para a zona de trabalho ou de
+    estudo (destino), onde cada zona é um bairro de um município. Com um modal escolhido, entram as viagens
+    que usam esse modal (sozinho ou combinado com outros).
+    </div>
+    """, unsafe_allow_html=True)
+    
+    rotulos_contexto = {'trabalho': 'Trabalho', 'aula': 'Aula'}
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        contexto = st.selectbox("Contexto", list(rotulos_contexto), format_func=rotulos_contexto.get,
+                                key='od_contexto')
+    with col2:
+        modal = st.selectbox("Modal", [None] + [m for m in MODAL_MAP if m > 0],
+                             format_func=lambda m: "Todos" if m is None else MODAL_MAP[m], key='od_modal')
+    with col3:
+        nivel = st.radio("Zonas", ['bairro', 'municipio'], horizontal=True, key='od_nivel',
+                         format_func={'bairro': 'Bairro', 'municipio': 'Município'}.get)
+    with col4:
+        k = st.slider("Maiores corredores (K)", min_value=5, max_value=50, value=15, key='od_k')
+    
+    # Matriz esparsa montada uma vez por recorte; as consultas abaixo são fatias dela
+    with etapa('matriz_od'):
+        matriz = load_od_matrix(chave, contexto, modal, fluxos(contexto, modal))
+        if nivel == 'municipio':
+            matriz = matriz.por_municipio()
+    
+    total_viagens = matriz.total()
+    if total_viagens == 0:
+        st.info("📊 Sem viagens para o contexto e o modal escolhidos.")
+        return
+    internas = matriz.internas()
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Viagens", f"{total_viagens:,.0f}")
+    with col2:
+        st.metric("Pares O-D com viagens", f"{matriz.n_pares():,}")
+    with col3:
+        rotulo = "Na mesma zona" if nivel == 'bairro' else "No mesmo município"
+        st.metric(rotulo, f"{internas / total_viagens * 100:.1f}%")
+    
+    st.markdown("### 🔀 Maiores Fluxos")
+    incluir_internas = st.checkbox("Incluir viagens dentro da mesma zona", value=False, key='od_internas')
+    corredores = matriz.corredores(k, incluir_internas)
+    
+    # Origens e destinos como nós separados (Sankey não desenha ciclos)
+    origens = list(dict.fromkeys(corredores['origem']))
+    destinos = list(dict.fromkeys(corredores['destino']))
+    fig = go.Figure(go.Sankey(
+        node=dict(label=origens + destinos, pad=12, thickness=14),
+        link=dict(
+            source=[origens.index(o) for o in corredores['origem']],
+            target=[len(origens) + destinos.index(d) for d in corredores['destino']],
+            value=corredores['viagens'],
+        ),
+    ))
+    fig.update_layout(title=f"Top {len(corredores)} fluxos origem → destino ({rotulos_contexto[contexto]})",
+                      height=max(400, 22 * max(len(origens), len(destinos))))
+    mostrar_plotly(fig, use_container_width=True)
+    
+    tabela = corredores.rename(columns={'origem': 'Origem', 'destino': 'Destino', 'viagens': 'Viagens'})
+    tabela['% das viagens'] = (tabela['Viagens'] / total_viagens * 100).round(2)
+    st.dataframe(tabela, use_container_width=True)
+    
+    if nivel == 'municipio':
+        st.markdown("### 🏙️ Matriz entre Municípios")
+        fig = px.imshow(matriz.densa(), text_auto='.0f', color_continuous_scale='Blues', aspect='auto',
+                        labels=dict(x="Destino", y="Origem", color="Viagens"))
+        mostrar_plotly(fig, use_container_width=True)
+    
+    st.markdown("### 📍 Explorar uma Zona")
+    rotulos = matriz.rotulos()
+    zona = matriz.zonas[rotulos.index(st.selectbox("Zona", rotulos, key='od_zona'))]
+    col1, col2 = st.columns(2)
+    for coluna, titulo, serie in [(col1, "Destinos de quem mora na zona", matriz.destinos(zona)),
+                                  (col2, "Origens de quem vai para a zona", matriz.origens(zona))]:
+        with coluna:
+            top = serie.head(10)
+            dados_zona = pd.DataFrame({'Zona': [rotulos[i] for i in matriz.zonas.get_indexer(top.index)],
+                                       'Viagens': top.to_numpy()})
+            fig = px.bar(dados_zona, x='Viagens', y='Zona', orientation='h', title=titulo)
+            fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+            mostrar_plotly(fig, use_container_width=True)
+    
+    st.markdown("""
+    <div class="insight-box">
+    <b>💡 Interpretação:</b> A espessura de cada faixa do Sankey é proporcional ao número de viagens do par
+    origem-destino. Corredores concentrados indicam onde a oferta de transporte (linhas, integração)
+    tem maior impacto; a matriz entre municípios mostra o peso das viagens metropolitanas.
+    </div>
+    """, unsafe_allow_html=True)
+
+@instrumentar
+def show_multimodal_integration(combinacoes):
     st.markdown('<h2 class="sub-header">🔄 Integração Multimodal</h2>', 
                 unsafe_allow_html=True)
     
@@ -561,49 +863,75 @@ def show_multimodal_integration(df):
     
     st.markdown("### 🚏 Top Combinações de Modais")
     
-    all_combinations = []
-    
-    # Trabalho
-    for modals_str in df[df["tipo_trajeto_trabalho"] == "multimodal"]["meio_transporte_trab"].dropna():
-        modals = clean_modal(modals_str)
-        if len(modals) > 1:
-            modal_names = [MODAL_MAP.get(m, "Outro") for m in modals]
-            all_combinations.append(frozenset(modal_names))
-    
-    # Aula
-    for modals_str in df[df["tipo_trajeto_aula"] == "multimodal"]["transporte_aula"].dropna():
-        modals = clean_modal(modals_str)
-        if len(modals) > 1:
-            modal_names = [MODAL_MAP.get(m, "Outro") for m in modals]
-            all_combinations.append(frozenset(modal_names))
-    
-    # Filhos
-    for modals_str in df[df["tipo_trajeto_filhos"] == "multimodal"]["meios_transporte_filhos"].dropna():
-        modals = clean_modal(modals_str)
-        if len(modals) > 1:
-            modal_names = [MODAL_MAP.get(m, "Outro") for m in modals]
-            all_combinations.append(frozenset(modal_names))
-    
-    combination_counts = Counter(all_combinations)
-    formatted_combinations = {
-        " + ".join(sorted(list(k))): v for k, v in combination_counts.items()
-    }
+    # Filtros por contexto (linhas da tabela agregada) e recorte demográfico (registros, como o filtro global)
+    rotulos_contexto = {'trabalho': 'Trabalho', 'aula': 'Aula', 'filhos': 'Filhos'}
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        contextos = st.multiselect("Contexto", list(rotulos_contexto), default=list(rotulos_contexto),
+                                   format_func=rotulos_contexto.get)
+    with col2:
+        sexos = st.multiselect("Sexo", list(SEXO_MAP), format_func=SEXO_MAP.get, placeholder="Todos")
+    with col3:
+        idades = st.multiselect("Faixa etária", list(FAIXA_ETARIA_MAP), format_func=FAIXA_ETARIA_MAP.get,
+                                placeholder="Todas")
+    with col4:
+        rendas = st.multiselect("Renda", list(RENDA_MAP), format_func=RENDA_MAP.get, placeholder="Todas")
     
-    df_combinations = pd.DataFrame(formatted_combinations.items(), 
-                                   columns=['Combinacao', 'Contagem'])
+    combinacoes = combinacoes({'sexo': sexos, 'faixa_etaria': idades, 'renda': rendas})
+    selecao = combinacoes[combinacoes['contexto'].isin(contextos).to_numpy()]
+    
+    with etapa('contar_combinacoes'):
+        combination_counts = contar_combinacoes(selecao['mascara'], pesos=selecao['contagem'])
+    if combination_counts.empty:
+        st.info("📊 Nenhuma viagem multimodal no recorte selecionado")
+        return
+    
+    df_combinations = pd.DataFrame({
+        'Combinacao': nomes_combinacoes(combination_counts.index),
+        'Contagem': combination_counts.values
+    })
     df_combinations = df_combinations.sort_values(by='Contagem', ascending=False).head(10)
     total = df_combinations['Contagem'].sum()
     df_combinations['Porcentagem'] = (df_combinations['Contagem'] / total) * 100
     
-    st.dataframe(df_combinations)
+    # Somas ponderadas só são arredondadas na exibição
+    st.dataframe(df_combinations.assign(Contagem=df_combinations['Contagem'].round(1)))
     
     # Ordenar do maior pro menor no gráfico
     fig = px.bar(df_combinations.sort_values('Porcentagem', ascending=True), 
                  x='Porcentagem', y='Combinacao', orientation='h',
                  title='Top 10 Combinações de Modais Multimodais')
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
+    
+    # Top-N por bairro de residência, no mesmo recorte
+    st.markdown("### 🏘️ Combinações Mais Frequentes por Bairro")
+    col1, col2 = st.columns(2)
+    with col1:
+        n_top = st.slider("Combinações por bairro", min_value=1, max_value=5, value=3)
+    with col2:
+        n_bairros = st.slider("Bairros (com mais viagens multimodais)", min_value=5, max_value=50, value=15)
+    
+    with etapa('top_por_bairro'):
+        por_bairro = top_combinacoes_por_grupo(selecao['bairro_residencia'], selecao['mascara'], n=n_top,
+                                               pesos=selecao['contagem'])
+    total_bairro = contar(selecao, 'bairro_residencia')
+    bairros = total_bairro.sort_values(ascending=False, kind='stable').head(n_bairros).index
+    por_bairro = por_bairro[por_bairro['bairro_residencia'].isin(bairros)]
+    
+    tabela_bairros = pd.DataFrame({
+        'Bairro': por_bairro['bairro_residencia'].to_numpy(),
+        'Posição': por_bairro['posicao'].to_numpy(),
+        'Combinação': nomes_combinacoes(por_bairro['mascara']),
+        'Contagem': por_bairro['contagem'].to_numpy().round(1),
+        '% no bairro': (por_bairro['contagem'].to_numpy()
+                        / total_bairro.reindex(por_bairro['bairro_residencia']).to_numpy() * 100).round(1),
+    })
+    ordem = pd.Categorical(tabela_bairros['Bairro'], categories=bairros, ordered=True)
+    tabela_bairros = tabela_bairros.iloc[np.lexsort((tabela_bairros['Posição'], ordem.codes))]
+    st.dataframe(tabela_bairros.reset_index(drop=True), use_container_width=True)
 
-def show_integration_user_profile(df):
+@instrumentar
+def show_integration_user_profile(cubo):
     """Análise do perfil dos usuários de integração entre modais"""
     st.markdown('<h2 class="sub-header">🚴‍♂️ Perfil dos Usuários de Integração</h2>', 
                 unsafe_allow_html=True)
@@ -617,31 +945,20 @@ def show_integration_user_profile(df):
     </div>
     """, unsafe_allow_html=True)
     
-    # Filtrar usuários de integração
-    df['terminal_int_trabalho'] = df['terminal_int_trabalho'].astype(str).str.strip()
-    df['terminal_aula'] = df['terminal_aula'].astype(str).str.strip()
-    
-    df["usa_int_trabalho"] = (
-        (df["utiliza_terminal_int_trabalho"] == 1) | 
-        ((df["terminal_int_trabalho"] != "0") & (df["terminal_int_trabalho"] != "nan"))
-    )
-    df["usa_int_aula"] = (
-        (df["utiliza_integracao_aula"] == 1) | 
-        ((df["terminal_aula"] != "0") & (df["terminal_aula"] != "nan"))
-    )
-    df["usuario_integracao"] = df["usa_int_trabalho"] | df["usa_int_aula"]
-    
-    # Dataset de usuários de integração
-    df_int = df[df["usuario_integracao"]].copy()
-    df_int = df_int[df_int['sexo'].isin([1, 2])]  # Apenas Masculino/Feminino
+    # Usuários de integração (apenas Masculino/Feminino)
+    filtro_int = cubo['usuario_integracao'] & cubo['sexo'].isin([1, 2])
     
     # KPIs principais
     st.markdown("### 📊 Indicadores Principais")
-    col1, col2, col3 = st.columns(3)
+    total_usuarios = total(cubo, filtro_int)
+    if total_usuarios == 0:
+        st.info("📊 Nenhum usuário de integração no recorte selecionado.")
+        return
     
-    total_usuarios = len(df_int)
-    pct_populacao = (total_usuarios / len(df)) * 100
-    sexo_predominante = df_int['sexo_desc'].value_counts().index[0]
+    col1, col2, col3 = st.columns(3)
+    pct_populacao = (total_usuarios / total(cubo)) * 100
+    sexo_counts = contagem_rotulada(cubo, 'sexo', SEXO_MAP, filtro_int).sort_values(ascending=False)
+    sexo_predominante = sexo_counts.index[0]
     
     with col1:
         st.metric("👥 Total de Usuários", f"{total_usuarios:,}")
@@ -657,14 +974,13 @@ def show_integration_user_profile(df):
     col1, col2 = st.columns([2, 1])
     
     with col1:
-        sexo_counts = df_int['sexo_desc'].value_counts()
         fig = px.bar(x=sexo_counts.index, y=sexo_counts.values,
                      labels={'x': 'Sexo', 'y': 'Número de Usuários'},
                      title='Usuários de Integração por Sexo',
                      color=sexo_counts.index,
                      color_discrete_map={'Masculino': '#1f77b4', 'Feminino': '#ff7f0e'})
         fig.update_layout(showlegend=False)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig, use_container_width=True)
     
     with col2:
         st.markdown("#### 📋 Estatísticas")
@@ -683,7 +999,7 @@ def show_integration_user_profile(df):
     ordem_idade = ['Até 6 anos', '6 a 15 anos', '16 a 24 anos', 
                    '25 a 39 anos', '40 a 59 anos', 'Acima de 60 anos']
     
-    idade_counts = df_int['faixa_etaria_desc'].value_counts()
+    idade_counts = contagem_rotulada(cubo, 'faixa_etaria', FAIXA_ETARIA_MAP, filtro_int)
     idade_counts = idade_counts.reindex(ordem_idade).dropna()
     
     col1, col2 = st.columns([2, 1])
@@ -695,7 +1011,7 @@ def show_integration_user_profile(df):
                      color=idade_counts.values,
                      color_continuous_scale='Viridis')
         fig.update_layout(showlegend=False, xaxis_tickangle=-45)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig, use_container_width=True)
     
     with col2:
         st.markdown("#### 📋 Estatísticas")
@@ -713,7 +1029,7 @@ def show_integration_user_profile(df):
     ordem_renda = ['Sem rendimento', 'Até 1 SM', '1 a 2 SM', '2 a 3 SM', 
                    '3 a 5 SM', '5 a 10 SM', '10 a 20 SM', '+ 20 SM', 'Sem declaração']
     
-    renda_counts = df_int['renda_desc'].value_counts()
+    renda_counts = contagem_rotulada(cubo, 'renda', RENDA_MAP, filtro_int)
     renda_counts = renda_counts.reindex(ordem_renda).dropna()
     
     col1, col2 = st.columns([2, 1])
@@ -725,7 +1041,7 @@ def show_integration_user_profile(df):
                      color=renda_counts.values,
                      color_continuous_scale='Magma')
         fig.update_layout(showlegend=False, xaxis_tickangle=-45)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig, use_container_width=True)
     
     with col2:
         st.markdown("#### 📋 Estatísticas")
@@ -747,113 +1063,181 @@ def show_integration_user_profile(df):
     </div>
     """, unsafe_allow_html=True)
 
-def show_demographic_profile(df):
+@instrumentar
+def show_terminals(terminais, chave):
+    st.markdown('<h2 class="sub-header">🚏 Terminais de Integração</h2>', 
+                unsafe_allow_html=True)
+    
+    st.markdown("""
+    <div class="insight-box">
+    <b>📌 Sobre esta análise:</b> Pessoas que declararam o terminal de integração usado no caminho para
+    o trabalho ou para o local de estudo: quantas passam por cada terminal, quem são, com quais modais
+    chegam e de quais bairros vêm (bacia de captação do terminal).
+    </div>
+    """, unsafe_allow_html=True)
+    
+    rotulos_contexto = {'trabalho': 'Trabalho', 'aula': 'Aula'}
+    contexto = st.radio("Contexto", list(rotulos_contexto), format_func=rotulos_contexto.get, horizontal=True,
+                        key='terminais_contexto')
+    
+    # Índice montado uma vez por recorte; cada quebra abaixo é um bincount sobre os códigos
+    with etapa('indice_terminais'):
+        indice = load_terminal_index(chave, contexto, terminais)
+    
+    usuarios = indice.usuarios()
+    total_usuarios = indice.total()
+    if total_usuarios == 0:
+        st.info("📊 Nenhum terminal declarado no recorte selecionado.")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("👥 Usuários com terminal declarado", f"{total_usuarios:,.0f}")
+    with col2:
+        st.metric("🚏 Terminais utilizados", f"{len(usuarios)} de {len(TERMINAL_MAP) - 1}")
+    with col3:
+        st.metric("🏆 Mais utilizado", nome_terminal(usuarios.index[0]))
+    
+    st.markdown("---")
+    
+    # Usuários por terminal
+    st.markdown("### 📊 Usuários por Terminal")
+    por_terminal = pd.DataFrame({
+        'Terminal': [nome_terminal(t) for t in usuarios.index],
+        'Usuários': usuarios.to_numpy(),
+        '%': (usuarios.to_numpy() / total_usuarios * 100).round(2),
+    })
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        fig = px.bar(por_terminal, x='Usuários', y='Terminal', orientation='h',
+                     title=f'Usuários por Terminal ({rotulos_contexto[contexto]})',
+                     color='Usuários', color_continuous_scale='Blues')
+        fig.update_layout(yaxis={'categoryorder': 'total ascending'}, height=max(400, 24 * len(por_terminal)))
+        mostrar_plotly(fig, use_container_width=True)
+    with col2:
+        st.dataframe(por_terminal, use_container_width=True)
+    
+    st.markdown("---")
+    
+    # Composição demográfica de cada terminal
+    st.markdown("### 👥 Perfil dos Usuários por Terminal")
+    dimensoes = {'sexo': ("Sexo", SEXO_MAP), 'faixa_etaria': ("Faixa Etária", FAIXA_ETARIA_MAP),
+                 'renda': ("Faixa de Renda", RENDA_MAP)}
+    dimensao = st.selectbox("Dimensão", list(dimensoes), format_func=lambda d: dimensoes[d][0],
+                            key='terminais_dimensao')
+    rotulo, mapa = dimensoes[dimensao]
+    composicao = indice.composicao(dimensao, mapa).reindex(usuarios.index).dropna()
+    composicao = composicao.loc[:, composicao.sum() > 0]
+    composicao.index = [nome_terminal(t) for t in composicao.index]
+    percentual = composicao.div(composicao.sum(axis=1), axis=0) * 100
+    fig = px.bar(percentual, orientation='h', barmode='stack',
+                 labels={'value': 'Percentual (%)', 'index': 'Terminal', 'variable': rotulo},
+                 title=f'Composição por {rotulo} (% dos usuários de cada terminal)')
+    fig.update_layout(yaxis={'autorange': 'reversed'}, height=max(400, 24 * len(percentual)))
+    mostrar_plotly(fig, use_container_width=True)
+    
+    st.markdown("---")
+    
+    # Detalhe de um terminal
+    st.markdown("### 🔎 Explorar um Terminal")
+    terminal = st.selectbox("Terminal", list(usuarios.index), format_func=nome_terminal, key='terminais_terminal')
+    st.caption(f"{usuarios[terminal]:,.0f} usuários ({usuarios[terminal] / total_usuarios * 100:.1f}% do recorte)")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        combinacoes = indice.combinacoes(terminal).head(10)
+        if combinacoes.empty:
+            st.info("📊 Nenhum modal declarado pelos usuários deste terminal.")
+        else:
+            dados_combinacoes = pd.DataFrame({
+                'Modais': nomes_combinacoes(combinacoes['mascara']),
+                'Usuários': combinacoes['usuarios'].to_numpy(),
+            })
+            fig = px.bar(dados_combinacoes, x='Usuários', y='Modais', orientation='h',
+                         title='Modais usados para chegar ao terminal')
+            fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+            mostrar_plotly(fig, use_container_width=True)
+    with col2:
+        bacia = indice.bacia(terminal).head(10)
+        dados_bacia = pd.DataFrame({
+            'Bairro': [f'{bairro} ({cidade})' for cidade, bairro in bacia.index],
+            'Usuários': bacia.to_numpy(),
+        })
+        fig = px.bar(dados_bacia, x='Usuários', y='Bairro', orientation='h',
+                     title='Bairros de residência dos usuários (bacia de captação)')
+        fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+        mostrar_plotly(fig, use_container_width=True)
+    
+    municipios = indice.bacia(terminal, 'municipio')
+    st.markdown("#### 🏙️ Municípios de Residência")
+    st.dataframe(pd.DataFrame({
+        'Município': municipios.index,
+        'Usuários': municipios.to_numpy(),
+        '%': (municipios.to_numpy() / municipios.sum() * 100).round(2),
+    }), use_container_width=True)
+
+@instrumentar
+def show_demographic_profile(cubo):
     st.markdown('<h2 class="sub-header">👥 Perfil Demográfico</h2>', 
                 unsafe_allow_html=True)
     
-    # Filtrar dados válidos
-    df_exploded = df.copy()
-    df_exploded = df_exploded.explode("modal_trabalho_list")
-    df_exploded = df_exploded[df_exploded["modal_trabalho_list"].notna()]
-    df_exploded["modal_trabalho_list"] = df_exploded["modal_trabalho_list"].astype(int)
-    df_exploded["modal_nome"] = df_exploded["modal_trabalho_list"].map(MODAL_MAP)
+    # Modais válidos: bitmask sem o bit 0 ("Não declarado")
+    mascaras_validas = cubo['modal_trabalho_mask'].to_numpy() & ~np.uint16(1)
     
-    modais_validos = list(MODAL_MAP.values())[1:]  # Excluir "Não declarado"
-    df_analise = df_exploded[df_exploded['modal_nome'].isin(modais_validos)].copy()
+    def distribuicao_modal(grupos):
+        with etapa('crosstab'):
+            tabela = crosstab_modais(grupos, mascaras_validas, pesos=cubo['contagem'])
+        tabela = tabela.rename(columns=MODAL_MAP).sort_index(axis=1)
+        return tabela.div(tabela.sum(axis=1), axis=0) * 100
     
     # Por Sexo
     st.markdown("### 👫 Modal vs. Sexo")
-    dist_sexo = pd.crosstab(
-        df_analise['sexo_desc'],
-        df_analise['modal_nome'],
-        normalize='index'
-    ) * 100
+    dist_sexo = distribuicao_modal(cubo['sexo'].map(SEXO_MAP).rename('sexo_desc'))
     
     st.dataframe(dist_sexo.round(1))
     
-    fig, ax = plt.subplots(figsize=(15, 6))
-    dist_sexo.plot(kind='bar', stacked=True, colormap='Paired', ax=ax)
-    plt.title('Participação Modal por Sexo (Trabalho)')
-    plt.ylabel('Percentual (%)')
-    plt.xticks(rotation=0)
-    plt.legend(title='Modal', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=8)
-    plt.tight_layout()
-    st.pyplot(fig)
+    mostrar_grafico('barras_empilhadas', dist_sexo, 'Participação Modal por Sexo (Trabalho)', 'Paired', (15, 6))
     
     # Por Renda
     st.markdown("### 💰 Modal vs. Renda")
-    faixas_renda_validas = df_analise[~df_analise['renda_desc'].isin(['Sem rendimento', 'Sem declaração'])].copy()
-    
     ordem_renda = ['Até 1 SM', '1 a 2 SM', '2 a 3 SM', '3 a 5 SM', '5 a 10 SM', '10 a 20 SM', '+ 20 SM']
-    faixas_renda_validas['renda_ordenada'] = pd.Categorical(
-        faixas_renda_validas['renda_desc'],
-        categories=ordem_renda,
-        ordered=True
-    )
+    renda_ordenada = pd.Categorical(cubo['renda'].map(RENDA_MAP), categories=ordem_renda, ordered=True)
     
-    dist_renda = pd.crosstab(
-        faixas_renda_validas['renda_ordenada'],
-        faixas_renda_validas['modal_nome'],
-        normalize='index'
-    ) * 100
+    dist_renda = distribuicao_modal(pd.Series(renda_ordenada, name='renda_ordenada'))
     
     st.dataframe(dist_renda.round(1))
     
-    fig, ax = plt.subplots(figsize=(18, 8))
-    dist_renda.plot(kind='bar', stacked=True, colormap='Spectral', ax=ax)
-    plt.title('Impacto da Renda na Escolha Modal', fontsize=16)
-    plt.ylabel('Percentual (%)', fontsize=12)
-    plt.xlabel('Faixa de Renda', fontsize=12)
-    plt.xticks(rotation=45, ha='right')
-    plt.legend(title='Modal', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=8)
-    plt.grid(axis='y', linestyle='--', alpha=0.6)
-    plt.tight_layout()
-    st.pyplot(fig)
+    mostrar_grafico('barras_empilhadas', dist_renda, 'Impacto da Renda na Escolha Modal', 'Spectral', (18, 8),
+                    xlabel='Faixa de Renda', rotacao=45, fonte_titulo=16, fonte_eixos=12, grade=True)
 
-def show_regression_models(df):
+@instrumentar
+def show_regression_models(pontos):
     st.markdown('<h2 class="sub-header">📈 Modelos de Regressão</h2>', 
                 unsafe_allow_html=True)
     
-    # Preparar dados
-    df_reg = df[
-        (df['renda'].isin([1,2,3,4,5,6,7])) &
-        (df['faixa_etaria'].isin([3,4,5])) &
-        (df['num_modais_trabalho'] > 0)
-    ].copy()
+    # Ajuste ponderado sobre os pontos distintos do recorte atual
+    if pontos['renda'].nunique() < 2:
+        st.info("📊 Registros insuficientes para a regressão no recorte selecionado")
+        return
+    with etapa('ajuste'):
+        regressao = ajustar_regressao_renda(pontos)
     
-    st.write(f"Total de registros válidos: {len(df_reg)}")
+    st.write(f"Total de registros válidos: {regressao['n']}")
     
     # Regressão 1: Renda vs Número de Modais
     st.markdown("### 📊 Regressão 1: Renda → Número de Modais")
     
-    X_renda = df_reg[['renda']].values
-    y_modais = df_reg['num_modais_trabalho'].values
+    r2 = regressao['r2']
     
-    modelo = LinearRegression()
-    modelo.fit(X_renda, y_modais)
-    y_pred = modelo.predict(X_renda)
-    
-    r2 = r2_score(y_modais, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_modais, y_pred))
-    
-    st.write(f"**Equação:** Nº Modais = {modelo.intercept_:.4f} + {modelo.coef_[0]:.4f} × Renda")
+    st.write(f"**Equação:** Nº Modais = {regressao['intercepto']:.4f} + {regressao['coeficiente']:.4f} × Renda")
     st.write(f"**R²:** {r2:.4f}")
-    st.write(f"**RMSE:** {rmse:.4f}")
-    
-    # Gráfico
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.scatter(X_renda, y_modais, alpha=0.3, s=20, color='steelblue')
-    x_line = np.array([[1], [2], [3], [4], [5], [6], [7]])
-    y_line = modelo.predict(x_line)
-    ax.plot(x_line, y_line, color='red', linewidth=3, label=f'R²={r2:.3f}')
-    ax.set_xlabel('Faixa de Renda')
-    ax.set_ylabel('Número de Modais')
-    ax.set_title('Renda vs. Número de Modais')
-    ax.legend()
-    ax.grid(True, alpha=0.3)
-    st.pyplot(fig)
+    st.write(f"**RMSE:** {regressao['rmse']:.4f}")
+    
+    # Gráfico a partir dos pontos distintos (renda, nº de modais) com contagem
+    mostrar_grafico('dispersao_regressao', regressao['pontos'], regressao['linha'], r2)
 
-def show_classification_models(df):
+@instrumentar
+def show_classification_models(classificacao):
     st.markdown('<h2 class="sub-header">🤖 Modelos de Classificação</h2>', 
                 unsafe_allow_html=True)
     
@@ -864,91 +1248,114 @@ def show_classification_models(df):
     </div>
     """, unsafe_allow_html=True)
     
-    # Criar variável target exatamente como no notebook
-    df_class = df.copy()
-    df_class['usa_integracao'] = (
-        (df_class['utiliza_terminal_int_trabalho'] == 1) |
-        (df_class['utiliza_integracao_aula'] == 1)
-    ).astype(int)
-    
-    # SEMPRE RECRIA num_modais_trabalho - CONTA O NÚMERO REAL DE MODAIS da coluna meio_transporte_trab
-    def contar_num_modais(valor):
-        """Conta o número de modais em um registro (ex: '3,5,7' retorna 3)"""
-        if pd.isna(valor):
-            return 0
-        valor = str(valor).replace(" ", "").split(",")
-        return len([v for v in valor if v.isdigit() and int(v) > 0])
-    
-    # FORÇA a recriação usando a coluna correta
-    df_class['num_modais_trabalho'] = df_class['meio_transporte_trab'].apply(contar_num_modais)
-    
-    # Aplicar filtros exatamente como no notebook
-    df_class_clean = df_class[
-        (df_class['renda'].isin([1,2,3,4,5,6,7])) &
-        (df_class['faixa_etaria'].isin([3,4,5])) &
-        (df_class['sexo'].isin([1,2])) &
-        (df_class['num_modais_trabalho'] > 0)
-    ].copy()
-    
-    # Preparar features e target
-    features = ['renda', 'faixa_etaria', 'sexo', 'num_modais_trabalho']
-    X = df_class_clean[features].values
-    y = df_class_clean['usa_integracao'].values
+    # Features e target exatamente como no notebook
+    resumo = classificacao['resumo']
     
     # Informações sobre os dados
     st.markdown("### 📊 Dados de Treinamento")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total de Registros", f"{len(X):,}")
+        st.metric("Total de Registros", f"{resumo['n']:,}")
     with col2:
-        st.metric("Usa Integração", f"{y.sum():,}")
+        st.metric("Usa Integração", f"{resumo['positivos']:,}")
     with col3:
-        st.metric("Não Usa", f"{(~y.astype(bool)).sum():,}")
+        st.metric("Não Usa", f"{resumo['negativos']:,}")
     with col4:
-        st.metric("% Positivos", f"{(y.mean()*100):.1f}%")
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.3, random_state=42, stratify=y
-    )
-    
-    st.write(f"**Treino:** {len(X_train):,} registros | **Teste:** {len(X_test):,} registros")
+        st.metric("% Positivos", f"{resumo['pct_positivos']:.1f}%")
+    
+    precomputado = 'registro' in classificacao
+    if precomputado:
+        # Resultados gerados pelo precompute.py: nada é treinado no servidor
+        ajustar = st.checkbox("Hiperparâmetros ajustados (busca)", value=False,
+                              disabled=classificacao.get('busca') is None,
+                              help="Disponível quando os artefatos foram gerados com precompute.py --busca")
+        registro = classificacao['busca'] if ajustar else classificacao['registro']
+        cv_precomputado = classificacao['cv_busca'] if ajustar else classificacao['cv']
+        # Sem validação cruzada quando o precompute treinou de forma incremental
+        usar_cv = st.checkbox("Validação cruzada k-fold (intervalos de confiança)", value=False,
+                              disabled=cv_precomputado is None)
+    else:
+        X, y = classificacao['X'], classificacao['y']
+        
+        # Modo de execução (workers só importam quando há treino de fato)
+        with st.expander("⚙️ Execução do treinamento"):
+            incremental = st.checkbox(
+                "Treino incremental (memória limitada)", value=False,
+                help=f"Modelos com partial_fit e HistGB sobre as combinações distintas, em blocos de "
+                     f"{TAMANHO_BLOCO_TREINO:,} registros; sem validação cruzada"
+            )
+            ajustar = st.checkbox(
+                "Hiperparâmetros ajustados (busca com successive halving)", value=False, disabled=incremental,
+                help=f"HalvingRandomSearchCV com {PARAMS_BUSCA['n_candidatos']} candidatos por modelo, mais "
+                     f"HistGradientBoosting com early stopping; a melhor configuração fica no registro e é "
+                     f"carregada sem refazer a busca"
+            ) and not incremental
+            max_workers = os.cpu_count() or 1
+            n_jobs = st.number_input("Workers (processos paralelos)", min_value=1, max_value=max_workers,
+                                     value=min(max(N_JOBS_PADRAO, 1), max_workers), disabled=incremental)
+            usar_cv = st.checkbox("Validação cruzada k-fold (intervalos de confiança)", value=False,
+                                  disabled=incremental) and not incremental
+            k_folds = st.slider("Número de folds (k)", min_value=3, max_value=10, value=5, disabled=not usar_cv)
+        
+        # Modelos vêm do registro (memória/disco); só treina se dados ou configuração mudarem
+        if incremental:
+            chave = chave_registro(X, y, CONFIG_INCREMENTAL)
+            with st.spinner("Treinando modelos em blocos..."), etapa('treino'):
+                registro = load_incremental_results(chave, X, y)
+        elif ajustar:
+            chave = chave_busca(X, y)
+            with st.spinner("Buscando hiperparâmetros..."), etapa('busca'):
+                registro = load_tuned_results(chave, X, y, int(n_jobs))
+        else:
+            chave = chave_registro(X, y)
+            with st.spinner("Treinando modelos..."), etapa('treino'):
+                registro = load_classification_results(chave, X, y, int(n_jobs))
+    results = registro['resultados']
+    
+    st.write(f"**Treino:** {registro['n_treino']:,} registros | **Teste:** {registro['n_teste']:,} registros")
     
     st.markdown("---")
     
-    # Treinar modelos
     st.markdown("### 🔧 Treinamento dos Modelos")
-    
-    models = {
-        'Regressão Logística': LogisticRegression(random_state=42, max_iter=1000),
-        'Decision Tree': DecisionTreeClassifier(random_state=42, max_depth=5),
-        'Random Forest': RandomForestClassifier(random_state=42, n_estimators=100, max_depth=10)
-    }
-    
-    results = {}
-    with st.spinner("Treinando modelos..."):
-        for name, model in models.items():
-            # Treinar modelo
-            model.fit(X_train, y_train)
-            
-            # Fazer predições
-            y_pred = model.predict(X_test)
-            y_proba = model.predict_proba(X_test)[:, 1]
-            
-            # Calcular métricas
-            results[name] = {
-                'model': model,
-                'accuracy': accuracy_score(y_test, y_pred),
-                'precision': precision_score(y_test, y_pred, zero_division=0),
-                'recall': recall_score(y_test, y_pred, zero_division=0),
-                'f1': f1_score(y_test, y_pred, zero_division=0),
-                'y_test': y_test,
-                'y_pred': y_pred,
-                'y_proba': y_proba,
-                'cm': confusion_matrix(y_test, y_pred)
-            }
-    
     st.success("✅ Modelos treinados com sucesso!")
     
+    tempos_df = pd.DataFrame({
+        'Modelo': list(results.keys()),
+        'Treino (s)': [f"{results[m]['tempo_treino_s']:.3f}" for m in results],
+        'Treino + Avaliação (s)': [f"{results[m]['tempo_total_s']:.3f}" for m in results]
+    })
+    st.dataframe(tempos_df, use_container_width=True)
+    if registro.get('incremental'):
+        st.caption(f"Tempo total (wall-clock): {registro['tempo_total_s']:.2f}s no treino incremental registrado. "
+                   "Teste sorteado por registro em cada bloco; métricas calculadas sobre as combinações "
+                   "distintas ponderadas pela contagem.")
+    else:
+        st.caption(f"Tempo total (wall-clock): {registro['tempo_total_s']:.2f}s com "
+                   f"{registro['n_jobs']} worker(s) no treinamento registrado.")
+    
+    if usar_cv:
+        if precomputado:
+            cv = cv_precomputado
+        else:
+            config = config_ajustada(registro) if ajustar else CONFIG_MODELOS
+            with st.spinner("Executando validação cruzada..."), etapa('validacao_cruzada'):
+                cv = load_cross_validation(chave, int(k_folds), X, y, int(n_jobs), config)
+        st.markdown(f"#### 🔁 Validação Cruzada ({cv['k']}-fold estratificada)")
+        
+        nomes_metricas = {'accuracy': 'Acurácia', 'precision': 'Precisão', 'recall': 'Recall',
+                          'f1': 'F1-Score', 'roc_auc': 'AUC'}
+        cv_df = pd.DataFrame({
+            'Modelo': list(cv['resultados'].keys()),
+            **{
+                nomes_metricas[m]: [f"{r[m][0]:.4f} ± {r[m][1]:.4f}" for r in cv['resultados'].values()]
+                for m in METRICAS_CV
+            },
+            'Tempo (s)': [f"{r['tempo_s']:.2f}" for r in cv['resultados'].values()]
+        })
+        st.dataframe(cv_df, use_container_width=True)
+        st.caption(f"Média ± meia-largura do IC 95% (t de Student) sobre {cv['k']} folds. "
+                   f"Wall-clock: {cv['tempo_total_s']:.2f}s com {cv['n_jobs']} worker(s).")
+    
     st.markdown("---")
     
     # Tabela de métricas
@@ -964,6 +1371,9 @@ def show_classification_models(df):
     
     st.dataframe(metrics_df, use_container_width=True)
     
+    if 'busca' in registro:
+        mostrar_busca(registro)
+    
     # Gráfico comparativo de métricas
     metrics_plot = pd.DataFrame({
         'Modelo': list(results.keys()),
@@ -977,28 +1387,20 @@ def show_classification_models(df):
                  x='Modelo', y='Score', color='Métrica', barmode='group',
                  title='Comparação de Desempenho dos Modelos')
     fig.update_layout(yaxis_range=[0, 1])
-    st.plotly_chart(fig, use_container_width=True)
+    mostrar_plotly(fig, use_container_width=True)
     
     st.markdown("---")
     
     # Matrizes de Confusão
     st.markdown("### 🎯 Matrizes de Confusão")
     
-    cols = st.columns(3)
+    cols = st.columns(len(results))
     for idx, (name, result) in enumerate(results.items()):
         with cols[idx]:
             cm = result['cm']
             
             # Criar figura com matplotlib para melhor controle
-            fig_cm, ax = plt.subplots(figsize=(6, 5))
-            sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', ax=ax,
-                       xticklabels=['Não Usa', 'Usa'],
-                       yticklabels=['Não Usa', 'Usa'])
-            ax.set_ylabel('Real')
-            ax.set_xlabel('Predito')
-            ax.set_title(f'{name}')
-            plt.tight_layout()
-            st.pyplot(fig_cm)
+            mostrar_grafico('matriz_confusao', cm, name)
             
             # Explicação da matriz
             tn, fp, fn, tp = cm.ravel()
@@ -1013,12 +1415,11 @@ def show_classification_models(df):
     fig_roc = go.Figure()
     
     for name, result in results.items():
-        fpr, tpr, _ = roc_curve(result['y_test'], result['y_proba'])
-        roc_auc = auc(fpr, tpr)
+        roc = result['roc']
         
         fig_roc.add_trace(go.Scatter(
-            x=fpr, y=tpr,
-            name=f'{name} (AUC = {roc_auc:.3f})',
+            x=roc['fpr'], y=roc['tpr'],
+            name=f'{name} (AUC = {roc["auc"]:.3f})',
             mode='lines'
         ))
     
@@ -1038,7 +1439,7 @@ def show_classification_models(df):
         height=500
     )
     
-    st.plotly_chart(fig_roc, use_container_width=True)
+    mostrar_plotly(fig_roc, use_container_width=True)
     
     st.markdown("""
     <div class="insight-box">
@@ -1058,12 +1459,11 @@ def show_classification_models(df):
     fig_pr = go.Figure()
     
     for name, result in results.items():
-        precision, recall, _ = precision_recall_curve(result['y_test'], result['y_proba'])
-        ap_score = average_precision_score(result['y_test'], result['y_proba'])
+        pr = result['pr']
         
         fig_pr.add_trace(go.Scatter(
-            x=recall, y=precision,
-            name=f'{name} (AP = {ap_score:.3f})',
+            x=pr['recall'], y=pr['precision'],
+            name=f'{name} (AP = {pr["ap"]:.3f})',
             mode='lines'
         ))
     
@@ -1074,7 +1474,7 @@ def show_classification_models(df):
         height=500
     )
     
-    st.plotly_chart(fig_pr, use_container_width=True)
+    mostrar_plotly(fig_pr, use_container_width=True)
     
     st.markdown("""
     <div class="insight-box">
@@ -1188,12 +1588,208 @@ def show_classification_models(df):
                     st.write("• Modelo baseado em regras (if-then)")
                     st.write("• Fácil de visualizar e entender")
                     st.write("• Pode capturar relações não-lineares")
+                elif name == 'SGD (Logística)':
+                    st.write("• Regressão logística ajustada por gradiente estocástico")
+                    st.write("• Aprende bloco a bloco (partial_fit)")
+                    st.write("• Memória constante, independente do nº de registros")
+                elif name == 'Naive Bayes':
+                    st.write("• Modelo probabilístico (Gaussiano)")
+                    st.write("• Aprende bloco a bloco (partial_fit)")
+                    st.write("• Assume independência entre features")
+                elif name == 'Gradient Boosting (HistGB)':
+                    st.write("• Ensemble de árvores sobre features discretizadas em histogramas")
+                    st.write("• Treinado sobre as combinações distintas, ponderadas pela contagem")
+                    st.write("• Captura relações não-lineares")
                 else:  # Random Forest
                     st.write("• Ensemble de múltiplas árvores")
                     st.write("• Mais robusto que árvore única")
                     st.write("• Menor risco de overfitting")
 
-def show_conclusions(df):
+def mostrar_busca(registro):
+    """Melhor configuração de cada modelo e curvas tempo x qualidade da busca de hiperparâmetros"""
+    busca = registro['busca']
+    results = registro['resultados']
+    estrategia = "successive halving" if busca['estrategia'] == 'halving' else "busca aleatória"
+    st.markdown(f"#### 🎛️ Busca de Hiperparâmetros ({estrategia})")
+    
+    busca_df = pd.DataFrame({
+        'Modelo': list(results.keys()),
+        'Melhores hiperparâmetros': [
+            ", ".join(f"{p}={v}" for p, v in sorted(results[m]['melhores_params'].items())) for m in results
+        ],
+        f"{busca['scoring']} (CV {busca['cv']}-fold)": [f"{results[m]['melhor_score_cv']:.4f}" for m in results],
+        'Tempo da busca (s)': [f"{results[m]['tempo_treino_s']:.2f}" for m in results],
+    })
+    st.dataframe(busca_df, use_container_width=True)
+    
+    curvas = pd.concat([results[m]['curva'].assign(Modelo=m) for m in results], ignore_index=True)
+    fig = px.line(curvas, x='tempo_acumulado_s', y='melhor_score', color='Modelo', markers=True,
+                  hover_data=['etapa', 'candidatos', 'n_registros'],
+                  labels={'tempo_acumulado_s': 'Tempo de ajuste acumulado (s)',
+                          'melhor_score': f"Melhor {busca['scoring']} (CV)"},
+                  title='Curva Tempo x Qualidade da Busca')
+    mostrar_plotly(fig, use_container_width=True)
+    if busca['estrategia'] == 'halving':
+        detalhe = (f"Cada ponto é uma rodada: o melhor 1/{busca['fator']} dos candidatos segue para a próxima, "
+                   f"com {busca['fator']}x mais registros.")
+    else:
+        detalhe = "Cada ponto é um candidato avaliado; o score é o melhor até ali."
+    st.caption(f"{busca['n_candidatos']} candidatos por modelo. {detalhe} Tempo somado sobre os folds (CPU dos "
+               "workers). Os modelos reajustados com a melhor configuração são avaliados no mesmo conjunto de "
+               "teste dos modelos fixos.")
+
+@instrumentar
+def show_simulator(classificacao, perfis, zonas, perfis_zona, versao):
+    st.markdown('<h2 class="sub-header">🔮 Simulador de Integração</h2>', 
+                unsafe_allow_html=True)
+    
+    st.markdown("""
+    <div class="insight-box">
+    <b>🎯 Objetivo:</b> Usar os classificadores treinados para prever a probabilidade de uma pessoa usar
+    integração multimodal a partir de renda, faixa etária, sexo e número de modais, para um registro, para
+    um lote de registros ou para um cenário de planejamento (ex.: a renda de um bairro subindo uma faixa).
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Modelos já persistidos (registro em disco ou artefatos): nada é treinado de novo se a chave existir
+    if 'registro' in classificacao:
+        registros = {'Padrão': classificacao['registro']}
+        if classificacao.get('busca') is not None:
+            registros['Ajustados (busca)'] = classificacao['busca']
+    else:
+        X, y = classificacao['X'], classificacao['y']
+        # O simulador só lê o registro: o treino fica com a página de classificação ou o precompute.py
+        if not os.path.exists(caminho_registro(chave_registro(X, y))):
+            st.info("ℹ️ Nenhum modelo treinado para esta versão dos dados. Treine-os na página "
+                    "\"〽️ Modelos de Classificação\" ou gere os artefatos com `python precompute.py`.")
+            return
+        with st.spinner("Carregando modelos..."), etapa('treino'):
+            registros = {'Padrão': load_classification_results(chave_registro(X, y), X, y)}
+            # Modelos ajustados só quando a busca já está no registro (a página não dispara a busca)
+            if os.path.exists(caminho_registro(chave_busca(X, y), prefixo='busca')):
+                registros['Ajustados (busca)'] = load_tuned_results(chave_busca(X, y), X, y)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        fonte = st.radio("Modelos", list(registros), horizontal=True, key='simulador_fonte')
+    preditor = load_predictor((versao, fonte), registros[fonte])
+    with col2:
+        modelo = st.selectbox("Modelo", list(preditor.modelos), key='simulador_modelo')
+    
+    st.markdown("---")
+    
+    # Um registro: probabilidade em todos os modelos
+    st.markdown("### 👤 Prever um Registro")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        renda = st.selectbox("Renda", list(range(RENDA_MIN, RENDA_MAX + 1)), format_func=RENDA_MAP.get,
+                             index=2, key='simulador_renda')
+    with col2:
+        faixa_etaria = st.selectbox("Faixa etária", [3, 4, 5], format_func=FAIXA_ETARIA_MAP.get, index=1,
+                                    key='simulador_faixa')
+    with col3:
+        sexo = st.selectbox("Sexo", list(SEXO_MAP), format_func=SEXO_MAP.get, key='simulador_sexo')
+    with col4:
+        n_modais = st.number_input("Nº de modais (trabalho)", min_value=1, max_value=5, value=1,
+                                   key='simulador_modais')
+    registro = [[renda, faixa_etaria, sexo, int(n_modais)]]
+    previsoes = pd.DataFrame({
+        'Modelo': list(preditor.modelos),
+        'P(usa integração)': [preditor.probabilidades(registro, m)[0] for m in preditor.modelos],
+    })
+    fig = px.bar(previsoes, x='P(usa integração)', y='Modelo', orientation='h', range_x=[0, 1],
+                 text_auto='.3f', title='Probabilidade de uso de integração por modelo')
+    mostrar_plotly(fig, use_container_width=True)
+    
+    st.markdown("---")
+    
+    # Lote: um predict_proba sobre as combinações distintas do lote
+    st.markdown("### 📦 Prever um Lote")
+    arquivo = st.file_uploader("CSV com as colunas " + ", ".join(FEATURES), type='csv', key='simulador_csv')
+    if arquivo is not None:
+        lote = pd.read_csv(arquivo)
+        origem = f"arquivo {arquivo.name}"
+    elif perfis['contagem'].sum() > 0:
+        # Sem arquivo: registros sorteados dos perfis do recorte, na proporção da contagem
+        n_lote = st.select_slider("Registros no lote sintético", [1_000, 10_000, 100_000, 1_000_000],
+                                  value=100_000, key='simulador_n_lote')
+        pesos = perfis['contagem'].to_numpy(dtype=float)
+        sorteio = np.random.default_rng(42).choice(len(perfis), size=n_lote, p=pesos / pesos.sum())
+        lote = perfis[FEATURES].iloc[sorteio].reset_index(drop=True)
+        origem = "lote sintético sorteado dos perfis do recorte"
+    else:
+        lote = None
+    
+    if lote is not None:
+        try:
+            with etapa('previsao_lote'):
+                probabilidades, medicao = preditor.prever_lote(lote, modelo)
+        except ValueError as erro:
+            st.error(f"❌ {erro}")
+        else:
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Registros", f"{medicao['registros']:,}")
+            with col2:
+                st.metric("Combinações distintas", f"{medicao['distintos']:,}")
+            with col3:
+                st.metric("Registros/s", f"{medicao['registros_por_s']:,.0f}")
+            with col4:
+                st.metric("Participação prevista", f"{np.nanmean(probabilidades) * 100:.1f}%"
+                          if medicao['validos'] else "-")
+            st.caption(f"Origem: {origem}. {medicao['segundos'] * 1000:.1f} ms com {modelo}; registros fora do "
+                       f"domínio dos modelos ({medicao['registros'] - medicao['validos']:,}) ficam sem previsão.")
+            resultado = lote.assign(probabilidade=probabilidades)
+            st.dataframe(resultado.head(100), use_container_width=True)
+            st.download_button("⬇️ Baixar previsões (CSV)", resultado.to_csv(index=False).encode('utf-8'),
+                               file_name='previsoes_integracao.csv', mime='text/csv')
+    
+    st.markdown("---")
+    
+    # Cenário: renda de um bairro deslocada, participação prevista ponderada pela contagem dos perfis
+    st.markdown("### 🏘️ Cenário de Renda por Bairro")
+    # Bairros do recorte, dos mais populosos; os perfis de um bairro são recalculados só com os seus registros
+    zonas = zonas[zonas > 0].sort_values(ascending=False, kind='stable')
+    if zonas.empty:
+        st.info("📊 Nenhum perfil no recorte selecionado.")
+        return
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        zona = st.selectbox("Bairro", list(zonas.index), format_func=lambda z: f'{z[1]} ({z[0]})',
+                            key='simulador_bairro')
+    with col2:
+        deslocamento = st.slider("Deslocamento da renda (faixas)", min_value=-3, max_value=3, value=1,
+                                 key='simulador_deslocamento')
+    cidade, bairro = zona
+    perfis_bairro = perfis_zona(cidade, bairro)
+    if perfis_bairro['contagem'].sum() == 0:
+        st.info(f"📊 Nenhum perfil de {bairro} ({cidade}) no domínio dos modelos.")
+        return
+    with etapa('cenario_renda'):
+        curva = curva_renda(preditor, perfis_bairro, modelo).set_index('deslocamento')
+    base, cenario = curva.loc[0, 'participacao_prevista'], curva.loc[deslocamento, 'participacao_prevista']
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Observada", f"{curva['participacao_observada'].iloc[0]:.1f}%")
+    with col2:
+        st.metric("Prevista (atual)", f"{base:.1f}%")
+    with col3:
+        st.metric("Prevista (cenário)", f"{cenario:.1f}%")
+    with col4:
+        st.metric("Variação", f"{cenario - base:+.1f} p.p.")
+    
+    fig = px.line(curva.reset_index(), x='deslocamento', y=['participacao_prevista', 'participacao_observada'],
+                  markers=True, labels={'deslocamento': 'Deslocamento da renda (faixas)', 'value': '%',
+                                        'variable': 'Participação'},
+                  title=f'Uso de integração previsto em {bairro} ({cidade}) conforme a renda')
+    mostrar_plotly(fig, use_container_width=True)
+    st.caption(f"{perfis_bairro['contagem'].sum():,.0f} pessoas no domínio dos modelos. A renda é limitada às "
+               f"faixas {RENDA_MAP[RENDA_MIN]} a {RENDA_MAP[RENDA_MAX]}; o filtro global recorta os perfis do "
+               "cenário, mas os modelos foram treinados com a população completa.")
+
+@instrumentar
+def show_conclusions():
     st.markdown('<h2 class="sub-header">📝 Conclusões e Insights</h2>', 
                 unsafe_allow_html=True)
     
@@ -0,0 +1,421 @@
+"""Artefatos pré-computados do dashboard.
+
+Cada página é respondida por um artefato (cubos de contagens, modal share,
+combinações de modais, fluxos origem-destino, usuários por terminal,
+pontos da regressão, perfis do simulador, classificadores). No modo normal
+eles são calculados a partir do dataframe preparado; o ``precompute.py``
+materializa todos em um diretório versionado e, com
+``DASHBOARD_MODO=precomputado``, o app apenas lê esse diretório, sem carregar o
+dataset. Cada execução grava um build em um diretório próprio, e o ponteiro
+``atual`` da versão é trocado de uma vez para publicá-lo. Os agregados não
+carregam as dimensões do filtro global: o recorte da sidebar seleciona
+registros (``filtros.IndiceFiltros``) e o agregado da página é recalculado
+só com eles. Para isso, o modo precomputado guarda
+também as colunas dos registros que os agregados usam (``registros/``, um
+Parquet por bloco da ingestão), lidas apenas quando o filtro é usado.
+"""
+import glob
+import json
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from agregacao import CUBOS, MEDIDAS, carregar_cubo, construir_cubo, contar_grupos
+from dados import COLUNA_PESO, identidade_csv
+from filtros import filtro_registros
+from fluxos import COLUNAS_DESTINO, COLUNAS_ORIGEM, CONTEXTOS_OD, calcular_fluxos
+from modais import contar_modais_por_grupo, popcount
+from modelos import (FEATURES, N_JOBS_PADRAO, carregar_ou_buscar, carregar_ou_treinar, carregar_ou_validar,
+                     config_ajustada, perfis_classificacao, pontos_regressao_renda, preparar_dados_classificacao,
+                     resumo_classificacao)
+from preparacao import categorizar, concatenar
+from terminais import COLUNAS_QUEBRAS, CONTEXTOS_TERMINAL, calcular_terminais
+
+# Incrementar sempre que o formato de algum artefato mudar
+VERSAO_ARTEFATOS = 10
+
+DIR_ARTEFATOS = os.environ.get(
+    'DASHBOARD_ARTEFATOS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artefatos')
+)
+
+# Arquivo, dentro do diretório da versão, com o nome do build publicado
+PONTEIRO_ATUAL = 'atual'
+
+MODO_PRECOMPUTADO = os.environ.get('DASHBOARD_MODO', '').lower() == 'precomputado'
+
+# Contexto -> (coluna de modais, coluna de tipo de trajeto, coluna de bitmask)
+CONTEXTOS = {
+    'trabalho': ('meio_transporte_trab', 'tipo_trajeto_trabalho', 'modal_trabalho_mask'),
+    'aula': ('transporte_aula', 'tipo_trajeto_aula', 'modal_aula_mask'),
+    'filhos': ('meios_transporte_filhos', 'tipo_trajeto_filhos', 'modal_filhos_mask'),
+}
+
+# Colunas dos registros lidas pelos agregados (recalculados no recorte do filtro global)
+COLUNAS_REGISTROS = list(dict.fromkeys([
+    *(coluna for colunas in CUBOS.values() for coluna in colunas),
+    *(coluna for colunas in CONTEXTOS.values() for coluna in colunas),
+    *(coluna for colunas in CONTEXTOS_OD.values() for coluna in colunas[:3]),
+    *(coluna for colunas in CONTEXTOS_TERMINAL.values() for coluna in colunas),
+    'num_modais_trabalho', 'num_modais_declarados_trabalho', 'utiliza_terminal_int_trabalho',
+    'utiliza_integracao_aula', COLUNA_PESO,
+]))
+
+K_FOLDS_PADRAO = 5
+
+
+# ==================== CÁLCULO ====================
+def calcular_modal_share(df):
+    """Contagem de cada modal por contexto (formato longo)"""
+    partes = []
+    for contexto, (coluna, _, _) in CONTEXTOS.items():
+        contagens = contar_modais_por_grupo(contar_grupos(df, [coluna]), coluna)
+        contagens.insert(0, 'contexto', contexto)
+        partes.append(contagens)
+    modal_share = pd.concat(partes, ignore_index=True)
+    modal_share['modal'] = modal_share['modal'].astype(str)
+    modal_share['contagem'] = modal_share['contagem'].astype(np.int64)
+    return modal_share
+
+
+def calcular_combinacoes(df):
+    """Contagem de cada combinação de 2+ modais em trajetos multimodais.
+
+    Uma linha por (contexto, bairro de residência, bitmask), de modo que a
+    página separa o top por bairro somando poucas linhas em vez de varrer os
+    registros; os filtros de sexo, idade e renda da página recortam os
+    registros, como o filtro global.
+    """
+    partes = []
+    for contexto, (_, tipo, mascara) in CONTEXTOS.items():
+        multimodais = df.loc[
+            (df[tipo] == 'multimodal') & (popcount(df[mascara]) > 1),
+            [c for c in ['bairro_residencia', mascara, COLUNA_PESO] if c in df.columns]
+        ]
+        contagens = contar_grupos(multimodais, ['bairro_residencia', mascara]).rename(columns={mascara: 'mascara'})
+        contagens.insert(0, 'contexto', contexto)
+        partes.append(contagens)
+    combinacoes = pd.concat(partes, ignore_index=True)
+    combinacoes['mascara'] = combinacoes['mascara'].astype(np.uint16)
+    return combinacoes
+
+
+def calcular_agregados(df):
+    """Artefatos somáveis entre blocos de linhas (contagens) de um dataframe preparado"""
+    return {
+        **{nome: construir_cubo(df, nome) for nome in CUBOS},
+        'modal_share': calcular_modal_share(df),
+        'combinacoes': calcular_combinacoes(df),
+        'fluxos': calcular_fluxos(df),
+        'terminais': calcular_terminais(df),
+        'pontos_regressao': pontos_regressao_renda(df),
+        'perfis': perfis_classificacao(df),
+    }
+
+
+# Chaves de cada agregado: as medidas (contagem, peso) de linhas com a mesma chave são somadas
+CHAVES_AGREGADOS = {
+    **CUBOS,
+    'modal_share': ['contexto', 'modal'],
+    'combinacoes': ['contexto', 'bairro_residencia', 'mascara'],
+    'fluxos': ['contexto'] + COLUNAS_ORIGEM + COLUNAS_DESTINO,
+    'terminais': ['contexto', 'quebra', 'terminal'] + COLUNAS_QUEBRAS,
+    'pontos_regressao': ['renda', 'num_modais_trabalho'],
+    'perfis': FEATURES + ['usa_integracao'],
+}
+
+
+def combinar_tabelas(nome, tabelas):
+    """Soma as medidas das linhas com a mesma chave em várias partes de um agregado"""
+    tabela = concatenar(tabelas)
+    medidas = [c for c in MEDIDAS if c in tabela.columns]
+    return tabela.groupby(CHAVES_AGREGADOS[nome], dropna=False, sort=False, observed=True)[medidas].sum().reset_index()
+
+
+def combinar_agregados(*partes):
+    """Soma as contagens de vários conjuntos de agregados (de blocos ou arquivos diferentes)"""
+    return {nome: combinar_tabelas(nome, [parte[nome] for parte in partes]) for nome in CHAVES_AGREGADOS}
+
+
+def calcular_agregado(nome, df):
+    """Um agregado somável calculado direto do dataframe preparado (sem os cubos persistidos)"""
+    return construir_cubo(df, nome) if nome in CUBOS else calcular_artefato(nome, df)
+
+
+def calcular_recorte(nome, registros, indice, *filtros):
+    """Agregado recalculado só com os registros que atendem a todos os ``filtros`` ({dimensão: valores}).
+
+    Nos agregados por contexto, o contexto escolhido seleciona as linhas do
+    agregado; nos demais, as pessoas com trajeto declarado nele.
+    """
+    por_contexto = 'contexto' in CHAVES_AGREGADOS[nome]
+    selecao = sum((filtro_registros(filtro, por_contexto) for filtro in filtros), ())
+    tabela = calcular_agregado(nome, registros.take(indice.posicoes(selecao)))
+    for filtro in filtros:
+        if por_contexto and filtro.get('contexto'):
+            tabela = tabela[tabela['contexto'].isin(filtro['contexto'])].reset_index(drop=True)
+    return tabela
+
+
+def hash_chaves(nome, tabela):
+    """Hash (uint64) da chave de cada linha de um agregado (categóricas e texto têm o mesmo hash)"""
+    return pd.util.hash_pandas_object(tabela[CHAVES_AGREGADOS[nome]], index=False).to_numpy()
+
+
+def atualizar_agregado(nome, tabela, hashes, adicionadas, removidas):
+    """Agregado de uma nova versão do dataset a partir do anterior e só das linhas que mudaram.
+
+    As medidas das linhas removidas entram na diferença com sinal negativo.
+    As chaves da diferença são localizadas na tabela pelo hash (``hashes``,
+    um por linha), então só as linhas afetadas são somadas, sem reagrupar a
+    tabela inteira; chaves novas vão para o fim e as que ficam sem nenhum
+    registro saem. Retorna a tabela e os hashes das suas linhas.
+    """
+    partes = []
+    if len(adicionadas):
+        partes.append(calcular_agregado(nome, adicionadas))
+    if len(removidas):
+        negativas = calcular_agregado(nome, removidas)
+        medidas = [c for c in MEDIDAS if c in negativas.columns]
+        negativas[medidas] = -negativas[medidas]
+        partes.append(negativas)
+    if not partes:
+        return tabela, hashes
+
+    diferenca = combinar_tabelas(nome, partes)
+    hashes_diferenca = hash_chaves(nome, diferenca)
+    posicoes = pd.Index(hashes).get_indexer(hashes_diferenca)
+    existentes = posicoes >= 0
+
+    medidas = {}
+    for medida in (c for c in MEDIDAS if c in tabela.columns):
+        valores = tabela[medida].to_numpy(copy=True)
+        valores[posicoes[existentes]] += diferenca[medida].to_numpy()[existentes]
+        medidas[medida] = valores
+    atualizada = concatenar([tabela.assign(**medidas), diferenca[~existentes]])
+    hashes = np.concatenate([hashes, hashes_diferenca[~existentes]])
+
+    manter = atualizada['contagem'].to_numpy() != 0
+    return categorizar(atualizada[manter].reset_index(drop=True)), hashes[manter]
+
+
+def ordenar_contagens(df):
+    """Ordena por contexto (na ordem de CONTEXTOS) e contagem decrescente"""
+    ordem = df['contexto'].map({c: i for i, c in enumerate(CONTEXTOS)})
+    return (
+        df.assign(_ordem=ordem, _contagem=-df['contagem'])
+        .sort_values(['_ordem', '_contagem'], kind='stable')
+        .drop(columns=['_ordem', '_contagem'])
+        .reset_index(drop=True)
+    )
+
+
+def calcular_classificacao(df):
+    """Dados de treino (X, y) e resumo para a página de classificação"""
+    X, y = preparar_dados_classificacao(df)
+    return {'X': X, 'y': y, 'resumo': resumo_classificacao(X, y)}
+
+
+def calcular_artefato(nome, df, origem=None):
+    """Calcula um artefato a partir do dataframe preparado (modo normal).
+
+    ``origem`` é o (caminho, identidade) do CSV de ``df``; com ele, os cubos
+    são lidos do Parquet persistido desse arquivo ou gravados ao lado dele.
+    """
+    if nome in CUBOS:
+        return construir_cubo(df, nome) if origem is None else carregar_cubo(*origem, nome, df)
+    if nome == 'modal_share':
+        return calcular_modal_share(df)
+    if nome == 'combinacoes':
+        return calcular_combinacoes(df)
+    if nome == 'fluxos':
+        return calcular_fluxos(df)
+    if nome == 'terminais':
+        return calcular_terminais(df)
+    if nome == 'pontos_regressao':
+        return pontos_regressao_renda(df)
+    if nome == 'perfis':
+        return perfis_classificacao(df)
+    if nome == 'classificacao':
+        return calcular_classificacao(df)
+    raise KeyError(f"Artefato desconhecido: {nome}")
+
+
+# ==================== MATERIALIZAÇÃO ====================
+def diretorio_versao(raiz=DIR_ARTEFATOS):
+    """Diretório dos builds da versão de formato atual"""
+    return os.path.join(raiz, f'v{VERSAO_ARTEFATOS}')
+
+
+def build_atual(raiz=DIR_ARTEFATOS):
+    """Nome do build publicado (lido do ponteiro), ou None se ainda não houver"""
+    try:
+        with open(os.path.join(diretorio_versao(raiz), PONTEIRO_ATUAL), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def diretorio_build(raiz=DIR_ARTEFATOS, build=None):
+    """Diretório de um build dos artefatos; sem ``build``, o publicado"""
+    build = build or build_atual(raiz)
+    origem = diretorio_versao(raiz) if build is None else os.path.join(diretorio_versao(raiz), build)
+    if build is None or not os.path.isdir(origem):
+        raise FileNotFoundError(f"Artefatos não encontrados em {origem}. Gere-os com: python precompute.py")
+    return origem
+
+
+def identificar_fontes(caminhos_csv):
+    """Identidade de cada arquivo de origem (caminho, tamanho, mtime em ns), como em dados.identidade_csv"""
+    fontes = []
+    for caminho in caminhos_csv:
+        tamanho, mtime_ns = identidade_csv(caminho)
+        fontes.append({'caminho': os.path.abspath(caminho), 'tamanho': tamanho, 'mtime_ns': mtime_ns})
+    return fontes
+
+
+def gravar_registros(df, destino, parte=0):
+    """Grava as colunas dos registros usadas pelos agregados como uma parte (Parquet) de ``destino``"""
+    os.makedirs(destino, exist_ok=True)
+    colunas = [c for c in COLUNAS_REGISTROS if c in df.columns]
+    df[colunas].to_parquet(os.path.join(destino, f'parte-{parte:05d}.parquet'), index=False)
+
+
+def materializar(agregados, X, y, n_linhas, n_colunas, raiz=DIR_ARTEFATOS, n_jobs=N_JOBS_PADRAO,
+                 k_folds=K_FOLDS_PADRAO, log=print, treino=None, busca=None, registros=None, fontes=None):
+    """Grava os agregados e treina/grava os classificadores em um build novo e o publica de uma vez.
+
+    O build é gravado no seu próprio diretório e publicado por um único
+    os.replace do ponteiro ``atual``. O build anterior é mantido, para que um
+    app que já leu os seus artefatos ainda consiga ler os registros dele; os
+    mais antigos são removidos. ``registros`` é o diretório com as partes
+    gravadas por ``gravar_registros`` (movido para dentro do build) e
+    ``fontes`` a identidade dos arquivos lidos (identificar_fontes), guardada
+    no manifesto.
+
+    Com ``treino`` (o TreinoIncremental que recebeu os blocos na ingestão), X
+    e y não são usados: os classificadores saem do treino incremental, sem
+    validação cruzada. Com ``busca`` (a estratégia: 'halving' ou 'aleatoria'),
+    também são gravados os modelos da busca de hiperparâmetros e a validação
+    cruzada deles.
+    """
+    versao = diretorio_versao(raiz)
+    build = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    destino = os.path.join(versao, build)
+    tmp = f'{destino}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    if registros is not None:
+        shutil.move(registros, os.path.join(tmp, 'registros'))
+
+    tempos = {}
+
+    def etapa(nome, func):
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos[nome] = round(time.perf_counter() - inicio, 3)
+        log(f"  {nome}: {tempos[nome]:.2f}s")
+        return resultado
+
+    for nome in CUBOS:
+        agregados[nome].to_parquet(os.path.join(tmp, f'{nome}.parquet'), index=False)
+    ordenar_contagens(agregados['modal_share']).to_parquet(os.path.join(tmp, 'modal_share.parquet'), index=False)
+    ordenar_contagens(agregados['combinacoes']).to_parquet(os.path.join(tmp, 'combinacoes.parquet'), index=False)
+    agregados['fluxos'].to_parquet(os.path.join(tmp, 'fluxos.parquet'), index=False)
+    agregados['terminais'].to_parquet(os.path.join(tmp, 'terminais.parquet'), index=False)
+    agregados['pontos_regressao'].to_parquet(os.path.join(tmp, 'pontos_regressao.parquet'), index=False)
+    agregados['perfis'].to_parquet(os.path.join(tmp, 'perfis.parquet'), index=False)
+
+    ajustado = cv_ajustado = None
+    if treino is not None:
+        registro = etapa('classificacao', treino.finalizar)
+        resumo, cv = treino.resumo(), None
+    else:
+        registro = etapa('classificacao', lambda: carregar_ou_treinar(X, y, n_jobs=n_jobs))
+        cv = etapa('validacao_cruzada', lambda: carregar_ou_validar(X, y, k_folds, n_jobs=n_jobs))
+        resumo = resumo_classificacao(X, y)
+        if busca is not None:
+            ajustado = etapa('busca', lambda: carregar_ou_buscar(X, y, estrategia=busca, n_jobs=n_jobs, log=log))
+            cv_ajustado = etapa('validacao_cruzada_busca', lambda: carregar_ou_validar(
+                X, y, k_folds, ajustado['chave'], config_ajustada(ajustado), n_jobs))
+    joblib.dump(
+        {'resumo': resumo, 'registro': registro, 'cv': cv, 'busca': ajustado, 'cv_busca': cv_ajustado},
+        os.path.join(tmp, 'classificacao.joblib'),
+    )
+
+    manifesto = {
+        'versao': VERSAO_ARTEFATOS,
+        'build': build,
+        'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'fontes': fontes or [],
+        'n_linhas': int(n_linhas),
+        'n_colunas': int(n_colunas),
+        'chave_modelos': registro['chave'],
+        'tempos_s': tempos,
+    }
+    with open(os.path.join(tmp, 'manifesto.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+
+    # O build completo ganha o nome final e só então o ponteiro é trocado (um único os.replace)
+    os.replace(tmp, destino)
+    anterior = build_atual(raiz)
+    ponteiro = os.path.join(versao, f'{PONTEIRO_ATUAL}.{os.getpid()}.tmp')
+    with open(ponteiro, 'w', encoding='utf-8') as f:
+        f.write(build)
+    os.replace(ponteiro, os.path.join(versao, PONTEIRO_ATUAL))
+
+    # Mantém o build publicado e o anterior; os demais (e builds interrompidos) são removidos
+    for nome in os.listdir(versao):
+        if nome not in (build, anterior, PONTEIRO_ATUAL) and not nome.endswith('.tmp'):
+            shutil.rmtree(os.path.join(versao, nome), ignore_errors=True)
+    return destino
+
+
+def materializar_dataframe(df, raiz=DIR_ARTEFATOS, n_jobs=N_JOBS_PADRAO, k_folds=K_FOLDS_PADRAO, log=print,
+                           busca=None, fontes=None):
+    """Materializa os artefatos a partir do dataframe preparado completo (em memória)"""
+    X, y = preparar_dados_classificacao(df)
+    registros = f'{diretorio_versao(raiz)}.registros.{os.getpid()}.tmp'
+    shutil.rmtree(registros, ignore_errors=True)
+    gravar_registros(df, registros)
+    return materializar(calcular_agregados(df), X, y, len(df), len(df.columns), raiz, n_jobs, k_folds, log,
+                        busca=busca, registros=registros, fontes=fontes)
+
+
+# ==================== LEITURA ====================
+def carregar_artefatos(raiz=DIR_ARTEFATOS):
+    """Lê todos os artefatos do build publicado (modo precomputado)"""
+    origem = diretorio_build(raiz)
+    with open(os.path.join(origem, 'manifesto.json'), encoding='utf-8') as f:
+        manifesto = json.load(f)
+
+    classificacao = joblib.load(os.path.join(origem, 'classificacao.joblib'))
+    return {
+        'manifesto': manifesto,
+        **{nome: pd.read_parquet(os.path.join(origem, f'{nome}.parquet')) for nome in CUBOS},
+        'modal_share': pd.read_parquet(os.path.join(origem, 'modal_share.parquet')),
+        'combinacoes': pd.read_parquet(os.path.join(origem, 'combinacoes.parquet')),
+        'fluxos': pd.read_parquet(os.path.join(origem, 'fluxos.parquet')),
+        'terminais': pd.read_parquet(os.path.join(origem, 'terminais.parquet')),
+        'pontos_regressao': pd.read_parquet(os.path.join(origem, 'pontos_regressao.parquet')),
+        'perfis': pd.read_parquet(os.path.join(origem, 'perfis.parquet')),
+        'classificacao': classificacao,
+    }
+
+
+def carregar_registros(raiz=DIR_ARTEFATOS, build=None):
+    """Registros materializados de um build (todas as partes, com a união das categorias), para o filtro global.
+
+    ``build`` é o do manifesto dos artefatos já carregados, para que os
+    registros sejam os da mesma execução do precompute mesmo depois de um
+    build novo ser publicado.
+    """
+    origem = diretorio_build(raiz, build)
+    partes = sorted(glob.glob(os.path.join(origem, 'registros', 'parte-*.parquet')))
+    if not partes:
+        raise FileNotFoundError(f"Registros não encontrados em {origem}. Gere os artefatos com: python precompute.py")
+    return categorizar(concatenar([pd.read_parquet(parte) for parte in partes]))
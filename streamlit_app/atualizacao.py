@@ -0,0 +1,202 @@
+"""Atualização incremental do dataset no modo normal (sem reiniciar o app).
+
+O app trabalha sobre um snapshot: o dataframe preparado, o hash de cada linha
+do arquivo de origem e os agregados das páginas já calculados. Quando o CSV
+muda em disco (ex.: um ``dataset2.csv`` corrigido copiado para ``/app/dados``),
+o arquivo novo é lido e suas linhas são casadas com as do snapshot pelo hash
+do conteúdo. Só as linhas novas ou alteradas passam pelo prepare_data; os
+agregados são atualizados pela diferença (somando as linhas adicionadas e
+subtraindo as removidas), sem reconstruí-los.
+
+A atualização roda em uma thread de fundo e o snapshot novo substitui o
+anterior de uma vez. Cada execução do script pega o snapshot atual no
+início e o usa até o fim, então as sessões em andamento terminam sobre o
+anterior.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from agregacao import CUBOS, caminhos_cubo
+from artefatos import CHAVES_AGREGADOS, atualizar_agregado, calcular_artefato, hash_chaves
+from dados import carregar_dataset, gravar_parquet, identidade_csv
+from preparacao import categorizar, concatenar, preparar_dados, somente_leitura
+
+logger = logging.getLogger('dashboard.atualizacao')
+
+# O arquivo precisa estar sem alterações há este tempo antes de ser lido (cópia em andamento)
+ESPERA_ARQUIVO_ESTAVEL = 2.0
+
+# Espera antes de tentar de novo uma versão do arquivo cuja atualização falhou (dobra a cada falha)
+ESPERA_NOVA_TENTATIVA = 60.0
+ESPERA_NOVA_TENTATIVA_MAX = 3600.0
+
+# Acima desta fração de linhas alteradas, reconstruir tudo sai mais barato que a diferença
+LIMITE_DELTA = 0.5
+
+
+def hash_linhas(bruto):
+    """Hash (uint64) do conteúdo de cada linha do dataset lido do arquivo"""
+    return pd.util.hash_pandas_object(bruto, index=False).to_numpy()
+
+
+def ocorrencias(hashes):
+    """Número da ocorrência de cada hash (0 na primeira, 1 na segunda...), para casar linhas repetidas"""
+    return pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+
+
+def casar_linhas(hashes_anteriores, hashes_novos):
+    """Posição no snapshot anterior de cada linha nova com o mesmo conteúdo (-1 se não houver)"""
+    anteriores = pd.DataFrame({
+        'hash': hashes_anteriores,
+        'ocorrencia': ocorrencias(hashes_anteriores),
+        'posicao': np.arange(len(hashes_anteriores)),
+    })
+    novos = pd.DataFrame({'hash': hashes_novos, 'ocorrencia': ocorrencias(hashes_novos)})
+    posicoes = novos.merge(anteriores, on=['hash', 'ocorrencia'], how='left', sort=False)['posicao']
+    return posicoes.fillna(-1).to_numpy(dtype=np.int64)
+
+
+class Snapshot:
+    """Uma versão do dataset: dataframe preparado, hashes das linhas e agregados (calculados sob demanda)"""
+
+    def __init__(self, caminho, identidade, dados, hashes, tipos, agregados=None, hashes_agregados=None):
+        self.caminho = caminho
+        self.identidade = identidade
+        self.versao = (caminho, identidade)
+        self.dados = dados
+        self.hashes = hashes
+        self.tipos = tipos
+        self._agregados = dict(agregados or {})
+        self._hashes_agregados = dict(hashes_agregados or {})
+        self._lock = threading.Lock()
+
+    def agregado(self, nome):
+        """Artefato de uma página para esta versão (calculado uma vez)"""
+        with self._lock:
+            if nome not in self._agregados:
+                self._agregados[nome] = calcular_artefato(nome, self.dados, self.versao)
+            return self._agregados[nome]
+
+    def agregados_calculados(self):
+        """Agregados somáveis já calculados e o hash das chaves das suas linhas: {nome: (tabela, hashes)}.
+
+        São os que a atualização incremental mantém; os hashes de cada tabela
+        são calculados uma vez e passados adiante entre as versões.
+        """
+        with self._lock:
+            agregados = {nome: tabela for nome, tabela in self._agregados.items() if nome in CHAVES_AGREGADOS}
+        for nome, tabela in agregados.items():
+            if nome not in self._hashes_agregados:
+                self._hashes_agregados[nome] = hash_chaves(nome, tabela)
+        return {nome: (tabela, self._hashes_agregados[nome]) for nome, tabela in agregados.items()}
+
+
+def carregar_snapshot(caminho, identidade):
+    """Snapshot completo: lê e prepara todas as linhas"""
+    bruto = carregar_dataset(caminho_csv=caminho)
+    hashes, tipos = hash_linhas(bruto), bruto.dtypes.to_dict()
+    return Snapshot(caminho, identidade, somente_leitura(preparar_dados(bruto)), hashes, tipos)
+
+
+def atualizar_snapshot(anterior, caminho, identidade, log=logger.info):
+    """Snapshot da nova versão do arquivo reaproveitando as linhas e os agregados do anterior"""
+    inicio = time.perf_counter()
+    bruto = carregar_dataset(caminho_csv=caminho)
+    hashes, tipos = hash_linhas(bruto), bruto.dtypes.to_dict()
+
+    # Colunas ou tipos diferentes mudam o prepare_data de todas as linhas
+    if tipos != anterior.tipos:
+        log("Atualização: colunas ou tipos do arquivo mudaram; preparando o dataset completo")
+        return Snapshot(caminho, identidade, somente_leitura(preparar_dados(bruto)), hashes, tipos)
+
+    posicoes = casar_linhas(anterior.hashes, hashes)
+    mantidas = posicoes >= 0
+    removidas = np.setdiff1d(np.arange(len(anterior.hashes)), posicoes[mantidas], assume_unique=True)
+    n_novas = int((~mantidas).sum())
+    if n_novas + len(removidas) > LIMITE_DELTA * max(len(hashes), 1):
+        log(f"Atualização: {n_novas:,} linhas novas e {len(removidas):,} removidas; preparando o dataset completo")
+        return Snapshot(caminho, identidade, somente_leitura(preparar_dados(bruto)), hashes, tipos)
+
+    # Só as linhas novas ou alteradas passam pelo prepare_data
+    novas = preparar_dados(bruto[~mantidas].reset_index(drop=True))
+    partes = [anterior.dados.take(posicoes[mantidas]), novas]
+    ordem = np.argsort(np.concatenate([np.flatnonzero(mantidas), np.flatnonzero(~mantidas)]), kind='stable')
+    dados = categorizar(concatenar(partes).take(ordem).reset_index(drop=True))
+
+    linhas_removidas = anterior.dados.take(removidas)
+    agregados, hashes_agregados = {}, {}
+    for nome, (tabela, hashes_tabela) in anterior.agregados_calculados().items():
+        agregados[nome], hashes_agregados[nome] = atualizar_agregado(nome, tabela, hashes_tabela, novas,
+                                                                     linhas_removidas)
+    for nome in CUBOS.keys() & agregados.keys():
+        # Mantém os cubos persistidos em dia para o próximo início do app
+        gravar_parquet(agregados[nome], caminhos_cubo(caminho, nome), identidade)
+
+    log(f"Atualização incremental: {n_novas:,} linhas novas, {len(removidas):,} removidas, "
+        f"{int(mantidas.sum()):,} reaproveitadas ({time.perf_counter() - inicio:.2f}s)")
+    return Snapshot(caminho, identidade, somente_leitura(dados), hashes, tipos, agregados, hashes_agregados)
+
+
+class RepositorioDados:
+    """Snapshot atual do dataset, trocado por inteiro quando o arquivo muda em disco"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._snapshot = carregar_snapshot(caminho, identidade_csv(caminho))
+        self._lock = threading.Lock()
+        self._thread = None
+        self.ultimo_erro = None
+        self._falha = None  # (identidade que falhou, nº de falhas seguidas, instante da próxima tentativa)
+
+    @property
+    def atualizando(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def atual(self):
+        """Snapshot a usar nesta execução; se o arquivo mudou, dispara a atualização em segundo plano"""
+        snapshot = self._snapshot
+        try:
+            estado = os.stat(self.caminho)
+        except OSError:  # Arquivo sendo substituído: segue com o snapshot atual
+            return snapshot
+        identidade = (estado.st_size, estado.st_mtime_ns)
+        estavel = time.time() - estado.st_mtime >= ESPERA_ARQUIVO_ESTAVEL
+        if identidade != snapshot.identidade and estavel and self._pode_tentar(identidade):
+            with self._lock:
+                if not self.atualizando:
+                    self._thread = threading.Thread(target=self._atualizar, args=(snapshot, identidade),
+                                                    name='atualizacao-dataset', daemon=True)
+                    self._thread.start()
+        return snapshot
+
+    def _pode_tentar(self, identidade):
+        """Uma versão que falhou só é tentada de novo depois da espera (o arquivo mudando libera na hora)"""
+        falha = self._falha
+        return falha is None or falha[0] != identidade or time.monotonic() >= falha[2]
+
+    def aguardar(self, timeout=None):
+        """Espera a atualização em andamento terminar (scripts e testes)"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _atualizar(self, anterior, identidade):
+        try:
+            novo = atualizar_snapshot(anterior, self.caminho, identidade)
+            # O arquivo mudou de novo durante a leitura: a próxima execução refaz a atualização
+            if identidade_csv(self.caminho) != identidade:
+                return
+            self._snapshot = novo  # Troca atômica: execuções em andamento mantêm a referência ao anterior
+            self.ultimo_erro = None
+            self._falha = None
+        except Exception as erro:  # noqa: BLE001 - o app segue com o snapshot anterior
+            falhas = self._falha[1] + 1 if self._falha is not None and self._falha[0] == identidade else 1
+            espera = min(ESPERA_NOVA_TENTATIVA * 2 ** (falhas - 1), ESPERA_NOVA_TENTATIVA_MAX)
+            logger.exception("Falha na atualização do dataset (nova tentativa desta versão em %.0fs)", espera)
+            self._falha = (identidade, falhas, time.monotonic() + espera)
+            self.ultimo_erro = erro
@@ -0,0 +1,483 @@
+"""Benchmarks do pipeline de dados e das páginas do dashboard.
+
+Gera datasets sintéticos com as mesmas colunas do dataset2.csv em várias
+escalas (múltiplos do tamanho da pesquisa) e mede:
+
+- ``modais`` / ``combinacoes``: implementações vetorizadas contra as originais
+- ``etapas``: cada etapa do pipeline (leitura, prepare_data, contagens,
+  crosstabs, cubos, treino dos classificadores)
+- ``paginas``: cada página de ponta a ponta pelo AppTest do Streamlit
+  (primeira visita e rerun com cache), em um subprocesso isolado por escala
+- ``inicializacao``: início a frio, em interpretadores limpos: tempo de
+  import do app quebrado por pacote (``python -X importtime``) e tempo até
+  a primeira página pronta
+
+Os resultados podem ser gravados em JSON e comparados com os de outro commit.
+
+Uso:
+    python benchmark.py                                  # todas as suítes, 1x/10x/100x
+    python benchmark.py --suites etapas paginas --escalas 1 10 --saida bench.json
+    python benchmark.py --escalas 1 --comparar bench_main.json
+    python benchmark.py --suites inicializacao --escalas 1   # relatório de inicialização
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from agregacao import CUBOS, construir_cubo
+from artefatos import calcular_agregados
+from dados import COLUNAS_APP, NOME_CSV, carregar_dataset, converter_para_parquet, ler_csv
+from mapeamentos import MODAL_MAP, RENDA_MAP, SEXO_MAP
+from modais import (analisar_modais, classifica_modo, clean_modal, contar_combinacoes, contar_modais,
+                    contar_num_modais, crosstab_modais, nomes_combinacoes)
+from modelos import preparar_dados_classificacao, treinar_modelos
+from preparacao import preparar_dados
+
+TAMANHO_PESQUISA = 58644
+
+COLUNAS_MODAIS = ['meio_transporte_trab', 'transporte_aula', 'meios_transporte_filhos']
+
+SUITES = ['modais', 'combinacoes', 'etapas', 'paginas', 'inicializacao']
+
+# Treinar Random Forest em milhões de linhas leva muitos minutos: acima desta
+# escala o treino (etapa e página de classificação) fica de fora por padrão
+MAX_ESCALA_TREINO = 10
+
+# Métrica comparada entre execuções e colunas que identificam cada medição
+METRICAS_COMPARACAO = {
+    'modais': (['escala'], 'vetorizado_s'),
+    'combinacoes': (['escala'], 'vetorizado_s'),
+    'etapas': (['escala', 'etapa'], 'segundos'),
+    'paginas': (['escala', 'pagina', 'execucao'], 'segundos'),
+    'inicializacao': (['escala', 'etapa'], 'segundos'),
+}
+
+PAGINA_CLASSIFICACAO = "〽️ Modelos de Classificação"
+
+DIR_APP = os.path.dirname(os.path.abspath(__file__))
+
+# Pacotes com menos tempo de import próprio que isso são somados em "outros"
+MIN_IMPORTACAO_S = 0.01
+
+# Respostas de modais no formato do questionário (inclui erros de digitação reais)
+RESPOSTAS_MODAIS = [
+    '0', '', '3', '1', '5', '9', '4', '6', '2', '11', '12', '10',
+    '3, 4', '1, 3', '3,4', '3, 3', '1, 3, 4', '3, 6', '5, 9', '2005', '3, 2005',
+    '3,,4', '3, x', '0, 3', '20',
+]
+PESOS_MODAIS = np.array([
+    30, 3, 25, 10, 8, 4, 2, 3, 1, 1, 1, 1,
+    4, 3, 2, 1, 1, 1, 1, 0.3, 0.2,
+    0.1, 0.1, 0.2, 0.1,
+])
+
+
+# ==================== DADOS SINTÉTICOS ====================
+def gerar_dataset_sintetico(n_linhas, seed=42):
+    """Gera um dataframe com as colunas e domínios de códigos do dataset2.csv"""
+    rng = np.random.default_rng(seed)
+    p = PESOS_MODAIS / PESOS_MODAIS.sum()
+    respostas = np.array(RESPOSTAS_MODAIS, dtype=object)
+
+    def modais():
+        col = respostas[rng.choice(len(respostas), size=n_linhas, p=p)]
+        col[rng.random(n_linhas) < 0.02] = np.nan
+        return col
+
+    bairros = np.array([f'BAIRRO {i:03d}' for i in range(150)], dtype=object)
+    cidades = np.array(['RECIFE', 'OLINDA', 'PAULISTA', 'JABOATAO DOS GUARARAPES',
+                        'CAMARAGIBE', 'CABO DE SANTO AGOSTINHO'], dtype=object)
+    terminais = np.concatenate([np.zeros(40, dtype=int), np.arange(20)])
+
+    return pd.DataFrame({
+        'sexo': rng.choice([1, 2, 0], size=n_linhas, p=[0.48, 0.5, 0.02]),
+        'faixa_etaria': rng.integers(1, 7, n_linhas),
+        'renda': rng.integers(1, 10, n_linhas),
+        'cidade_residencia': cidades[rng.integers(0, len(cidades), n_linhas)],
+        'bairro_residencia': bairros[rng.zipf(1.3, n_linhas) % len(bairros)],
+        'zona_residencia': rng.integers(0, 300, n_linhas),
+        'meios_transporte_filhos': modais(),
+        'utiliza_app_taxi_escola': rng.integers(0, 4, n_linhas),
+        'trabalha': rng.integers(1, 3, n_linhas),
+        'cidade_trabalho': cidades[rng.integers(0, len(cidades), n_linhas)],
+        'bairro_trabalho': bairros[rng.integers(0, len(bairros), n_linhas)],
+        'meio_transporte_trab': modais(),
+        'utiliza_app_taxi_trabalho': rng.integers(0, 4, n_linhas),
+        'utiliza_terminal_int_trabalho': rng.integers(0, 3, n_linhas),
+        'terminal_int_trabalho': terminais[rng.integers(0, len(terminais), n_linhas)],
+        'pesquisado_estuda': rng.integers(1, 3, n_linhas),
+        'cidade_escola': cidades[rng.integers(0, len(cidades), n_linhas)],
+        'bairro_escola': bairros[rng.integers(0, len(bairros), n_linhas)],
+        'transporte_aula': modais(),
+        'utiliza_app_taxi_aula': rng.integers(0, 4, n_linhas),
+        'utiliza_integracao_aula': rng.integers(0, 3, n_linhas),
+        'terminal_aula': terminais[rng.integers(0, len(terminais), n_linhas)],
+    })
+
+
+def cronometrar(func, *args, repeticoes=3):
+    """Melhor tempo (s) de algumas execuções e o resultado da última"""
+    melhor = float('inf')
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func(*args)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+# ==================== PARSING DE MODAIS ====================
+def modais_linha_a_linha(serie):
+    """Implementação original: apply/map por linha"""
+    return serie.apply(clean_modal), serie.map(classifica_modo), serie.apply(contar_num_modais)
+
+
+def bench_modais(escalas, repeticoes=3):
+    """Compara o parser vetorizado com as funções originais e confere igualdade"""
+    linhas = []
+    for escala in escalas:
+        df = gerar_dataset_sintetico(TAMANHO_PESQUISA * escala)
+        reps = 1 if escala >= 100 else repeticoes
+        t_ref = t_vet = 0.0
+        # Uma coluna por vez para não manter milhões de listas duplicadas em memória
+        for col in COLUNAS_MODAIS:
+            t, (listas, tipos, num) = cronometrar(modais_linha_a_linha, df[col], repeticoes=reps)
+            t_ref += t
+            t, vet = cronometrar(analisar_modais, df[col], repeticoes=reps)
+            t_vet += t
+
+            assert listas.tolist() == vet['lista'].tolist(), f'listas divergentes em {col}'
+            assert tipos.tolist() == vet['tipo'].tolist(), f'tipos divergentes em {col}'
+            assert num.tolist() == vet['num_modais'].tolist(), f'nº de modais divergente em {col}'
+            del listas, tipos, num, vet
+
+        linhas.append({
+            'escala': f'{escala}x', 'linhas': len(df),
+            'linha_a_linha_s': round(t_ref, 3), 'vetorizado_s': round(t_vet, 3),
+            'speedup': round(t_ref / t_vet, 1),
+        })
+    return pd.DataFrame(linhas)
+
+
+# ==================== COMBINAÇÕES DE MODAIS ====================
+CONTEXTOS_COMBINACOES = [
+    ('tipo_trajeto_trabalho', 'meio_transporte_trab', 'modal_trabalho_mask'),
+    ('tipo_trajeto_aula', 'transporte_aula', 'modal_aula_mask'),
+    ('tipo_trajeto_filhos', 'meios_transporte_filhos', 'modal_filhos_mask'),
+]
+
+
+def combinacoes_linha_a_linha(df):
+    """Implementação original: clean_modal + frozenset de nomes + Counter, linha a linha.
+
+    Sem alterações em relação ao app original: uma resposta com código repetido
+    ('3, 3') passa no ``len(modais) > 1`` e conta como a combinação unitária
+    'Ônibus'. Com as bitmasks (conjuntos), essas respostas deixaram de contar.
+    """
+    todas = []
+    for tipo, coluna, _ in CONTEXTOS_COMBINACOES:
+        for valor in df.loc[df[tipo] == 'multimodal', coluna].dropna():
+            modais = clean_modal(valor)
+            if len(modais) > 1:
+                todas.append(frozenset(MODAL_MAP.get(m, "Outro") for m in modais))
+    return {" + ".join(sorted(k)): v for k, v in Counter(todas).items()}
+
+
+def combinacoes_vetorizado(df):
+    """Bitmasks dos três contextos contadas com np.unique"""
+    mascaras = np.concatenate([
+        df.loc[df[tipo] == 'multimodal', mascara].to_numpy() for tipo, _, mascara in CONTEXTOS_COMBINACOES
+    ])
+    contagens = contar_combinacoes(mascaras)
+    return dict(zip(nomes_combinacoes(contagens.index), contagens.to_numpy()))
+
+
+def bench_combinacoes(escalas, repeticoes=3):
+    """Compara o contador de combinações vetorizado com o Counter original.
+
+    As contagens precisam ser iguais, exceto pelas combinações unitárias que só
+    o original produz; os registros nelas são reportados em ``unitarias_original``.
+    """
+    linhas = []
+    for escala in escalas:
+        df = preparar_dados(gerar_dataset_sintetico(TAMANHO_PESQUISA * escala))
+        reps = 1 if escala >= 100 else repeticoes
+        t_ref, ref = cronometrar(combinacoes_linha_a_linha, df, repeticoes=reps)
+        t_vet, vet = cronometrar(combinacoes_vetorizado, df, repeticoes=reps)
+        unitarias = {k: v for k, v in ref.items() if ' + ' not in k}
+        assert {k: v for k, v in ref.items() if k not in unitarias} == vet, 'contagens de combinações divergentes'
+        linhas.append({
+            'escala': f'{escala}x', 'linhas': len(df),
+            'linha_a_linha_s': round(t_ref, 3), 'vetorizado_s': round(t_vet, 3),
+            'speedup': round(t_ref / t_vet, 1),
+            'unitarias_original': sum(unitarias.values()),
+        })
+        del df
+    return pd.DataFrame(linhas)
+
+
+# ==================== ETAPAS DO PIPELINE ====================
+def gravar_csv_sintetico(diretorio, n_linhas):
+    """Grava um dataset sintético como ``dataset2.csv`` no diretório e retorna o caminho"""
+    caminho = os.path.join(diretorio, NOME_CSV)
+    gerar_dataset_sintetico(n_linhas).to_csv(caminho, index=False)
+    return caminho
+
+
+def bench_etapas(escalas, repeticoes=3, max_escala_treino=MAX_ESCALA_TREINO):
+    """Tempo de cada etapa do pipeline, do CSV ao treino dos classificadores"""
+    linhas = []
+    for escala in escalas:
+        reps = 1 if escala >= 100 else repeticoes
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho_csv = gravar_csv_sintetico(tmp, TAMANHO_PESQUISA * escala)
+
+            def medir(etapa, func, *args):
+                t, resultado = cronometrar(func, *args, repeticoes=reps)
+                linhas.append({'escala': f'{escala}x', 'etapa': etapa, 'linhas': TAMANHO_PESQUISA * escala,
+                               'segundos': round(t, 4)})
+                return resultado
+
+            medir('ler_csv', ler_csv, caminho_csv, COLUNAS_APP)
+            medir('converter_para_parquet', converter_para_parquet, caminho_csv)
+            bruto = medir('load_data', carregar_dataset, COLUNAS_APP, caminho_csv)
+            # prepare_data altera o dataframe recebido: cada repetição usa uma cópia
+            df = medir('prepare_data', lambda: preparar_dados(bruto.copy()))
+            del bruto
+
+            medir('contar_modais', lambda: [contar_modais(df[c]) for c in COLUNAS_MODAIS])
+            cubos = medir('construir_cubo', lambda: {nome: construir_cubo(df, nome) for nome in CUBOS})
+            localizacao, modais = cubos['cubo_localizacao'], cubos['cubo_modais']
+            medir('crosstab_localizacao', crosstab_modais,
+                  localizacao['bairro_residencia'], localizacao['modal_trabalho_mask'], localizacao['contagem'])
+            validas = modais['modal_trabalho_mask'].to_numpy() & ~np.uint16(1)
+            medir('crosstab_demografico', lambda: [
+                crosstab_modais(modais['sexo'].map(SEXO_MAP), validas, modais['contagem']),
+                crosstab_modais(modais['renda'].map(RENDA_MAP), validas, modais['contagem']),
+            ])
+            medir('agregados_paginas', calcular_agregados, df)
+
+            if escala <= max_escala_treino:
+                X, y = preparar_dados_classificacao(df)
+                medir('treinar_modelos', treinar_modelos, X, y)
+            del df, cubos, localizacao, modais
+    return pd.DataFrame(linhas)
+
+
+# ==================== PÁGINAS (APPTEST) ====================
+def medir_paginas(saida, max_escala_treino=MAX_ESCALA_TREINO, escala=1):
+    """Roda o app no AppTest e grava em JSON o tempo de cada página (executado no subprocesso)"""
+    from streamlit.testing.v1 import AppTest
+
+    app = os.path.join(DIR_APP, 'app.py')
+    at = AppTest.from_file(app, default_timeout=24 * 3600)
+
+    linhas = []
+
+    def executar(pagina, execucao, func):
+        inicio = time.perf_counter()
+        func()
+        segundos = time.perf_counter() - inicio
+        if at.exception:
+            raise RuntimeError(f"{pagina}: {at.exception[0].value}")
+        linhas.append({'escala': f'{escala}x', 'pagina': pagina, 'execucao': execucao,
+                       'segundos': round(segundos, 4)})
+
+    # Primeira execução inclui carga e preparação do dataset
+    executar('(inicialização)', 'fria', at.run)
+    for pagina in at.sidebar.radio[0].options:
+        if pagina == PAGINA_CLASSIFICACAO and escala > max_escala_treino:
+            continue
+        executar(pagina, 'fria', lambda: at.sidebar.radio[0].set_value(pagina).run())
+        executar(pagina, 'quente', at.run)
+
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(linhas, f, ensure_ascii=False)
+
+
+def bench_paginas(escalas, max_escala_treino=MAX_ESCALA_TREINO):
+    """Tempo de ponta a ponta de cada página, um subprocesso limpo (sem caches) por escala"""
+    linhas = []
+    for escala in escalas:
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho_csv = gravar_csv_sintetico(tmp, TAMANHO_PESQUISA * escala)
+            saida = os.path.join(tmp, 'paginas.json')
+            env = dict(
+                os.environ,
+                DASHBOARD_CSV=caminho_csv,
+                DASHBOARD_CACHE_DIR=os.path.join(tmp, 'cache'),
+                DASHBOARD_MODELOS_DIR=os.path.join(tmp, 'modelos'),
+                DASHBOARD_MODO='',
+            )
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--medir-paginas', saida,
+                 '--escalas', str(escala), '--max-escala-treino', str(max_escala_treino)],
+                env=env, check=True,
+            )
+            with open(saida, encoding='utf-8') as f:
+                linhas.extend(json.load(f))
+    return pd.DataFrame(linhas)
+
+
+# ==================== INICIALIZAÇÃO ====================
+CODIGO_PRIMEIRA_PAGINA = (
+    "from streamlit.testing.v1 import AppTest\n"
+    "at = AppTest.from_file({app!r}, default_timeout=24 * 3600)\n"
+    "at.run()\n"
+    "assert not at.exception, at.exception[0].value\n"
+)
+
+
+def tempos_importacao(modulo='app'):
+    """Import de ``modulo`` em um interpretador limpo: (total em s, Counter de segundos próprios por pacote)"""
+    processo = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+                              capture_output=True, text=True, cwd=DIR_APP, check=True)
+    total = 0.0
+    por_pacote = Counter()
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, cumulativo, nome = (parte.strip() for parte in linha[len('import time:'):].split('|'))
+        por_pacote[nome.split('.')[0]] += int(proprio) / 1e6
+        if nome == modulo:
+            total = int(cumulativo) / 1e6
+    return total, por_pacote
+
+
+def bench_inicializacao(escalas):
+    """Início a frio: import do app por pacote e tempo até a primeira página pronta, sem caches"""
+    # O import não depende da escala do dataset
+    total, por_pacote = tempos_importacao()
+    linhas = []
+    outros = 0.0
+    for pacote, segundos in por_pacote.most_common():
+        if segundos < MIN_IMPORTACAO_S:
+            outros += segundos
+            continue
+        linhas.append({'escala': '-', 'etapa': f'import {pacote}', 'segundos': round(segundos, 4)})
+    linhas.append({'escala': '-', 'etapa': 'import (outros)', 'segundos': round(outros, 4)})
+    linhas.append({'escala': '-', 'etapa': 'import app (total)', 'segundos': round(total, 4)})
+
+    for escala in escalas:
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho_csv = gravar_csv_sintetico(tmp, TAMANHO_PESQUISA * escala)
+            env = dict(
+                os.environ,
+                DASHBOARD_CSV=caminho_csv,
+                DASHBOARD_CACHE_DIR=os.path.join(tmp, 'cache'),
+                DASHBOARD_MODELOS_DIR=os.path.join(tmp, 'modelos'),
+                DASHBOARD_MODO='',
+                DASHBOARD_COMPARTILHADO_DIR='',
+            )
+            # Do interpretador novo até a Visão Geral pronta: imports, carga do dataset e renderização
+            inicio = time.perf_counter()
+            subprocess.run([sys.executable, '-c', CODIGO_PRIMEIRA_PAGINA.format(app=os.path.join(DIR_APP, 'app.py'))],
+                           env=env, cwd=DIR_APP, check=True, capture_output=True)
+            linhas.append({'escala': f'{escala}x', 'etapa': 'primeira_pagina',
+                           'segundos': round(time.perf_counter() - inicio, 4)})
+    return pd.DataFrame(linhas)
+
+
+# ==================== RESULTADOS ====================
+def metadados():
+    """Commit, máquina e versões, para saber de onde vieram os números"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=DIR_APP).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'maquina': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def comparar(atual, base, tolerancia=0.2):
+    """Tabela atual x base por medição; ``regressao`` marca pioras acima da tolerância"""
+    tabelas = []
+    for suite, (chaves, metrica) in METRICAS_COMPARACAO.items():
+        if not atual['suites'].get(suite) or not base['suites'].get(suite):
+            continue
+
+        def indexar(registros, nome):
+            df = pd.DataFrame(registros)
+            df['medicao'] = df[chaves[1:]].astype(str).agg(' / '.join, axis=1) if len(chaves) > 1 else suite
+            return df.set_index(['escala', 'medicao'])[metrica].rename(nome)
+
+        tabela = pd.concat(
+            [indexar(base['suites'][suite], 'base_s'), indexar(atual['suites'][suite], 'atual_s')],
+            axis=1, join='inner',
+        ).reset_index()
+        tabela.insert(0, 'suite', suite)
+        tabela['razao'] = (tabela['atual_s'] / tabela['base_s']).round(2)
+        tabela['regressao'] = tabela['razao'] > 1 + tolerancia
+        tabelas.append(tabela)
+    return pd.concat(tabelas, ignore_index=True) if tabelas else pd.DataFrame()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=SUITES)
+    parser.add_argument('--max-escala-treino', type=int, default=MAX_ESCALA_TREINO,
+                        help='Maior escala em que os classificadores são treinados')
+    parser.add_argument('--saida', help='Grava os resultados em JSON')
+    parser.add_argument('--comparar', help='JSON de outra execução para comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='Piora relativa tolerada na comparação')
+    parser.add_argument('--medir-paginas', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir_paginas:
+        medir_paginas(args.medir_paginas, args.max_escala_treino, args.escalas[0])
+        sys.exit(0)
+
+    titulos = {
+        'modais': "Parsing de modais (clean_modal / classifica_modo)",
+        'combinacoes': "Combinações de modais (página Integração Multimodal)",
+        'etapas': "Etapas do pipeline",
+        'paginas': "Páginas de ponta a ponta (AppTest)",
+        'inicializacao': "Inicialização a frio (import por pacote e primeira página)",
+    }
+    funcoes = {
+        'modais': lambda: bench_modais(args.escalas),
+        'combinacoes': lambda: bench_combinacoes(args.escalas),
+        'etapas': lambda: bench_etapas(args.escalas, max_escala_treino=args.max_escala_treino),
+        'paginas': lambda: bench_paginas(args.escalas, args.max_escala_treino),
+        'inicializacao': lambda: bench_inicializacao(args.escalas),
+    }
+
+    resultados = {'metadados': metadados(), 'suites': {}}
+    for suite in args.suites:
+        print(f"\n### {titulos[suite]}")
+        tabela = funcoes[suite]()
+        print(tabela.to_string(index=False))
+        resultados['suites'][suite] = tabela.to_dict(orient='records')
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        tabela = comparar(resultados, base, args.tolerancia)
+        print(f"\n### Comparação com {args.comparar} (commit {base['metadados'].get('commit')})")
+        print(tabela.to_string(index=False))
+        if tabela['regressao'].any():
+            print(f"\n{int(tabela['regressao'].sum())} medição(ões) mais lenta(s) que a tolerância")
+            sys.exit(1)
@@ -0,0 +1,164 @@
+"""Modo compartilhado: dataset preparado e agregados em arquivos mapeados em memória.
+
+Com várias réplicas do Streamlit atrás de um balanceador, cada processo
+manteria a sua própria cópia do dataframe preparado. Neste modo o dataframe
+preparado e os agregados das páginas são gravados uma única vez em um
+diretório (um volume compartilhado), um arquivo ``.npy`` por coluna, e todos
+os processos os abrem com ``np.load(mmap_mode='r')``. Os dados ficam no page
+cache do sistema operacional, compartilhado entre os processos e os
+contêineres do mesmo nó que montam o volume.
+
+Colunas categóricas são gravadas como códigos inteiros (as categorias vão no
+``esquema.json``); colunas de texto também, e voltam como ``Categorical``.
+O primeiro processo a encontrar o diretório sem a versão atual do dataset
+prepara e publica os arquivos (com trava de arquivo); os demais esperam e
+apenas os mapeiam.
+
+Configuração: ``DASHBOARD_COMPARTILHADO_DIR`` liga o modo e aponta o diretório.
+
+Uso (publicação antecipada, ex.: no deploy):
+    python compartilhado.py [--destino DIR]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from artefatos import calcular_agregados
+from dados import carregar_dataset, versao_dataset
+from preparacao import DataFrameSomenteLeitura, preparar_dados
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Incrementar sempre que o formato dos arquivos mudar
+VERSAO_COMPARTILHADO = 6
+
+DIR_COMPARTILHADO = os.environ.get('DASHBOARD_COMPARTILHADO_DIR')
+
+MODO_COMPARTILHADO = bool(DIR_COMPARTILHADO)
+
+
+# ==================== TABELAS ====================
+def gravar_tabela(df, destino):
+    """Grava cada coluna em um .npy (códigos, para categóricas e texto) e o esquema em JSON"""
+    os.makedirs(destino)
+    colunas = []
+    for i, coluna in enumerate(df.columns):
+        serie = df[coluna]
+        arquivo = f'{i:03d}.npy'
+        if serie.dtype == object:
+            serie = serie.astype('category')
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(destino, arquivo), serie.cat.codes.to_numpy())
+            colunas.append({'nome': coluna, 'arquivo': arquivo, 'categorias': serie.cat.categories.tolist(),
+                            'ordenada': bool(serie.cat.ordered)})
+        else:
+            np.save(os.path.join(destino, arquivo), serie.to_numpy())
+            colunas.append({'nome': coluna, 'arquivo': arquivo})
+    with open(os.path.join(destino, 'esquema.json'), 'w', encoding='utf-8') as f:
+        json.dump({'n_linhas': len(df), 'colunas': colunas}, f, ensure_ascii=False)
+
+
+def abrir_tabela(origem):
+    """Dataframe somente leitura cujas colunas são views dos .npy mapeados em memória"""
+    with open(os.path.join(origem, 'esquema.json'), encoding='utf-8') as f:
+        esquema = json.load(f)
+    colunas = {}
+    for coluna in esquema['colunas']:
+        valores = np.load(os.path.join(origem, coluna['arquivo']), mmap_mode='r')
+        if 'categorias' in coluna:
+            tipo = pd.CategoricalDtype(coluna['categorias'], ordered=coluna['ordenada'])
+            valores = pd.Categorical.from_codes(valores, dtype=tipo)
+        colunas[coluna['nome']] = valores
+    return DataFrameSomenteLeitura(colunas, index=pd.RangeIndex(esquema['n_linhas']), copy=False)
+
+
+# ==================== PUBLICAÇÃO ====================
+def chave_versao(caminho_csv, identidade):
+    """Nome do diretório de uma versão do dataset (arquivo + tamanho/mtime + formato)"""
+    h = hashlib.sha256(f'{os.path.abspath(caminho_csv)}:{identidade}'.encode()).hexdigest()[:16]
+    return f'v{VERSAO_COMPARTILHADO}-{h}'
+
+
+@contextmanager
+def _trava(raiz):
+    """Trava exclusiva entre processos (e contêineres) que usam o mesmo diretório"""
+    os.makedirs(raiz, exist_ok=True)
+    with open(os.path.join(raiz, '.trava'), 'w') as arquivo:
+        if fcntl is not None:
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+def publicar(df, agregados, raiz, chave):
+    """Grava o dataframe preparado e os agregados; o diretório da versão aparece de uma vez"""
+    destino = os.path.join(raiz, chave)
+    tmp = f'{destino}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    gravar_tabela(df, os.path.join(tmp, 'dados'))
+    for nome, tabela in agregados.items():
+        gravar_tabela(tabela.reset_index(drop=True), os.path.join(tmp, nome))
+    with open(os.path.join(tmp, 'manifesto.json'), 'w', encoding='utf-8') as f:
+        json.dump({'versao': VERSAO_COMPARTILHADO, 'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'tabelas': ['dados', *agregados]}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, destino)
+
+    # Versões anteriores: processos que ainda as mapeiam continuam lendo os arquivos já abertos
+    for nome in os.listdir(raiz):
+        if nome.startswith('v') and nome != chave and not nome.endswith('.tmp'):
+            shutil.rmtree(os.path.join(raiz, nome), ignore_errors=True)
+    return destino
+
+
+def abrir(raiz, chave):
+    """Todas as tabelas publicadas de uma versão ({nome: dataframe}), ou None se não existir"""
+    origem = os.path.join(raiz, chave)
+    caminho_manifesto = os.path.join(origem, 'manifesto.json')
+    if not os.path.exists(caminho_manifesto):
+        return None
+    with open(caminho_manifesto, encoding='utf-8') as f:
+        manifesto = json.load(f)
+    return {nome: abrir_tabela(os.path.join(origem, nome)) for nome in manifesto['tabelas']}
+
+
+def abrir_ou_publicar(caminho_csv, identidade, raiz=DIR_COMPARTILHADO):
+    """Mapeia a versão atual do dataset; se ainda não existir, prepara e publica (um processo por vez)"""
+    chave = chave_versao(caminho_csv, identidade)
+    tabelas = abrir(raiz, chave)
+    if tabelas is not None:
+        return tabelas
+    with _trava(raiz):
+        # Outro processo pode ter publicado enquanto este esperava a trava
+        if abrir(raiz, chave) is None:
+            df = preparar_dados(carregar_dataset(caminho_csv=caminho_csv))
+            publicar(df, calcular_agregados(df), raiz, chave)
+    return abrir(raiz, chave)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--destino', default=DIR_COMPARTILHADO, required=DIR_COMPARTILHADO is None,
+                        help='Diretório compartilhado (padrão: $DASHBOARD_COMPARTILHADO_DIR)')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    caminho, identidade = versao_dataset()
+    tabelas = abrir_ou_publicar(caminho, identidade, args.destino)
+    print(f"Publicado em {os.path.join(args.destino, chave_versao(caminho, identidade))} "
+          f"({time.perf_counter() - inicio:.2f}s)")
+    for nome, tabela in tabelas.items():
+        print(f"  {nome}: {len(tabela):,} linhas, {len(tabela.columns)} colunas")
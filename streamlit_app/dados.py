@@ -0,0 +1,253 @@
+"""Ingestão do dataset da Pesquisa Origem-Destino 2016 (RMR).
+
+O CSV original é convertido uma única vez para Parquet com um schema de tipos
+explícito (códigos inteiros em int8/int16, modais como texto). As cargas
+seguintes leem apenas as colunas usadas pelo dashboard a partir do Parquet e
+só voltam ao CSV quando o arquivo colunar não existe ou está desatualizado.
+
+Um arquivo derivado vale para o CSV cuja identidade (tamanho e mtime) está
+gravada nos seus metadados: a comparação é por igualdade, então um CSV
+corrigido copiado com o mtime antigo preservado (``cp -p``, ``rsync -a``)
+também invalida o cache.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+NOME_CSV = 'dataset2.csv'
+
+# Incrementar sempre que o schema abaixo mudar (invalida os Parquet antigos)
+VERSAO_SCHEMA = 1
+
+# Lista de caminhos possíveis para o CSV
+CAMINHOS_POSSIVEIS = [
+    '../dados/dataset2.csv',   # Caminho relativo local
+    'dados/dataset2.csv',      # Caminho relativo do Streamlit Cloud
+    '/app/dados/dataset2.csv',  # Caminho do Docker
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../dados/dataset2.csv')  # Caminho absoluto relativo
+]
+
+# Chave dos metadados do Parquet com a identidade do CSV de origem
+CHAVE_ORIGEM = b'dashboard_origem'
+
+# Diretório alternativo quando a pasta do dataset é somente leitura (ex: volume :ro no Docker)
+DIR_CACHE = os.environ.get(
+    'DASHBOARD_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'mobilidade_rmr')
+)
+
+# ==================== SCHEMA ====================
+# Códigos inteiros das respostas. Só são compactados quando a conversão não
+# perde informação (sem nulos e dentro do intervalo do tipo); caso contrário a
+# coluna mantém o tipo inferido pelo CSV, preservando o comportamento atual.
+SCHEMA_INTEIROS = {
+    'sexo': 'int8',
+    'faixa_etaria': 'int8',
+    'renda': 'int8',
+    'mobilidade_reduzida': 'int8',
+    'detalhe_mobilidade': 'int8',
+    'internet_celular': 'int8',
+    'possui_filho_escola': 'int8',
+    'quant_filhos': 'int8',
+    'utiliza_app_taxi_escola': 'int8',
+    'resp_pesquisa_matricula': 'int8',
+    'trabalha': 'int8',
+    'turno_trabalho': 'int8',
+    'freq_local_trabalho': 'int8',
+    'utiliza_app_taxi_trabalho': 'int8',
+    'utiliza_terminal_int_trabalho': 'int8',
+    'terminal_int_trabalho': 'int8',
+    'pesquisado_estuda': 'int8',
+    'turno_aula': 'int8',
+    'nivel_estudo': 'int8',
+    'freq_aula': 'int8',
+    'utiliza_app_taxi_aula': 'int8',
+    'utiliza_integracao_aula': 'int8',
+    'terminal_aula': 'int8',
+    'zona_residencia': 'int16',
+}
+
+# Respostas de múltipla escolha ("3, 5") - sempre lidas como texto
+COLUNAS_MODAIS = ['meio_transporte_trab', 'transporte_aula', 'meios_transporte_filhos']
+
+# Fator de expansão da pesquisa (peso de cada registro); opcional no arquivo
+COLUNA_PESO = os.environ.get('DASHBOARD_COLUNA_PESO', 'fator_expansao')
+
+# Colunas efetivamente usadas pelas páginas do dashboard (projeção na leitura)
+COLUNAS_APP = [
+    'sexo', 'faixa_etaria', 'renda', 'cidade_residencia', 'bairro_residencia',
+    'trabalha', 'pesquisado_estuda',
+    'cidade_trabalho', 'bairro_trabalho', 'cidade_escola', 'bairro_escola',
+    'meio_transporte_trab', 'transporte_aula', 'meios_transporte_filhos',
+    'utiliza_terminal_int_trabalho', 'terminal_int_trabalho',
+    'utiliza_integracao_aula', 'terminal_aula',
+    'utiliza_app_taxi_trabalho', 'utiliza_app_taxi_aula', 'utiliza_app_taxi_escola',
+    COLUNA_PESO,
+]
+
+
+def localizar_csv():
+    """Retorna ``$DASHBOARD_CSV`` ou o primeiro caminho existente do CSV; senão levanta FileNotFoundError"""
+    caminho = os.environ.get('DASHBOARD_CSV')
+    if caminho:
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"DASHBOARD_CSV aponta para um arquivo inexistente: {caminho}")
+        return caminho
+    for path in CAMINHOS_POSSIVEIS:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(
+        f"Arquivo {NOME_CSV} não encontrado. Tentou os seguintes caminhos: {CAMINHOS_POSSIVEIS}"
+    )
+
+
+def identidade_csv(caminho_csv):
+    """Identidade do arquivo em disco: (tamanho em bytes, mtime em ns)"""
+    estado = os.stat(caminho_csv)
+    return estado.st_size, estado.st_mtime_ns
+
+
+def versao_dataset():
+    """Identifica a versão do dataset em disco: (caminho do CSV, identidade do arquivo)"""
+    caminho = localizar_csv()
+    return caminho, identidade_csv(caminho)
+
+
+def caminhos_artefato(caminho_csv, sufixo):
+    """Locais candidatos de um arquivo derivado do CSV: ao lado dele e no diretório de cache.
+
+    No diretório de cache, compartilhado entre datasets, o nome leva um hash do
+    caminho absoluto do CSV: arquivos homônimos em pastas diferentes não se
+    sobrescrevem.
+    """
+    caminho_absoluto = os.path.abspath(caminho_csv)
+    base = os.path.splitext(os.path.basename(caminho_csv))[0]
+    h = hashlib.sha256(caminho_absoluto.encode()).hexdigest()[:12]
+    return [
+        os.path.join(os.path.dirname(caminho_absoluto), f'{base}.{sufixo}'),
+        os.path.join(DIR_CACHE, f'{base}.{h}.{sufixo}'),
+    ]
+
+
+def caminhos_parquet(caminho_csv):
+    """Locais candidatos do Parquet do dataset"""
+    return caminhos_artefato(caminho_csv, f'v{VERSAO_SCHEMA}.parquet')
+
+
+def parquet_atualizado(caminho_parquet, identidade):
+    """O arquivo derivado é válido se existir e tiver sido gerado do CSV com esta identidade"""
+    if not os.path.exists(caminho_parquet):
+        return False
+    import pyarrow.parquet as pq
+    try:
+        metadados = pq.read_schema(caminho_parquet).metadata or {}
+    except Exception:
+        return False  # Arquivo corrompido ou parcial: será regerado
+    return metadados.get(CHAVE_ORIGEM) == json.dumps(list(identidade)).encode()
+
+
+def gravar_parquet(df, destinos, identidade=None):
+    """Grava no primeiro destino gravável (troca atômica) e retorna o caminho, ou None.
+
+    ``identidade`` é a do CSV lido para gerar ``df`` (tomada antes da
+    leitura); vai para os metadados e é conferida por ``parquet_atualizado``.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    if identidade is not None:
+        tabela = tabela.replace_schema_metadata({**(tabela.schema.metadata or {}),
+                                                 CHAVE_ORIGEM: json.dumps(list(identidade)).encode()})
+    for destino in destinos:
+        try:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            tmp = f'{destino}.{os.getpid()}.tmp'
+            pq.write_table(tabela, tmp)
+            os.replace(tmp, destino)  # Troca atômica: leitores nunca veem arquivo parcial
+            return destino
+        except OSError:
+            continue
+    return None
+
+
+def aplicar_schema(df):
+    """Aplica o schema de tipos explícito ao dataframe lido do CSV"""
+    for col, dtype in SCHEMA_INTEIROS.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if not pd.api.types.is_integer_dtype(s):
+            continue
+        info = np.iinfo(dtype)
+        if s.min() >= info.min and s.max() <= info.max:
+            df[col] = s.astype(dtype)
+
+    # Demais colunas de texto: garante str (ou NaN) para o Parquet aceitar
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def ler_csv(caminho_csv, colunas=None):
+    """Leitura direta do CSV (caminho lento) já com o schema aplicado"""
+    usecols = None if colunas is None else (lambda c: c in colunas)
+    df = pd.read_csv(
+        caminho_csv,
+        low_memory=False,
+        usecols=usecols,
+        dtype={c: str for c in COLUNAS_MODAIS},
+    )
+    return aplicar_schema(df)
+
+
+def converter_para_parquet(caminho_csv):
+    """Converte o CSV completo para Parquet (uma vez) e retorna o caminho gerado"""
+    identidade = identidade_csv(caminho_csv)
+    return gravar_parquet(ler_csv(caminho_csv), caminhos_parquet(caminho_csv), identidade)
+
+
+def ler_parquet(caminho_parquet, colunas=None):
+    """Leitura colunar com projeção das colunas pedidas"""
+    if colunas is not None:
+        import pyarrow.parquet as pq
+        disponiveis = set(pq.read_schema(caminho_parquet).names)
+        colunas = [c for c in colunas if c in disponiveis]
+    df = pd.read_parquet(caminho_parquet, engine='pyarrow', columns=colunas)
+
+    # Nulos de texto voltam como None; normaliza para NaN igual ao read_csv
+    for col in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            s = df[col].astype(object)
+            df[col] = s.where(s.notna(), np.nan)
+    return df
+
+
+def carregar_dataset(colunas=COLUNAS_APP, caminho_csv=None):
+    """Carrega o dataset pelo Parquet tipado, convertendo a partir do CSV se necessário"""
+    caminho_csv = caminho_csv or localizar_csv()
+    identidade = identidade_csv(caminho_csv)
+
+    for caminho_parquet in caminhos_parquet(caminho_csv):
+        if parquet_atualizado(caminho_parquet, identidade):
+            return ler_parquet(caminho_parquet, colunas)
+
+    caminho_parquet = converter_para_parquet(caminho_csv)
+    if caminho_parquet is not None:
+        return ler_parquet(caminho_parquet, colunas)
+
+    # Nenhum local gravável: segue com o CSV
+    return ler_csv(caminho_csv, colunas)
+
+
+if __name__ == '__main__':
+    import time
+
+    inicio = time.perf_counter()
+    destino = converter_para_parquet(localizar_csv())
+    print(f"Parquet gerado em {destino} ({time.perf_counter() - inicio:.2f}s)")
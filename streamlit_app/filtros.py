@@ -0,0 +1,145 @@
+"""Filtro global (cross-filter) das páginas sobre os registros.
+
+O índice é construído uma vez por versão dos dados sobre os registros
+preparados: um vetor de bits empacotado (uint8) por valor de cada dimensão
+do filtro e por modal declarado em cada contexto (um registro com vários
+modais está no bitmap de cada um). Aplicar uma combinação de filtros é um OR
+dos bitmaps dos valores escolhidos em cada dimensão e um AND entre
+dimensões, sem varrer as colunas; as posições dos registros dos recortes
+recentes ficam memoizadas (LRU). Os agregados das páginas não carregam as
+dimensões do filtro: no recorte, cada um é recalculado só com os registros
+selecionados.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Dimensões do filtro global, na ordem da sidebar
+DIMENSOES_FILTRO = ['cidade_residencia', 'bairro_residencia', 'sexo', 'faixa_etaria', 'renda']
+
+# Contextos de viagem, o bit de cada um na coluna ``contextos`` do índice e a coluna do tipo de trajeto
+BITS_CONTEXTO = {'trabalho': 1, 'aula': 2, 'filhos': 4}
+COLUNAS_TIPO_TRAJETO = ['tipo_trajeto_trabalho', 'tipo_trajeto_aula', 'tipo_trajeto_filhos']
+
+# Dimensão -> bitmask dos modais de um contexto; os valores da dimensão são os códigos dos modais
+MODAIS_FILTRO = {
+    'modal_trabalho': 'modal_trabalho_mask',
+    'modal_aula': 'modal_aula_mask',
+    'modal_filhos': 'modal_filhos_mask',
+}
+
+MAX_MEMO = 32
+
+
+def normalizar_filtro(filtro):
+    """Filtro {dimensão: valores} como tupla ordenada e hasheável; dimensões vazias são ignoradas"""
+    return tuple(sorted(
+        (dimensao, tuple(sorted(valores, key=str)))
+        for dimensao, valores in filtro.items()
+        if valores
+    ))
+
+
+def bits_contextos(tipo_trabalho, tipo_aula, tipo_filhos):
+    """Bitmask dos contextos em que a pessoa declarou algum trajeto"""
+    return (
+        np.where(np.asarray(tipo_trabalho) != 'sem_resposta', BITS_CONTEXTO['trabalho'], 0)
+        | np.where(np.asarray(tipo_aula) != 'sem_resposta', BITS_CONTEXTO['aula'], 0)
+        | np.where(np.asarray(tipo_filhos) != 'sem_resposta', BITS_CONTEXTO['filhos'], 0)
+    ).astype(np.uint8)
+
+
+def valores_contextos(contextos):
+    """Valores da coluna ``contextos`` com algum dos contextos escolhidos"""
+    bits = 0
+    for contexto in contextos:
+        bits |= BITS_CONTEXTO[contexto]
+    return [v for v in range(1 << len(BITS_CONTEXTO)) if v & bits]
+
+
+def filtro_registros(filtro, por_contexto=False):
+    """Filtro da sidebar sobre os registros (normalizado): o contexto da viagem vira a coluna ``contextos``.
+
+    Com ``por_contexto`` (agregados com uma coluna ``contexto``), o contexto
+    fica de fora: ele escolhe as linhas do agregado, não as pessoas.
+    """
+    registros = {dimensao: valores for dimensao, valores in filtro.items() if dimensao != 'contexto'}
+    if not por_contexto:
+        registros['contextos'] = valores_contextos(filtro.get('contexto', []))
+    return normalizar_filtro(registros)
+
+
+class IndiceFiltros:
+    """Índice bitmap das dimensões do filtro sobre os registros, com memo LRU dos recortes"""
+
+    def __init__(self, colunas, mascaras=None, max_memo=MAX_MEMO):
+        self.n = len(next(iter(colunas.values())))
+        self.valores = {}
+        self.bitmaps = {}
+        for dimensao, valores in colunas.items():
+            codigos, distintos = pd.factorize(valores, sort=True)
+            self.valores[dimensao] = pd.Index(distintos)
+            self.bitmaps[dimensao] = self._bitmaps(codigos, len(distintos))
+        # Bitmasks: um bitmap por bit presente (o registro entra no de cada bit ligado)
+        for dimensao, mascara in (mascaras or {}).items():
+            mascara = np.asarray(mascara, dtype=np.int64)
+            bits = [b for b in range(int(mascara.max(initial=0)).bit_length()) if (mascara >> b & 1).any()]
+            self.valores[dimensao] = pd.Index(bits, dtype=np.int64)
+            self.bitmaps[dimensao] = np.array([np.packbits(mascara >> b & 1) for b in bits],
+                                              dtype=np.uint8).reshape(len(bits), (self.n + 7) // 8)
+        self._memo = OrderedDict()
+        self._max_memo = max_memo
+        self._lock = threading.Lock()
+
+    @classmethod
+    def de_registros(cls, registros, max_memo=MAX_MEMO):
+        """Índice das dimensões do filtro, dos contextos com trajeto declarado e dos modais de cada registro"""
+        colunas = {dimensao: registros[dimensao] for dimensao in DIMENSOES_FILTRO}
+        colunas['contextos'] = bits_contextos(*(registros[c] for c in COLUNAS_TIPO_TRAJETO))
+        mascaras = {dimensao: registros[coluna] for dimensao, coluna in MODAIS_FILTRO.items()}
+        return cls(colunas, mascaras, max_memo)
+
+    def _bitmaps(self, codigos, n_valores):
+        """Matriz (valores x bytes) com os bits das linhas de cada valor"""
+        ordem = np.argsort(codigos, kind='stable')
+        limites = np.searchsorted(codigos[ordem], np.arange(n_valores + 1))
+        bitmaps = np.empty((n_valores, (self.n + 7) // 8), dtype=np.uint8)
+        linhas = np.zeros(self.n, dtype=bool)
+        for i in range(n_valores):
+            posicoes = ordem[limites[i]:limites[i + 1]]
+            linhas[posicoes] = True
+            bitmaps[i] = np.packbits(linhas)
+            linhas[posicoes] = False
+        return bitmaps
+
+    def mascara(self, filtro):
+        """Máscara booleana das linhas que atendem ao filtro (já normalizado; dimensões repetidas valem todas)"""
+        resultado = None
+        for dimensao, escolhidos in filtro:
+            if dimensao not in self.bitmaps:
+                continue
+            posicoes = self.valores[dimensao].get_indexer(list(escolhidos))
+            posicoes = posicoes[posicoes >= 0]
+            if len(posicoes):
+                bits = np.bitwise_or.reduce(self.bitmaps[dimensao][posicoes], axis=0)
+            else:
+                bits = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+            resultado = bits if resultado is None else resultado & bits
+        if resultado is None:
+            return np.ones(self.n, dtype=bool)
+        return np.unpackbits(resultado, count=self.n).astype(bool)
+
+    def posicoes(self, filtro):
+        """Posições dos registros que atendem ao filtro (já normalizado); recortes recentes vêm do memo"""
+        with self._lock:
+            if filtro in self._memo:
+                self._memo.move_to_end(filtro)
+                return self._memo[filtro]
+        posicoes = np.flatnonzero(self.mascara(filtro))
+        with self._lock:
+            self._memo[filtro] = posicoes
+            while len(self._memo) > self._max_memo:
+                self._memo.popitem(last=False)
+        return posicoes
@@ -0,0 +1,166 @@
+"""Matrizes origem-destino (O-D) das viagens, em formato esparso.
+
+A origem de uma viagem é a zona de residência e o destino a de trabalho ou a
+da escola, conforme o contexto; a zona é o par (município, bairro). O
+agregado ``fluxos`` conta as viagens por contexto, zona de origem e zona de
+destino (no máximo um par por zona x zona), como os demais agregados
+somáveis: é acumulado na ingestão em blocos e atualizado pela diferença. No
+filtro global, ou com um modal escolhido (índice dos modais de cada
+registro), é recalculado só com os registros do recorte.
+
+A partir dele, ``MatrizOD`` monta a matriz zona x zona de um contexto com
+``scipy.sparse``: só os pares com viagens
+ocupam memória, as linhas (destinos de uma origem) saem da forma CSR e as
+colunas (origens de um destino) da CSC. Os maiores corredores e a agregação
+por município são operações sobre a matriz, sem voltar ao agregado.
+
+O scipy só é importado ao montar a primeira matriz.
+"""
+import numpy as np
+import pandas as pd
+
+from agregacao import contar_grupos
+from dados import COLUNA_PESO
+from preparacao import categorizar, concatenar
+
+# Contexto -> (flag de quem faz a viagem, município e bairro de destino, dimensão dos modais no filtro)
+CONTEXTOS_OD = {
+    'trabalho': ('trabalha_flag', 'cidade_trabalho', 'bairro_trabalho', 'modal_trabalho'),
+    'aula': ('estuda_flag', 'cidade_escola', 'bairro_escola', 'modal_aula'),
+}
+
+COLUNAS_ORIGEM = ['cidade_residencia', 'bairro_residencia']
+COLUNAS_DESTINO = ['cidade_destino', 'bairro_destino']
+
+# Níveis de agregação das zonas
+NIVEIS = {'bairro': ['cidade', 'bairro'], 'municipio': ['cidade']}
+
+
+# ==================== AGREGADO ====================
+def calcular_fluxos(df):
+    """Viagens por (contexto, zona de origem, zona de destino)"""
+    partes = []
+    for contexto, (flag, cidade, bairro, _) in CONTEXTOS_OD.items():
+        viagens = df.loc[
+            df[flag] & df[bairro].notna(),
+            [c for c in COLUNAS_ORIGEM + [cidade, bairro, COLUNA_PESO] if c in df.columns]
+        ].rename(columns={cidade: 'cidade_destino', bairro: 'bairro_destino'})
+        contagens = contar_grupos(viagens, COLUNAS_ORIGEM + COLUNAS_DESTINO)
+        contagens.insert(0, 'contexto', contexto)
+        partes.append(contagens)
+    return categorizar(concatenar(partes))
+
+
+# ==================== MATRIZ ====================
+def _zonas(cidades, bairros=None):
+    """Chaves das zonas (MultiIndex município/bairro, ou só município)"""
+    if bairros is None:
+        return pd.Index(np.asarray(cidades, dtype=object), name='cidade')
+    return pd.MultiIndex.from_arrays([np.asarray(cidades, dtype=object), np.asarray(bairros, dtype=object)],
+                                     names=NIVEIS['bairro'])
+
+
+class MatrizOD:
+    """Matriz esparsa de viagens zona de origem (linhas) x zona de destino (colunas)"""
+
+    def __init__(self, matriz, zonas):
+        self.csr = matriz.tocsr()
+        self.zonas = zonas
+        self._csc = None
+
+    @classmethod
+    def de_fluxos(cls, fluxos, contexto):
+        """Matriz de um contexto a partir do agregado (já filtrado).
+
+        As zonas são as que aparecem como origem ou destino no recorte.
+        """
+        from scipy import sparse
+
+        recorte = fluxos[fluxos['contexto'].to_numpy() == contexto]
+
+        origens = _zonas(*(recorte[c] for c in COLUNAS_ORIGEM))
+        destinos = _zonas(*(recorte[c] for c in COLUNAS_DESTINO))
+        zonas = origens.unique().union(destinos.unique())
+        matriz = sparse.coo_matrix(
+            (recorte['contagem'].to_numpy(dtype=float), (zonas.get_indexer(origens), zonas.get_indexer(destinos))),
+            shape=(len(zonas), len(zonas)),
+        )
+        return cls(matriz, zonas)  # Linhas repetidas (mesmo par O-D) são somadas na conversão para CSR
+
+    @property
+    def csc(self):
+        if self._csc is None:
+            self._csc = self.csr.tocsc()
+        return self._csc
+
+    @property
+    def nivel(self):
+        return 'bairro' if isinstance(self.zonas, pd.MultiIndex) else 'municipio'
+
+    def total(self):
+        return float(self.csr.sum())
+
+    def internas(self):
+        """Viagens com origem e destino na mesma zona"""
+        return float(self.csr.diagonal().sum())
+
+    def n_pares(self):
+        """Pares O-D com alguma viagem"""
+        return int(self.csr.count_nonzero())
+
+    def _posicao(self, zona):
+        posicao = self.zonas.get_indexer([zona])[0]
+        if posicao < 0:
+            raise KeyError(f"Zona sem viagens no recorte: {zona}")
+        return posicao
+
+    def destinos(self, zona):
+        """Viagens de uma zona de origem para cada destino (fatia de linha), em ordem decrescente"""
+        linha = self.csr[self._posicao(zona)]
+        return pd.Series(linha.data, index=self.zonas[linha.indices]).sort_values(ascending=False)
+
+    def origens(self, zona):
+        """Viagens de cada origem para uma zona de destino (fatia de coluna), em ordem decrescente"""
+        coluna = self.csc[:, self._posicao(zona)]
+        return pd.Series(coluna.data, index=self.zonas[coluna.indices]).sort_values(ascending=False)
+
+    def corredores(self, k=10, incluir_internas=False):
+        """Os ``k`` pares O-D com mais viagens: colunas origem, destino, viagens"""
+        coo = self.csr.tocoo()
+        linhas, colunas, valores = coo.row, coo.col, coo.data
+        if not incluir_internas:
+            fora = linhas != colunas
+            linhas, colunas, valores = linhas[fora], colunas[fora], valores[fora]
+        if k < len(valores):
+            maiores = np.argpartition(-valores, k)[:k]
+            linhas, colunas, valores = linhas[maiores], colunas[maiores], valores[maiores]
+        ordem = np.lexsort((colunas, linhas, -valores))
+        return pd.DataFrame({
+            'origem': self.rotulos(linhas[ordem]),
+            'destino': self.rotulos(colunas[ordem]),
+            'viagens': valores[ordem],
+        })
+
+    def por_municipio(self):
+        """Mesma matriz agregada por município (P' M P, com P a indicadora zona -> município)"""
+        from scipy import sparse
+
+        if self.nivel == 'municipio':
+            return self
+        codigos, municipios = pd.factorize(self.zonas.get_level_values('cidade'), sort=True)
+        indicadora = sparse.csr_matrix(
+            (np.ones(len(codigos)), (np.arange(len(codigos)), codigos)), shape=(len(codigos), len(municipios))
+        )
+        return MatrizOD(indicadora.T @ self.csr @ indicadora, _zonas(municipios))
+
+    def densa(self):
+        """DataFrame origem x destino (só para matrizes pequenas, como a de municípios)"""
+        rotulos = self.rotulos()
+        return pd.DataFrame(self.csr.toarray(), index=rotulos, columns=rotulos)
+
+    def rotulos(self, posicoes=None):
+        """Nomes das zonas ('BAIRRO (MUNICÍPIO)' ou o município) nas posições dadas"""
+        zonas = self.zonas if posicoes is None else self.zonas[posicoes]
+        if self.nivel == 'municipio':
+            return list(zonas)
+        return [f'{bairro} ({cidade})' for cidade, bairro in zonas]
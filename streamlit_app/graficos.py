@@ -0,0 +1,133 @@
+"""Gráficos estáticos (matplotlib/seaborn) do dashboard, renderizados em PNG.
+
+Cada construtor recebe apenas os agregados já calculados pela página (tabelas
+pequenas, pontos distintos, matrizes de confusão) e devolve uma ``Figure``.
+As figuras são criadas pela API orientada a objetos, fora do registro global
+do pyplot, e descartadas logo após virarem PNG; assim o app pode guardar só
+os bytes em cache, indexados pelos agregados de entrada, e a memória do
+servidor não cresce a cada rerun.
+
+matplotlib e seaborn só são importados no primeiro gráfico renderizado, e
+não na inicialização do app.
+"""
+import io
+
+import numpy as np
+
+# Mesmos parâmetros do st.pyplot, para a imagem sair igual
+DPI_PNG = 200
+
+# Acima disso a dispersão vira hexbin (pontos distintos, não registros)
+LIMITE_PONTOS_DISPERSAO = 5000
+
+
+def renderizar_png(fig, dpi=DPI_PNG):
+    """Converte a figura em bytes PNG e libera a memória dela"""
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+def _figura(figsize):
+    """Figure fora do pyplot; no primeiro uso importa o matplotlib com o backend Agg"""
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+
+# ==================== CONSTRUTORES ====================
+def heatmap_modal_bairro(tabela_top):
+    """Heatmap bairro x modal (trabalho)"""
+    fig = _figura((14, 8))
+    import seaborn as sns
+
+    ax = fig.subplots()
+    sns.heatmap(tabela_top, cmap='YlOrRd', annot=False, fmt='d', ax=ax)
+    ax.set_title("Heatmap – Modal por Bairro (Trabalho)")
+    ax.set_xlabel("Modal")
+    ax.set_ylabel("Bairro")
+    ax.tick_params(axis='x', labelrotation=45)
+    for rotulo in ax.get_xticklabels():
+        rotulo.set_horizontalalignment('right')
+    fig.tight_layout()
+    return fig
+
+
+def barras_empilhadas(distribuicao, titulo, colormap, figsize, xlabel=None, rotacao=0, fonte_titulo=None,
+                      fonte_eixos=None, grade=False):
+    """Barras 100% empilhadas de uma distribuição grupo x modal (em %)"""
+    fig = _figura(figsize)
+    ax = fig.subplots()
+    distribuicao.plot(kind='bar', stacked=True, colormap=colormap, ax=ax)
+    ax.set_title(titulo, fontsize=fonte_titulo)
+    ax.set_ylabel('Percentual (%)', fontsize=fonte_eixos)
+    if xlabel:
+        ax.set_xlabel(xlabel, fontsize=fonte_eixos)
+    ax.tick_params(axis='x', labelrotation=rotacao)
+    if rotacao:
+        for rotulo in ax.get_xticklabels():
+            rotulo.set_horizontalalignment('right')
+    ax.legend(title='Modal', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=8)
+    if grade:
+        ax.grid(axis='y', linestyle='--', alpha=0.6)
+    fig.tight_layout()
+    return fig
+
+
+def dispersao_regressao(pontos, linha, r2):
+    """Dispersão renda x nº de modais com a reta ajustada.
+
+    Os pontos já vêm agregados (um por par distinto, com a contagem). Com
+    poucos pontos, a opacidade reproduz a sobreposição de todos os registros
+    com alpha 0.3; com muitos, um hexbin ponderado pela contagem.
+    """
+    fig = _figura((10, 6))
+    ax = fig.subplots()
+    x = pontos['renda'].to_numpy()
+    y = pontos['num_modais_trabalho'].to_numpy()
+    contagem = pontos['contagem'].to_numpy()
+    if len(pontos) > LIMITE_PONTOS_DISPERSAO:
+        hb = ax.hexbin(x, y, C=contagem, reduce_C_function=np.sum, gridsize=40, cmap='Blues', mincnt=1)
+        fig.colorbar(hb, ax=ax, label='Registros')
+    else:
+        ax.scatter(x, y, alpha=1 - 0.7 ** contagem, s=20, color='steelblue')
+    ax.plot(linha['renda'], linha['previsto'], color='red', linewidth=3, label=f'R²={r2:.3f}')
+    ax.set_xlabel('Faixa de Renda')
+    ax.set_ylabel('Número de Modais')
+    ax.set_title('Renda vs. Número de Modais')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    return fig
+
+
+def matriz_confusao(cm, titulo):
+    """Heatmap 2x2 da matriz de confusão"""
+    fig = _figura((6, 5))
+    import seaborn as sns
+
+    ax = fig.subplots()
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', ax=ax,
+                xticklabels=['Não Usa', 'Usa'],
+                yticklabels=['Não Usa', 'Usa'])
+    ax.set_ylabel('Real')
+    ax.set_xlabel('Predito')
+    ax.set_title(titulo)
+    fig.tight_layout()
+    return fig
+
+
+CONSTRUTORES = {
+    'heatmap_modal_bairro': heatmap_modal_bairro,
+    'barras_empilhadas': barras_empilhadas,
+    'dispersao_regressao': dispersao_regressao,
+    'matriz_confusao': matriz_confusao,
+}
+
+
+def renderizar(nome, *args, **kwargs):
+    """Constrói o gráfico ``nome`` a partir dos agregados e devolve o PNG"""
+    return renderizar_png(CONSTRUTORES[nome](*args, **kwargs))
@@ -0,0 +1,135 @@
+"""Ingestão em blocos de arquivos grandes da Pesquisa Origem-Destino.
+
+Para tabelas de viagens completas ou vários anos da pesquisa, que não cabem
+em memória como object dtype, o CSV é lido em blocos de linhas. Cada bloco
+passa pelo mesmo prepare_data do app e é reduzido aos agregados somáveis
+(cubos, modal share, combinações, fluxos O-D, terminais, pontos da
+regressão, perfis do simulador), que são acumulados. Com um destino para os
+registros, as colunas que os agregados usam são gravadas como uma parte
+Parquet por bloco (o filtro global do modo precomputado recalcula os
+agregados a partir delas).
+Memória: um bloco preparado por vez, até BLOCOS_POR_COMBINACAO agregados de
+bloco pendentes e os agregados acumulados. Estes são limitados pelo domínio
+das suas chaves, não pelo número de linhas: o produto das dimensões de cada
+cubo, as combinações de contexto e modais por bairro, os pares de zonas dos
+fluxos O-D, os terminais por quebra e os perfis das features. Os registros
+vão para disco bloco a bloco. Por padrão, cada bloco também alimenta o treino
+incremental dos classificadores (modelos.TreinoIncremental), que guarda só
+os modelos e as linhas distintas de (features, alvo) com a contagem, e é
+descartado. Com ``--completo``, os classificadores são treinados depois da
+ingestão sobre todos os registros, na ordem do arquivo (o mesmo split, a
+validação cruzada e a mesma chave de registro do app), e aí a memória cresce
+com o arquivo: 5 bytes por registro (int8) durante a leitura e a matriz
+int64 no fim.
+
+Uso:
+    python ingestao.py arquivo1.csv [arquivo2.csv ...] [--bloco 200000] [--completo]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from artefatos import calcular_agregados, combinar_agregados, gravar_registros
+from dados import COLUNAS_APP, COLUNAS_MODAIS, aplicar_schema
+from modelos import TreinoIncremental, preparar_dados_classificacao
+from preparacao import preparar_dados
+
+TAMANHO_BLOCO = 200_000
+BLOCOS_POR_COMBINACAO = 8
+
+# Lidas como texto em todos os blocos: a inferência de tipo por bloco poderia
+# variar entre int e float e mudar a comparação com '0' no prepare_data
+COLUNAS_TEXTO = COLUNAS_MODAIS + ['terminal_int_trabalho', 'terminal_aula']
+
+
+def ler_em_blocos(caminho_csv, tamanho_bloco=TAMANHO_BLOCO, colunas=COLUNAS_APP):
+    """Itera sobre o CSV em blocos de ``tamanho_bloco`` linhas, já com o schema aplicado"""
+    leitor = pd.read_csv(
+        caminho_csv,
+        usecols=lambda c: c in colunas,
+        dtype={c: str for c in COLUNAS_TEXTO},
+        chunksize=tamanho_bloco,
+    )
+    with leitor:
+        for bloco in leitor:
+            yield aplicar_schema(bloco)
+
+
+def ingerir_em_blocos(caminhos_csv, tamanho_bloco=TAMANHO_BLOCO, log=print, treino=None, destino_registros=None):
+    """Lê e agrega um ou mais arquivos bloco a bloco.
+
+    Retorna um dicionário com os agregados acumulados, as features de
+    classificação (X, y), o número de linhas e de colunas do dataframe
+    preparado e as estatísticas de throughput. Com ``treino`` (um
+    TreinoIncremental), as features de cada bloco vão para o treino e X e y
+    voltam como None. Com ``destino_registros``, cada bloco é gravado como
+    uma parte dos registros (artefatos.gravar_registros).
+    """
+    pendentes = []
+    partes_X, partes_y = [], []
+    n_linhas = n_colunas = n_blocos = 0
+    inicio = time.perf_counter()
+
+    for caminho in caminhos_csv:
+        inicio_arquivo = time.perf_counter()
+        linhas_arquivo = 0
+        for bloco in ler_em_blocos(caminho, tamanho_bloco):
+            df = preparar_dados(bloco)
+            # Agregados dos blocos são somados em lotes, não a cada bloco
+            pendentes.append(calcular_agregados(df))
+            if len(pendentes) >= BLOCOS_POR_COMBINACAO:
+                pendentes = [combinar_agregados(*pendentes)]
+            if destino_registros is not None:
+                gravar_registros(df, destino_registros, n_blocos)
+            n_blocos += 1
+
+            X, y = preparar_dados_classificacao(df)
+            if treino is not None:
+                treino.adicionar(X, y)
+            else:
+                partes_X.append(X.astype(np.int8))
+                partes_y.append(y.astype(np.int8))
+
+            linhas_arquivo += len(df)
+            n_colunas = len(df.columns)
+            decorrido = time.perf_counter() - inicio_arquivo
+            log(f"  {caminho}: {linhas_arquivo:,} linhas ({linhas_arquivo / decorrido:,.0f} linhas/s)")
+        n_linhas += linhas_arquivo
+
+    if not pendentes:
+        raise ValueError("Nenhuma linha lida dos arquivos informados")
+    agregados = combinar_agregados(*pendentes)
+
+    # Direto para int64 (o tipo do treino e da chave do registro), sem a cópia int8 intermediária
+    X = np.concatenate(partes_X, dtype=np.int64) if partes_X else None
+    del partes_X
+    y = np.concatenate(partes_y, dtype=np.int64) if partes_y else None
+    del partes_y
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'agregados': agregados,
+        'X': X,
+        'y': y,
+        'n_linhas': n_linhas,
+        'n_colunas': n_colunas,
+        'segundos': segundos,
+        'linhas_por_s': n_linhas / segundos if segundos > 0 else float('inf'),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv', nargs='+', help='Arquivos CSV no formato do dataset2.csv')
+    parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO, help='Linhas por bloco')
+    parser.add_argument('--completo', action='store_true',
+                        help='Guarda as features de todos os registros em vez do treino incremental')
+    args = parser.parse_args()
+
+    resultado = ingerir_em_blocos(args.csv, args.bloco, treino=None if args.completo else TreinoIncremental())
+    print(f"{resultado['n_linhas']:,} linhas em {resultado['segundos']:.2f}s "
+          f"({resultado['linhas_por_s']:,.0f} linhas/s)")
+    for nome, tabela in resultado['agregados'].items():
+        print(f"  {nome}: {len(tabela):,} linhas agregadas")
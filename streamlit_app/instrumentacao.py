@@ -0,0 +1,202 @@
+"""Instrumentação das páginas do dashboard: tempo de parede, CPU e pico de memória.
+
+Cada página (decorador ``instrumentar``) e cada etapa relevante dentro dela
+(context manager ``etapa``: cálculos, treino, ``st.pyplot``, Plotly...) gera
+um registro por rerun. Os registros da execução atual alimentam o painel de
+debug da sidebar; os acumulados do processo viram linhas de log JSON e
+métricas no formato texto do Prometheus.
+
+Configuração por variáveis de ambiente:
+- ``DASHBOARD_TRACEMALLOC=1``: mede o pico de memória (tracemalloc) desde o início
+- ``DASHBOARD_LOG_ETAPAS=1``: uma linha de log JSON por etapa medida
+- ``DASHBOARD_METRICAS_PORTA``: porta do endpoint ``/metrics`` (desligado por padrão)
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('dashboard.instrumentacao')
+
+if os.environ.get('DASHBOARD_LOG_ETAPAS') == '1' and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+if os.environ.get('DASHBOARD_TRACEMALLOC') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Cada sessão do Streamlit roda o script em sua própria thread
+_local = threading.local()
+
+# Acumulados do processo (todas as sessões), por (página, etapa)
+_lock = threading.Lock()
+_acumulado = {}
+
+
+# ==================== MEDIÇÃO ====================
+def iniciar_execucao(pagina=None):
+    """Descarta os registros do rerun anterior desta sessão"""
+    _local.registros = []
+    _local.pilha = []
+    _local.pagina = pagina
+
+
+def definir_pagina(pagina):
+    """Página a que as próximas etapas deste rerun pertencem"""
+    _local.pagina = pagina
+
+
+def registros_execucao():
+    """Registros do rerun atual: dicts com pagina, etapa, wall_s, cpu_s, pico_bytes"""
+    return list(getattr(_local, 'registros', []))
+
+
+def medir_memoria(ativo=None):
+    """Liga/desliga o tracemalloc (global ao processo); retorna se está ligado"""
+    if ativo is not None and ativo != tracemalloc.is_tracing():
+        if ativo:
+            tracemalloc.start()
+        else:
+            tracemalloc.stop()
+    return tracemalloc.is_tracing()
+
+
+def _memoria():
+    """(memória atual, pico desde o último reset) em bytes, ou None sem tracemalloc"""
+    return tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+
+
+@contextmanager
+def etapa(nome):
+    """Mede um trecho; etapas aninhadas ficam com o caminho completo (ex.: 'treino/fit')"""
+    if not hasattr(_local, 'registros'):
+        iniciar_execucao()
+    pilha = _local.pilha
+    caminho = f"{pilha[-1]['caminho']}/{nome}" if pilha else nome
+
+    # O pico é global no tracemalloc: guarda o do pai antes de zerar para o filho
+    memoria = _memoria()
+    if memoria is not None:
+        if pilha:
+            pilha[-1]['pico'] = max(pilha[-1]['pico'], memoria[1])
+        tracemalloc.reset_peak()
+    quadro = {'caminho': caminho, 'inicio_mem': memoria[0] if memoria else 0, 'pico': 0}
+    pilha.append(quadro)
+
+    inicio_wall = time.perf_counter()
+    inicio_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - inicio_wall
+        cpu = time.process_time() - inicio_cpu
+        pilha.pop()
+
+        pico = None
+        memoria = _memoria()
+        if memoria is not None:
+            pico_absoluto = max(quadro['pico'], memoria[1])
+            pico = max(pico_absoluto - quadro['inicio_mem'], 0)
+            if pilha:
+                pilha[-1]['pico'] = max(pilha[-1]['pico'], pico_absoluto)
+
+        _registrar({
+            'pagina': getattr(_local, 'pagina', None),
+            'etapa': caminho,
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'pico_bytes': pico,
+        })
+
+
+def instrumentar(func):
+    """Decorador: mede a função inteira como uma etapa com o nome dela"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with etapa(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _registrar(registro):
+    _local.registros.append(registro)
+    chave = (registro['pagina'] or '', registro['etapa'])
+    with _lock:
+        total = _acumulado.setdefault(chave, {'execucoes': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'pico_bytes': 0})
+        total['execucoes'] += 1
+        total['wall_s'] += registro['wall_s']
+        total['cpu_s'] += registro['cpu_s']
+        if registro['pico_bytes'] is not None:
+            total['pico_bytes'] = max(total['pico_bytes'], registro['pico_bytes'])
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'evento': 'etapa', **registro}, ensure_ascii=False))
+
+
+# ==================== EXPOSIÇÃO ====================
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metricas_prometheus():
+    """Acumulados do processo no formato texto do Prometheus"""
+    with _lock:
+        itens = sorted(_acumulado.items())
+    linhas = []
+    metricas = [
+        ('dashboard_etapa_execucoes_total', 'counter', 'Execuções medidas da etapa', 'execucoes'),
+        ('dashboard_etapa_wall_segundos_total', 'counter', 'Tempo de parede acumulado da etapa', 'wall_s'),
+        ('dashboard_etapa_cpu_segundos_total', 'counter', 'Tempo de CPU acumulado da etapa', 'cpu_s'),
+        ('dashboard_etapa_pico_memoria_bytes', 'gauge', 'Maior pico de alocação (tracemalloc) da etapa',
+         'pico_bytes'),
+    ]
+    for nome, tipo, ajuda, campo in metricas:
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for (pagina, nome_etapa), total in itens:
+            linhas.append(f'{nome}{{pagina="{_escapar(pagina)}",etapa="{_escapar(nome_etapa)}"}} {total[campo]}')
+    return '\n'.join(linhas) + '\n'
+
+
+class _HandlerMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        corpo = metricas_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+_servidor = None
+
+
+def iniciar_servidor_metricas(porta=None):
+    """Sobe (uma vez por processo) o endpoint /metrics em uma thread daemon"""
+    global _servidor
+    porta = porta or os.environ.get('DASHBOARD_METRICAS_PORTA')
+    if not porta:
+        return None
+    with _lock:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer(('0.0.0.0', int(porta)), _HandlerMetricas)
+            except OSError as erro:
+                logger.warning("Endpoint de métricas não iniciado na porta %s: %s", porta, erro)
+                _servidor = False
+                return None
+            threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+    return _servidor or None
@@ -0,0 +1,216 @@
+"""Mapas coropléticos por bairro a partir de polígonos locais (GeoJSON).
+
+Os polígonos dos bairros vêm de um GeoJSON em disco (``bairros.geojson``
+junto ao dataset, ou ``$DASHBOARD_BAIRROS_GEOJSON``), com o município e o
+bairro de cada feature nas propriedades ``cidade`` e ``bairro``, escritos
+como no dataset. Cada bairro recebe um código inteiro (a posição na lista
+ordenada de zonas) que vira o ``id`` da feature.
+
+As geometrias são simplificadas (Douglas-Peucker) e arredondadas uma única
+vez por nível de detalhe e gravadas em ``static/mapas``. Com o static serving
+do Streamlit ligado, o mapa referencia esse arquivo por URL: o navegador o
+baixa uma vez e cada redesenho (filtro, indicador) envia só os códigos e os
+valores das cores. Sem o static serving, o GeoJSON simplificado vai junto
+com a figura.
+
+Os valores por bairro são somados direto sobre os códigos: as categorias de
+município e bairro do agregado são traduzidas uma vez para os códigos das
+zonas, e cada linha vira um índice inteiro para ``np.bincount``.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dados import CAMINHOS_POSSIVEIS, localizar_csv
+
+NOME_GEOJSON = 'bairros.geojson'
+
+PROPRIEDADE_CIDADE = 'cidade'
+PROPRIEDADE_BAIRRO = 'bairro'
+
+# Pasta servida pelo Streamlit em ``app/static`` (server.enableStaticServing)
+DIR_ESTATICO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+SUBDIR_MAPAS = 'mapas'
+URL_ESTATICO = 'app/static'
+
+# Nível de detalhe -> (tolerância da simplificação em graus, casas decimais das coordenadas)
+NIVEIS_DETALHE = {
+    'regiao': (0.002, 4),
+    'municipio': (0.0005, 5),
+    'bairro': (0.0001, 6),
+}
+
+
+def localizar_geojson():
+    """Caminho do GeoJSON dos bairros, ou None se não houver"""
+    candidatos = [os.environ.get('DASHBOARD_BAIRROS_GEOJSON')]
+    try:
+        candidatos.append(os.path.join(os.path.dirname(localizar_csv()), NOME_GEOJSON))
+    except FileNotFoundError:
+        pass
+    candidatos += [os.path.join(os.path.dirname(c), NOME_GEOJSON) for c in CAMINHOS_POSSIVEIS]
+    return next((c for c in candidatos if c and os.path.exists(c)), None)
+
+
+# ==================== SIMPLIFICAÇÃO ====================
+def simplificar_anel(pontos, tolerancia):
+    """Douglas-Peucker de um anel fechado; mantém ao menos 4 pontos (triângulo fechado)"""
+    pontos = np.asarray(pontos, dtype=float)[:, :2]
+    n = len(pontos)
+    if n <= 4:
+        return pontos
+    manter = np.zeros(n, dtype=bool)
+    # O anel fechado é dividido no ponto mais distante do primeiro, para o DP ter dois trechos abertos
+    meio = int(np.argmax(((pontos - pontos[0]) ** 2).sum(axis=1)))
+    manter[[0, meio, n - 1]] = True
+    pilha = [(0, meio), (meio, n - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        a, b = pontos[inicio], pontos[fim]
+        trecho = pontos[inicio + 1:fim]
+        direcao = b - a
+        comprimento = np.hypot(*direcao)
+        if comprimento == 0:
+            distancias = np.hypot(*(trecho - a).T)
+        else:
+            distancias = np.abs(direcao[0] * (trecho[:, 1] - a[1]) - direcao[1] * (trecho[:, 0] - a[0])) / comprimento
+        i = int(np.argmax(distancias))
+        if distancias[i] > tolerancia:
+            manter[inicio + 1 + i] = True
+            pilha += [(inicio, inicio + 1 + i), (inicio + 1 + i, fim)]
+    if manter.sum() < 4:
+        # Anel pequeno demais para a tolerância: fica com os pontos mais afastados
+        extra = [i for i in np.argsort(-np.hypot(*(pontos - pontos[0]).T)) if not manter[i]]
+        manter[extra[:4 - manter.sum()]] = True
+    return pontos[manter]
+
+
+def simplificar_geometria(geometria, tolerancia, casas):
+    """Polygon/MultiPolygon simplificado, com as coordenadas arredondadas"""
+    def anel(coordenadas):
+        return np.round(simplificar_anel(coordenadas, tolerancia), casas).tolist()
+
+    if geometria['type'] == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': [anel(a) for a in geometria['coordinates']]}
+    if geometria['type'] == 'MultiPolygon':
+        return {'type': 'MultiPolygon',
+                'coordinates': [[anel(a) for a in poligono] for poligono in geometria['coordinates']]}
+    raise ValueError(f"Geometria não suportada: {geometria['type']}")
+
+
+# ==================== CAMADA ====================
+class CamadaBairros:
+    """Polígonos dos bairros com um código inteiro por zona (município, bairro)"""
+
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as f:
+            conteudo = f.read()
+        self.caminho = caminho
+        self.versao = hashlib.sha256(conteudo).hexdigest()[:12]
+        features = json.loads(conteudo)['features']
+
+        chaves = [(str(f['properties'][PROPRIEDADE_CIDADE]).strip(), str(f['properties'][PROPRIEDADE_BAIRRO]).strip())
+                  for f in features]
+        self.zonas = pd.MultiIndex.from_tuples(chaves, names=['cidade', 'bairro']).unique().sort_values()
+        codigos = self.zonas.get_indexer(chaves)
+        # Bairros em várias features (ex.: partes separadas) são unidos num MultiPolygon
+        self._geometrias = {}
+        for codigo, feature in zip(codigos, features):
+            geometria = feature['geometry']
+            partes = [geometria['coordinates']] if geometria['type'] == 'Polygon' else geometria['coordinates']
+            self._geometrias.setdefault(int(codigo), []).extend(partes)
+
+        limites = np.array([
+            [np.min(a[:, 0]), np.min(a[:, 1]), np.max(a[:, 0]), np.max(a[:, 1])]
+            for partes in self._geometrias.values() for poligono in partes
+            for a in [np.asarray(poligono[0], dtype=float)]
+        ])
+        self.centro = {'lon': float((limites[:, 0].min() + limites[:, 2].max()) / 2),
+                       'lat': float((limites[:, 1].min() + limites[:, 3].max()) / 2)}
+        self._simplificados = {}
+
+    def rotulos(self):
+        return [f'{bairro} ({cidade})' for cidade, bairro in self.zonas]
+
+    def geojson(self, nivel):
+        """FeatureCollection simplificada para o nível de detalhe (calculada uma vez)"""
+        if nivel not in self._simplificados:
+            tolerancia, casas = NIVEIS_DETALHE[nivel]
+            self._simplificados[nivel] = {'type': 'FeatureCollection', 'features': [
+                {'type': 'Feature', 'id': codigo,
+                 'geometry': simplificar_geometria({'type': 'MultiPolygon', 'coordinates': partes}, tolerancia, casas)}
+                for codigo, partes in sorted(self._geometrias.items())
+            ]}
+        return self._simplificados[nivel]
+
+    def url(self, nivel):
+        """URL estática do GeoJSON simplificado (gravado uma vez), ou None se a pasta não for gravável"""
+        nome = f'bairros_{self.versao}_{nivel}.geojson'
+        destino = os.path.join(DIR_ESTATICO, SUBDIR_MAPAS, nome)
+        if not os.path.exists(destino):
+            try:
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                tmp = f'{destino}.{os.getpid()}.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(self.geojson(nivel), f, separators=(',', ':'))
+                os.replace(tmp, destino)
+            except OSError:
+                return None
+        return f'{URL_ESTATICO}/{SUBDIR_MAPAS}/{nome}'
+
+    def tradutor(self, cidades, bairros):
+        """Matriz (categoria de município x categoria de bairro) -> código da zona (-1 se fora do mapa)"""
+        pares = pd.MultiIndex.from_product([cidades, bairros])
+        return self.zonas.get_indexer(pares).reshape(len(cidades), len(bairros))
+
+    def codigos(self, tabela):
+        """Código da zona de cada linha de um agregado com município e bairro de residência categóricos"""
+        cidade = tabela['cidade_residencia'].astype('category')
+        bairro = tabela['bairro_residencia'].astype('category')
+        tradutor = self.tradutor(cidade.cat.categories, bairro.cat.categories)
+        codigos = tradutor[cidade.cat.codes.to_numpy(), bairro.cat.codes.to_numpy()]
+        return np.where((cidade.cat.codes.to_numpy() < 0) | (bairro.cat.codes.to_numpy() < 0), -1, codigos)
+
+    def somar(self, codigos, pesos):
+        """Soma dos pesos por zona (um valor por código)"""
+        validos = codigos >= 0
+        return np.bincount(codigos[validos], weights=np.asarray(pesos, dtype=float)[validos],
+                           minlength=len(self.zonas))
+
+
+# ==================== INDICADORES ====================
+# Indicador -> (rótulo, descrição do denominador)
+INDICADORES = {
+    'modal_share': ("Uso do modal (%)", "viagens ao trabalho com modal declarado"),
+    'integracao': ("Uso de integração (%)", "pessoas"),
+    'multimodalidade': ("Trajetos multimodais (%)", "trajetos ao trabalho declarados"),
+}
+
+
+def calcular_indicador(camada, cubo, indicador, modal=None):
+    """Percentual do indicador e denominador por zona (arrays na ordem dos códigos) a partir do cubo"""
+    codigos = camada.codigos(cubo)
+    contagem = cubo['contagem'].to_numpy(dtype=float)
+    if indicador == 'modal_share':
+        mascara = cubo['modal_trabalho_mask'].to_numpy()
+        numerador = (mascara & (1 << modal)) != 0
+        denominador = mascara > 0
+    elif indicador == 'integracao':
+        numerador = cubo['usuario_integracao'].to_numpy(dtype=bool)
+        denominador = np.ones(len(cubo), dtype=bool)
+    elif indicador == 'multimodalidade':
+        tipo = cubo['tipo_trajeto_trabalho'].astype(str).to_numpy()
+        numerador = tipo == 'multimodal'
+        denominador = tipo != 'sem_resposta'
+    else:
+        raise KeyError(f"Indicador desconhecido: {indicador}")
+    total = camada.somar(codigos, contagem * denominador)
+    parte = camada.somar(codigos, contagem * (numerador & denominador))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percentual = np.where(total > 0, parte / total * 100, np.nan)
+    return percentual, total
@@ -0,0 +1,36 @@
+"""Dicionários de mapeamento dos códigos da Pesquisa Origem-Destino 2016"""
+
+SEXO_MAP = {1: 'Masculino', 2: 'Feminino'}
+
+FAIXA_ETARIA_MAP = {
+    1: 'Até 6 anos', 2: '6 a 15 anos', 3: '16 a 24 anos',
+    4: '25 a 39 anos', 5: '40 a 59 anos', 6: 'Acima de 60 anos'
+}
+
+RENDA_MAP = {
+    1: 'Até 1 SM', 2: '1 a 2 SM', 3: '2 a 3 SM', 4: '3 a 5 SM',
+    5: '5 a 10 SM', 6: '10 a 20 SM', 7: '+ 20 SM',
+    8: 'Sem rendimento', 9: 'Sem declaração'
+}
+
+MODAL_MAP = {
+    0: "Não declarado", 1: "A pé", 2: "Bicicleta", 3: "Ônibus", 4: "Metrô",
+    5: "Carro (dirigindo)", 6: "Carona familiar", 7: "Carona amigo/colega",
+    8: "Carro com motorista", 9: "Motocicleta", 10: "Transporte escolar",
+    11: "Táxi", 12: "Fretado"
+}
+
+APP_TAXI_MAP = {0: "Não declarado", 1: "Nunca", 2: "Às vezes", 3: "Sempre"}
+
+TERMINAL_MAP = {
+    0: "Não declarado", 1: "TI Aeroporto", 2: "TI Afogados", 3: "TI Barro", 4: "TI Cabo",
+    5: "TI Cajueiro Seco", 6: "TI Camaragibe", 7: "TI Cavaleiro", 8: "TI Caxangá",
+    9: "TI Igarassu", 10: "TI Jaboatão", 11: "TI Joana Bezerra", 12: "TI Macaxeira",
+    13: "TI PE-15", 14: "TI Pelópidas Silveira", 15: "TI Recife", 16: "TI Tancredo Neves",
+    17: "TI TIP", 18: "TI Xambá", 19: "TI Rio Doce"
+}
+
+NIVEL_ESTUDO_MAP = {
+    0: "Não declarado", 1: "Fundamental", 2: "Médio", 
+    3: "Graduação", 4: "Pós-Graduação"
+}
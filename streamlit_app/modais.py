@@ -0,0 +1,287 @@
+"""Parsing das respostas de modais de transporte ("3, 5", "2005", "0"...).
+
+Contém as funções de referência linha a linha (clean_modal, classifica_modo),
+o parser vetorizado usado pelo prepare_data, que produz as listas de
+códigos, a classificação do trajeto e o número de modais em uma única
+passada por coluna, e a codificação dos conjuntos de modais em bitmask.
+"""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from mapeamentos import MODAL_MAP
+
+# Códigos de modal vão de 0 a 12: cabem em um uint16 (bit i = modal i)
+N_MODAIS = 13
+
+
+# ==================== FUNÇÕES DE REFERÊNCIA (LINHA A LINHA) ====================
+def clean_modal(value):
+    """Limpa valores de modais e corrige erros (ex: 2005 → 5)"""
+    if pd.isna(value):
+        return []
+    raw = str(value).replace(" ", "").split(",")
+    cleaned = []
+    for v in raw:
+        if v.isdigit():
+            num = int(v)
+            if num > 12:
+                num = int(str(num)[-1])
+            if 0 <= num <= 12:
+                cleaned.append(num)
+    return cleaned
+
+
+def classifica_modo(valor):
+    """Classifica trajeto em monomodal/multimodal/sem_resposta"""
+    if pd.isna(valor):
+        return "sem_resposta"
+    valor = str(valor).strip()
+    if valor == "0" or valor == "":
+        return "sem_resposta"
+    if "," in valor:
+        return "multimodal"
+    return "monomodal"
+
+
+def contar_num_modais(valor):
+    """Conta o número de modais em um registro (ex: '3,5,7' retorna 3)"""
+    if pd.isna(valor):
+        return 0
+    valor = str(valor).replace(" ", "").split(",")
+    return len([v for v in valor if v.isdigit() and int(v) > 0])
+
+
+def contar_modais(col):
+    """Conta distribuição de modais em uma coluna"""
+    lista = []
+    for linha in col.dropna():
+        linha = str(linha).strip()
+        if linha == "" or linha == "0":
+            continue
+        for m in linha.split(","):
+            try:
+                codigo = int(m.strip())
+                lista.append(MODAL_MAP.get(codigo, "Outro"))
+            except ValueError:
+                continue
+    if not lista:
+        return pd.Series(dtype=int)
+    return pd.Series(lista).value_counts().sort_values(ascending=False)
+
+
+def contar_modais_resposta(valor):
+    """Ocorrências de cada modal em uma única resposta (mesmas regras do contar_modais)"""
+    contagem = Counter()
+    linha = str(valor).strip()
+    if linha == "" or linha == "0":
+        return contagem
+    for m in linha.split(","):
+        try:
+            contagem[MODAL_MAP.get(int(m.strip()), "Outro")] += 1
+        except ValueError:
+            continue
+    return contagem
+
+
+def contar_modais_por_grupo(respostas, coluna):
+    """Contagem de cada modal por grupo (formato longo) a partir das respostas já contadas.
+
+    ``respostas`` tem as colunas de grupo, a coluna de modais e as medidas
+    (``contagem`` e, se houver, ``peso``) de cada resposta distinta no grupo.
+    Cada resposta é analisada uma única vez (contar_modais_resposta) e as medidas são
+    multiplicadas pelo número de ocorrências de cada modal nela; a soma sobre
+    os grupos reproduz o contar_modais da coluna inteira.
+    """
+    medidas = [c for c in ('contagem', 'peso') if c in respostas.columns]
+    grupos = [c for c in respostas.columns if c != coluna and c not in medidas]
+    respostas = respostas[respostas[coluna].notna()]
+    modais = pd.DataFrame(
+        [(valor, modal, vezes)
+         for valor in respostas[coluna].unique()
+         for modal, vezes in contar_modais_resposta(valor).most_common()],
+        columns=[coluna, 'modal', 'vezes'],
+    )
+    contagens = respostas.merge(modais, on=coluna)
+    for medida in medidas:
+        contagens[medida] = contagens[medida] * contagens['vezes']
+    return (
+        contagens
+        .groupby(grupos + ['modal'], dropna=False, sort=False, observed=True)[medidas].sum()
+        .reset_index()
+    )
+
+
+def num_modais_por_tipo(tipos):
+    """Número de modais pela classificação (2 = multimodal, 1 = monomodal, 0 = sem resposta)"""
+    tipos = np.asarray(tipos, dtype=object)
+    return np.select([tipos == 'multimodal', tipos == 'monomodal'], [2, 1], default=0)
+
+
+# ==================== PARSER VETORIZADO ====================
+def analisar_modais(serie):
+    """Parser vetorizado de uma coluna de modais.
+
+    As respostas se repetem muito (poucas centenas de valores distintos em
+    dezenas de milhares de linhas), então a coluna é fatorada uma única vez,
+    cada valor distinto é interpretado uma vez e o resultado é espalhado para
+    as linhas por indexação NumPy.
+
+    Retorna um DataFrame com o mesmo índice da série e as colunas:
+    - ``lista``: códigos limpos (idêntico a ``clean_modal``)
+    - ``tipo``: classificação (idêntico a ``classifica_modo``)
+    - ``num_modais``: modais declarados (idêntico a ``contar_num_modais``)
+    - ``mascara``: conjunto de modais da lista em bitmask uint16
+    """
+    codigos, distintos = pd.factorize(serie, use_na_sentinel=True)
+
+    # Nulos recebem o código -1; o resultado deles fica na última posição
+    distintos = list(distintos) + [np.nan]
+    listas = np.empty(len(distintos), dtype=object)
+    for i, valor in enumerate(distintos):
+        listas[i] = clean_modal(valor)
+    tipos = np.array([classifica_modo(v) for v in distintos], dtype=object)
+    num_modais = np.array([contar_num_modais(v) for v in distintos], dtype=np.int64)
+    mascaras = np.array([lista_para_mascara(lista) for lista in listas], dtype=np.uint16)
+
+    return pd.DataFrame(
+        {
+            'lista': listas[codigos],
+            'tipo': tipos[codigos],
+            'num_modais': num_modais[codigos],
+            'mascara': mascaras[codigos],
+        },
+        index=serie.index,
+    )
+
+
+# ==================== BITMASK DE MODAIS ====================
+_POPCOUNT = np.array([bin(i).count('1') for i in range(1 << N_MODAIS)], dtype=np.uint8)
+
+
+def lista_para_mascara(codigos):
+    """Converte uma lista de códigos (0 a 12) em bitmask; repetições são ignoradas"""
+    mascara = 0
+    for codigo in codigos:
+        mascara |= 1 << codigo
+    return mascara
+
+
+def mascara_para_codigos(mascara):
+    """Códigos presentes em uma bitmask, em ordem crescente"""
+    mascara = int(mascara)
+    return [c for c in range(N_MODAIS) if mascara >> c & 1]
+
+
+def contem_modal(mascaras, codigo):
+    """Array booleano: quais linhas usam o modal ``codigo``"""
+    return (np.asarray(mascaras, dtype=np.uint16) >> codigo & 1).astype(bool)
+
+
+def popcount(mascaras):
+    """Número de modais distintos de cada linha"""
+    return _POPCOUNT[np.asarray(mascaras, dtype=np.uint16)]
+
+
+def mascara_para_onehot(mascaras):
+    """Matriz booleana (linhas x 13 modais), uma coluna por código"""
+    m = np.asarray(mascaras, dtype=np.uint16)
+    return (m[:, None] >> np.arange(N_MODAIS, dtype=np.uint16) & 1).astype(bool)
+
+
+def _tipo_soma(pesos):
+    """Tipo das somas por grupo: int64 para contagens (sem pesos ou pesos inteiros), float64 para pesos reais"""
+    if pesos is None or np.issubdtype(np.asarray(pesos).dtype, np.integer):
+        return np.int64
+    return np.float64
+
+
+def crosstab_modais(grupos, mascaras, pesos=None):
+    """Contagem grupo x modal a partir das bitmasks (equivale ao explode + crosstab).
+
+    Cada linha soma 1 (ou o seu peso) em cada modal distinto que usa. Grupos
+    nulos, modais sem nenhuma ocorrência e grupos sem nenhum modal ficam de
+    fora, como no crosstab. As colunas são os códigos dos modais; com pesos
+    reais (fatores de expansão) as somas ficam em float64, sem truncar.
+    """
+    codigos, rotulos = pd.factorize(grupos, sort=True)
+    validos = codigos >= 0
+    codigos = codigos[validos]
+    m = np.asarray(mascaras, dtype=np.uint16)[validos]
+    p = None if pesos is None else np.asarray(pesos)[validos]
+
+    tabela = np.empty((len(rotulos), N_MODAIS), dtype=_tipo_soma(pesos))
+    for modal in range(N_MODAIS):
+        usa = contem_modal(m, modal)
+        tabela[:, modal] = np.bincount(
+            codigos[usa], weights=None if p is None else p[usa], minlength=len(rotulos)
+        )
+
+    df = pd.DataFrame(tabela, index=pd.Index(rotulos, name=getattr(grupos, 'name', None)))
+    df = df.loc[df.sum(axis=1) > 0, df.sum(axis=0) > 0]
+    df.columns.name = 'modal'
+    return df
+
+
+def contar_combinacoes(mascaras, pesos=None):
+    """Frequência (ou soma dos pesos) de cada combinação (bitmask) de 2 ou mais modais, da maior para a menor"""
+    m = np.asarray(mascaras, dtype=np.uint16)
+    multi = popcount(m) > 1
+    valores, inverso = np.unique(m[multi], return_inverse=True)
+    contagens = np.bincount(
+        inverso, weights=None if pesos is None else np.asarray(pesos)[multi], minlength=len(valores)
+    )
+    return (
+        pd.Series(contagens.astype(_tipo_soma(pesos)), index=valores, name='Contagem')
+        .sort_values(ascending=False, kind='stable')
+    )
+
+
+def top_combinacoes_por_grupo(grupos, mascaras, n=3, pesos=None):
+    """As ``n`` combinações de 2+ modais mais frequentes de cada grupo (ex.: bairro).
+
+    Grupo e bitmask são empacotados em uma única chave inteira, contada com
+    np.unique + bincount; o ranking dentro de cada grupo sai de um lexsort.
+    Retorna um DataFrame (grupo, mascara, contagem, posicao) ordenado por grupo
+    e posição; empates são desfeitos pela bitmask. A contagem é a soma dos
+    pesos (float64 com pesos reais), como no contar_combinacoes.
+    """
+    m = np.asarray(mascaras, dtype=np.uint16)
+    codigos, rotulos = pd.factorize(grupos, sort=True)
+    validos = (codigos >= 0) & (popcount(m) > 1)
+    p = None if pesos is None else np.asarray(pesos)[validos]
+
+    chaves, inverso = np.unique(
+        codigos[validos].astype(np.int64) << N_MODAIS | m[validos], return_inverse=True
+    )
+    contagens = np.bincount(inverso, weights=p, minlength=len(chaves)).astype(_tipo_soma(pesos))
+    grupo = chaves >> N_MODAIS
+    mascara = chaves & ((1 << N_MODAIS) - 1)
+
+    # Grupo crescente, contagem decrescente, bitmask crescente
+    ordem = np.lexsort((mascara, -contagens, grupo))
+    grupo, mascara, contagens = grupo[ordem], mascara[ordem], contagens[ordem]
+
+    # Posição de cada linha dentro do seu grupo
+    inicios = np.flatnonzero(np.r_[True, grupo[1:] != grupo[:-1]]) if len(grupo) else np.array([], dtype=int)
+    tamanhos = np.diff(np.r_[inicios, len(grupo)])
+    posicao = np.arange(len(grupo)) - np.repeat(inicios, tamanhos)
+
+    sel = posicao < n
+    return pd.DataFrame({
+        getattr(grupos, 'name', None) or 'grupo': rotulos[grupo[sel]],
+        'mascara': mascara[sel].astype(np.uint16),
+        'contagem': contagens[sel],
+        'posicao': posicao[sel] + 1,
+    })
+
+
+def nomes_combinacoes(mascaras):
+    """Nome legível de cada bitmask (ex.: 'Metrô + Ônibus'), com os modais em ordem alfabética"""
+    m = np.asarray(mascaras, dtype=np.uint16)
+    distintas, inverso = np.unique(m, return_inverse=True)
+    nomes = np.array([
+        " + ".join(sorted(MODAL_MAP.get(c, "Outro") for c in mascara_para_codigos(d))) for d in distintas
+    ], dtype=object)
+    return nomes[inverso]
@@ -0,0 +1,684 @@
+"""Treinamento e registro em disco dos modelos de classificação (usa_integracao).
+
+Os modelos treinados, as métricas, as matrizes de confusão e as curvas
+ROC/PR são gravados em um registro indexado pelo hash dos dados de treino e
+da configuração dos modelos. O retreino só acontece quando um dos dois muda.
+
+Com ``n_jobs`` > 1 os modelos (e os folds da validação cruzada) são
+treinados em paralelo em processos separados (joblib/loky).
+
+A busca de hiperparâmetros (successive halving ou aleatória) também fica no
+registro: a melhor configuração de cada modelo, o modelo reajustado com ela
+e a curva tempo x qualidade da busca. Com o registro gravado, o app carrega
+os modelos ajustados sem refazer a busca.
+
+O sklearn e o scipy só são importados dentro das funções que treinam ou
+avaliam modelos: importar este módulo (como o app faz na inicialização) não
+paga o custo deles, apenas a primeira página que os usa.
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from agregacao import contar_grupos
+from dados import COLUNA_PESO, DIR_CACHE
+from modais import analisar_modais
+
+logger = logging.getLogger('dashboard.modelos')
+
+# Incrementar sempre que o formato dos resultados gravados mudar
+VERSAO_REGISTRO = 2
+
+DIR_MODELOS = os.environ.get('DASHBOARD_MODELOS_DIR', os.path.join(DIR_CACHE, 'modelos'))
+
+# Workers padrão para treino paralelo (1 = sequencial; -1 = todos os núcleos)
+N_JOBS_PADRAO = int(os.environ.get('DASHBOARD_N_JOBS', '1'))
+
+FEATURES = ['renda', 'faixa_etaria', 'sexo', 'num_modais_trabalho']
+
+PARAMS_SPLIT = {'test_size': 0.3, 'random_state': 42}
+
+# Nome exibido -> (classe do estimador, hiperparâmetros); a classe é importada só no treino
+CONFIG_MODELOS = {
+    'Regressão Logística': ('sklearn.linear_model.LogisticRegression', {'random_state': 42, 'max_iter': 1000}),
+    'Decision Tree': ('sklearn.tree.DecisionTreeClassifier', {'random_state': 42, 'max_depth': 5}),
+    'Random Forest': ('sklearn.ensemble.RandomForestClassifier',
+                      {'random_state': 42, 'n_estimators': 100, 'max_depth': 10}),
+}
+
+# Modelos do treino incremental (memória limitada): os que têm partial_fit recebem
+# os blocos um a um; os demais treinam sobre a base compacta (ver TreinoIncremental)
+CONFIG_INCREMENTAL = {
+    'SGD (Logística)': ('sklearn.linear_model.SGDClassifier',
+                        {'loss': 'log_loss', 'average': True, 'random_state': 42}),
+    'Naive Bayes': ('sklearn.naive_bayes.GaussianNB', {}),
+    'Gradient Boosting (HistGB)': ('sklearn.ensemble.HistGradientBoostingClassifier',
+                                   {'random_state': 42, 'max_iter': 100}),
+}
+
+# Linhas por bloco no treino incremental
+TAMANHO_BLOCO_TREINO = 50_000
+
+CLASSES = np.array([0, 1])
+
+
+def carregar_estimador(caminho):
+    """Classe do estimador a partir do caminho completo (ex.: 'sklearn.tree.DecisionTreeClassifier')"""
+    modulo, nome = caminho.rsplit('.', 1)
+    return getattr(importlib.import_module(modulo), nome)
+
+
+def alvo_classificacao(df):
+    """usa_integracao como no notebook: integração formal no trabalho ou na aula"""
+    return (
+        (df['utiliza_terminal_int_trabalho'] == 1) |
+        (df['utiliza_integracao_aula'] == 1)
+    ).astype(int)
+
+
+def registros_validos(renda, faixa_etaria, sexo, num_modais_trabalho):
+    """Registros no domínio dos classificadores (renda 1-7, faixa 3-5, sexo 1-2, ao menos um modal)"""
+    return (
+        np.isin(renda, [1, 2, 3, 4, 5, 6, 7]) &
+        np.isin(faixa_etaria, [3, 4, 5]) &
+        np.isin(sexo, [1, 2]) &
+        (np.asarray(num_modais_trabalho) > 0)
+    )
+
+
+def preparar_dados_classificacao(df):
+    """Target e features exatamente como no notebook; retorna (X, y)"""
+    usa_integracao = alvo_classificacao(df)
+
+    # Número REAL de modais declarados em meio_transporte_trab
+    num_modais_trabalho = analisar_modais(df['meio_transporte_trab'])['num_modais']
+
+    validos = registros_validos(df['renda'], df['faixa_etaria'], df['sexo'], num_modais_trabalho)
+
+    X = np.column_stack([
+        df.loc[validos, 'renda'].to_numpy(dtype=np.int64),
+        df.loc[validos, 'faixa_etaria'].to_numpy(dtype=np.int64),
+        df.loc[validos, 'sexo'].to_numpy(dtype=np.int64),
+        num_modais_trabalho[validos].to_numpy(dtype=np.int64),
+    ])
+    y = usa_integracao[validos].to_numpy()
+    return X, y
+
+
+def perfis_classificacao(df, dimensoes=()):
+    """Registros do domínio dos classificadores contados por features, alvo e ``dimensoes``.
+
+    A coluna ``num_modais_trabalho`` do resultado é a feature dos modelos (nº
+    de modais declarados, ``num_modais_declarados_trabalho`` no dataframe
+    preparado), não a do dataframe. Como os pontos da regressão, as contagens
+    são somáveis entre blocos de linhas.
+    """
+    num_modais = df['num_modais_declarados_trabalho']
+    validos = registros_validos(df['renda'], df['faixa_etaria'], df['sexo'], num_modais)
+    perfis = df.loc[validos, [c for c in dict.fromkeys([*dimensoes, 'renda', 'faixa_etaria', 'sexo', COLUNA_PESO])
+                              if c in df.columns]]
+    perfis = perfis.assign(num_modais_trabalho=num_modais[validos].to_numpy(dtype=np.int8),
+                           usa_integracao=alvo_classificacao(df.loc[validos]).to_numpy(dtype=np.int8))
+    return contar_grupos(perfis, list(dict.fromkeys([*dimensoes, *FEATURES, 'usa_integracao'])))
+
+
+def resumo_classificacao(X, y):
+    """Contagens exibidas no topo da página de classificação"""
+    return {'n': len(X), 'positivos': int(y.sum()), 'negativos': int((~y.astype(bool)).sum()),
+            'pct_positivos': float(y.mean() * 100)}
+
+
+# ==================== REGRESSÃO ====================
+def pontos_regressao_renda(df, dimensoes=()):
+    """Registros válidos para a regressão renda → nº de modais, contados por ponto distinto.
+
+    Como há poucos pares (renda, nº de modais), as contagens são somáveis entre
+    blocos de linhas e bastam para ajustar a regressão e desenhar o gráfico.
+    Com ``dimensoes``, os pontos ficam separados também por esses recortes.
+    """
+    chaves = list(dict.fromkeys([*dimensoes, 'renda', 'num_modais_trabalho']))
+    df_reg = df.loc[
+        (df['renda'].isin([1, 2, 3, 4, 5, 6, 7])) &
+        (df['faixa_etaria'].isin([3, 4, 5])) &
+        (df['num_modais_trabalho'] > 0)
+    ]
+    return contar_grupos(df_reg, chaves)
+
+
+def ajustar_regressao_renda(pontos):
+    """Regressão linear simples renda → número de modais (trabalho), como no notebook.
+
+    Ajuste ponderado pela contagem de cada ponto: equivale ao ajuste sobre
+    todos os registros, linha a linha (na visão ponderada, a contagem é a soma
+    dos fatores de expansão). Pontos separados por recorte são somados antes
+    do ajuste.
+    """
+    from sklearn.linear_model import LinearRegression
+    from sklearn.metrics import mean_squared_error, r2_score
+
+    medidas = [c for c in ('contagem', 'registros') if c in pontos.columns]
+    pontos = pontos.groupby(['renda', 'num_modais_trabalho'], as_index=False)[medidas].sum()
+    X_renda = pontos[['renda']].to_numpy(dtype=float)
+    y_modais = pontos['num_modais_trabalho'].to_numpy(dtype=float)
+    pesos = pontos['contagem'].to_numpy()
+
+    modelo = LinearRegression()
+    modelo.fit(X_renda, y_modais, sample_weight=pesos)
+    y_pred = modelo.predict(X_renda)
+
+    x_linha = np.arange(1, 8, dtype=float).reshape(-1, 1)
+    return {
+        'n': int(pontos['registros' if 'registros' in pontos.columns else 'contagem'].sum()),
+        'intercepto': float(modelo.intercept_),
+        'coeficiente': float(modelo.coef_[0]),
+        'r2': r2_score(y_modais, y_pred, sample_weight=pesos),
+        'rmse': float(np.sqrt(mean_squared_error(y_modais, y_pred, sample_weight=pesos))),
+        'pontos': pontos,
+        'linha': pd.DataFrame({'renda': x_linha.ravel(), 'previsto': modelo.predict(x_linha)}),
+    }
+
+
+# ==================== REGISTRO ====================
+def chave_registro(X, y, config=CONFIG_MODELOS):
+    """Hash dos dados de treino + configuração dos modelos (inclui versão do sklearn)"""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(X).tobytes())
+    h.update(np.ascontiguousarray(y).tobytes())
+    h.update(str(X.shape).encode())
+    h.update(descricao_registro(config))
+    return h.hexdigest()[:16]
+
+
+def descricao_registro(config=CONFIG_MODELOS):
+    """Parte da chave que não depende dos dados: versões, split e modelos"""
+    import sklearn
+
+    descricao = {
+        'versao': VERSAO_REGISTRO,
+        'sklearn': sklearn.__version__,
+        'split': PARAMS_SPLIT,
+        'modelos': {nome: [estimador.rsplit('.', 1)[1], params] for nome, (estimador, params) in config.items()},
+    }
+    return json.dumps(descricao, sort_keys=True).encode()
+
+
+def caminho_registro(chave, prefixo='classificacao'):
+    """Arquivo do registro para uma chave"""
+    return os.path.join(DIR_MODELOS, f'{prefixo}_{chave}.joblib')
+
+
+def ler_registro(caminho):
+    """Conteúdo de um arquivo do registro, ou None se ausente/ilegível"""
+    if not os.path.exists(caminho):
+        return None
+    try:
+        return joblib.load(caminho)
+    except Exception:
+        return None  # Arquivo corrompido ou incompatível: será recalculado
+
+
+def gravar_registro(conteudo, caminho):
+    """Grava um arquivo do registro com troca atômica (ignora disco somente leitura)"""
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp = f'{caminho}.{os.getpid()}.tmp'
+        joblib.dump(conteudo, tmp)
+        os.replace(tmp, caminho)
+    except OSError:
+        pass  # Sem disco gravável: segue só com o cache em memória
+
+
+def avaliar_modelo(model, X_test, y_test, pesos=None):
+    """Métricas, matriz de confusão e curvas ROC/PR de um modelo treinado.
+
+    Com ``pesos``, cada linha de teste vale pelo seu peso (ex.: linhas
+    distintas com a contagem de registros), com o mesmo resultado de avaliar
+    as linhas repetidas.
+    """
+    from sklearn.metrics import (accuracy_score, auc, average_precision_score, confusion_matrix, f1_score,
+                                 precision_recall_curve, precision_score, recall_score, roc_curve)
+
+    y_pred = model.predict(X_test)
+    y_proba = model.predict_proba(X_test)[:, 1]
+    fpr, tpr, _ = roc_curve(y_test, y_proba, sample_weight=pesos)
+    precision, recall, _ = precision_recall_curve(y_test, y_proba, sample_weight=pesos)
+    cm = confusion_matrix(y_test, y_pred, sample_weight=pesos)
+    resultado = {
+        'model': model,
+        'accuracy': accuracy_score(y_test, y_pred, sample_weight=pesos),
+        'precision': precision_score(y_test, y_pred, zero_division=0, sample_weight=pesos),
+        'recall': recall_score(y_test, y_pred, zero_division=0, sample_weight=pesos),
+        'f1': f1_score(y_test, y_pred, zero_division=0, sample_weight=pesos),
+        'y_test': y_test,
+        'y_pred': y_pred,
+        'y_proba': y_proba,
+        'cm': cm if pesos is None else cm.round().astype(np.int64),
+        'roc': {'fpr': fpr, 'tpr': tpr, 'auc': auc(fpr, tpr)},
+        'pr': {'precision': precision, 'recall': recall,
+               'ap': average_precision_score(y_test, y_proba, sample_weight=pesos)},
+    }
+    if pesos is not None:
+        resultado['pesos'] = pesos
+    return resultado
+
+
+def _treinar_e_avaliar(estimador, params, X_train, y_train, X_test, y_test):
+    """Tarefa de um worker: treina um modelo e mede os tempos de treino e avaliação"""
+    inicio = time.perf_counter()
+    model = carregar_estimador(estimador)(**params)
+    model.fit(X_train, y_train)
+    tempo_treino = time.perf_counter() - inicio
+    result = avaliar_modelo(model, X_test, y_test)
+    result['tempo_treino_s'] = tempo_treino
+    result['tempo_total_s'] = time.perf_counter() - inicio
+    return result
+
+
+def treinar_modelos(X, y, config=CONFIG_MODELOS, n_jobs=N_JOBS_PADRAO):
+    """Split estratificado, treino e avaliação de todos os modelos da configuração"""
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, stratify=y, **PARAMS_SPLIT)
+
+    inicio = time.perf_counter()
+    tarefas = (
+        delayed(_treinar_e_avaliar)(estimador, params, X_train, y_train, X_test, y_test)
+        for estimador, params in config.values()
+    )
+    saidas = Parallel(n_jobs=n_jobs, backend='loky')(tarefas)
+    results = dict(zip(config, saidas))
+
+    return {
+        'n_treino': len(X_train),
+        'n_teste': len(X_test),
+        'resultados': results,
+        'n_jobs': n_jobs,
+        'tempo_total_s': time.perf_counter() - inicio,
+    }
+
+
+def carregar_ou_treinar(X, y, chave=None, config=CONFIG_MODELOS, n_jobs=N_JOBS_PADRAO):
+    """Resultados do registro em disco; treina e grava apenas se a chave não existir"""
+    chave = chave or chave_registro(X, y, config)
+    caminho = caminho_registro(chave)
+    registro = ler_registro(caminho)
+    if registro is not None:
+        return registro
+
+    registro = treinar_modelos(X, y, config, n_jobs)
+    registro['chave'] = chave
+    gravar_registro(registro, caminho)
+    return registro
+
+
+# ==================== TREINO INCREMENTAL ====================
+def compactar(linhas, pesos):
+    """Linhas distintas com a soma dos pesos das repetições"""
+    distintas, inverso = np.unique(linhas, axis=0, return_inverse=True)
+    return distintas, np.bincount(inverso.ravel(), weights=pesos, minlength=len(distintas))
+
+
+def blocos_de(X, y, tamanho_bloco=TAMANHO_BLOCO_TREINO):
+    """Itera sobre (X, y) em blocos de ``tamanho_bloco`` linhas"""
+    for inicio in range(0, len(X), tamanho_bloco):
+        yield X[inicio:inicio + tamanho_bloco], y[inicio:inicio + tamanho_bloco]
+
+
+class TreinoIncremental:
+    """Treino e avaliação dos classificadores sem a matriz de features inteira em memória.
+
+    Cada bloco (X, y) é dividido em treino e teste (sorteio por linha, com a
+    semente e o número do bloco) e descartado depois de usado:
+
+    - modelos com ``partial_fit`` (SGD, Naive Bayes) aprendem com as linhas
+      de treino do bloco;
+    - os demais (HistGB) treinam no final sobre a base compacta: as linhas
+      distintas de (features, alvo) com o número de registros como
+      ``sample_weight``. Como as features são códigos de poucas categorias,
+      ela cresce com as combinações, não com os registros;
+    - o teste também é guardado compacto, e as métricas, a matriz de confusão
+      e as curvas ROC/PR ponderadas pela contagem são iguais às calculadas
+      registro a registro.
+    """
+
+    def __init__(self, config=CONFIG_INCREMENTAL, test_size=PARAMS_SPLIT['test_size'],
+                 semente=PARAMS_SPLIT['random_state']):
+        self.config = config
+        self.test_size = test_size
+        self.semente = semente
+        self.modelos = {nome: carregar_estimador(estimador)(**params) for nome, (estimador, params) in config.items()}
+        self.tempos_treino = dict.fromkeys(config, 0.0)
+        self.n_blocos = 0
+        self.n = self.positivos = 0
+        self.n_treino = self.n_teste = 0
+        self._treino = self._teste = None  # (linhas distintas [X | y], contagens)
+        self._hash = hashlib.sha256()
+        self._inicio = time.perf_counter()
+
+    @staticmethod
+    def _acumular(compacto, linhas):
+        if compacto is None:
+            return compactar(linhas, None)
+        return compactar(np.concatenate([compacto[0], linhas]), np.concatenate([compacto[1], np.ones(len(linhas))]))
+
+    def adicionar(self, X, y):
+        """Processa um bloco de registros"""
+        X = np.asarray(X, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        self._hash.update(X.tobytes())
+        self._hash.update(y.tobytes())
+        self.n += len(y)
+        self.positivos += int(y.sum())
+
+        rng = np.random.default_rng([self.semente, self.n_blocos])
+        teste = rng.random(len(y)) < self.test_size
+        self.n_blocos += 1
+        treino = ~teste
+        self.n_treino += int(treino.sum())
+        self.n_teste += int(teste.sum())
+
+        if treino.any():
+            for nome, model in self.modelos.items():
+                if hasattr(model, 'partial_fit'):
+                    inicio = time.perf_counter()
+                    model.partial_fit(X[treino], y[treino], classes=CLASSES)
+                    self.tempos_treino[nome] += time.perf_counter() - inicio
+            self._treino = self._acumular(self._treino, np.column_stack([X[treino], y[treino]]))
+        if teste.any():
+            self._teste = self._acumular(self._teste, np.column_stack([X[teste], y[teste]]))
+
+    def resumo(self):
+        """Mesmas contagens de ``resumo_classificacao``, acumuladas bloco a bloco"""
+        negativos = self.n - self.positivos
+        return {'n': self.n, 'positivos': self.positivos, 'negativos': negativos,
+                'pct_positivos': self.positivos / self.n * 100 if self.n else 0.0}
+
+    def chave(self):
+        """Hash dos blocos recebidos + configuração dos modelos"""
+        h = self._hash.copy()
+        h.update(f'{self.n}:{self.n_blocos}'.encode())
+        h.update(descricao_registro(self.config))
+        return h.hexdigest()[:16]
+
+    def finalizar(self):
+        """Treina os modelos sem partial_fit, avalia todos e devolve o registro (mesmo formato do treino completo)"""
+        if self._treino is None or self._teste is None:
+            raise ValueError("Registros insuficientes para treino e teste")
+        linhas_treino, pesos_treino = self._treino
+        linhas_teste, pesos_teste = self._teste
+
+        resultados = {}
+        for nome, model in self.modelos.items():
+            inicio = time.perf_counter()
+            if not hasattr(model, 'partial_fit'):
+                model.fit(linhas_treino[:, :-1], linhas_treino[:, -1], sample_weight=pesos_treino)
+            tempo_treino = self.tempos_treino[nome] + time.perf_counter() - inicio
+            inicio = time.perf_counter()
+            resultado = avaliar_modelo(model, linhas_teste[:, :-1], linhas_teste[:, -1], pesos_teste)
+            resultado['tempo_treino_s'] = tempo_treino
+            resultado['tempo_total_s'] = tempo_treino + time.perf_counter() - inicio
+            resultados[nome] = resultado
+
+        return {
+            'n_treino': self.n_treino,
+            'n_teste': self.n_teste,
+            'resultados': resultados,
+            'n_jobs': 1,
+            'tempo_total_s': time.perf_counter() - self._inicio,
+            'incremental': True,
+            'chave': self.chave(),
+        }
+
+
+def treinar_incremental(blocos, config=CONFIG_INCREMENTAL):
+    """Treino incremental sobre um iterável de blocos (X, y)"""
+    treino = TreinoIncremental(config)
+    for X, y in blocos:
+        treino.adicionar(X, y)
+    return treino.finalizar()
+
+
+def carregar_ou_treinar_incremental(X, y, chave=None, tamanho_bloco=TAMANHO_BLOCO_TREINO,
+                                    config=CONFIG_INCREMENTAL):
+    """Treino incremental do registro em disco; treina bloco a bloco só se a chave não existir"""
+    chave = chave or chave_registro(X, y, config)
+    caminho = caminho_registro(f'{chave}_b{tamanho_bloco}', prefixo='incremental')
+    registro = ler_registro(caminho)
+    if registro is None:
+        registro = treinar_incremental(blocos_de(X, y, tamanho_bloco), config)
+        registro['chave'] = chave
+        gravar_registro(registro, caminho)
+    return registro
+
+
+# ==================== BUSCA DE HIPERPARÂMETROS ====================
+# Modelos da busca e hiperparâmetros fixos; os do espaço de busca são sorteados
+CONFIG_BUSCA = {
+    'Regressão Logística': ('sklearn.linear_model.LogisticRegression', {'random_state': 42, 'max_iter': 1000}),
+    'Decision Tree': ('sklearn.tree.DecisionTreeClassifier', {'random_state': 42}),
+    'Random Forest': ('sklearn.ensemble.RandomForestClassifier', {'random_state': 42}),
+    # Early stopping: para de adicionar árvores quando a perda na validação interna não melhora
+    'Gradient Boosting (HistGB)': ('sklearn.ensemble.HistGradientBoostingClassifier',
+                                   {'random_state': 42, 'max_iter': 500, 'early_stopping': True,
+                                    'validation_fraction': 0.1, 'n_iter_no_change': 10}),
+}
+
+# Valores candidatos de cada hiperparâmetro (sorteados uniformemente)
+ESPACOS_BUSCA = {
+    'Regressão Logística': {'C': [0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0, 30.0, 100.0, 300.0],
+                            'class_weight': [None, 'balanced']},
+    'Decision Tree': {'max_depth': [3, 4, 5, 6, 8, 10, 12, None], 'min_samples_leaf': [1, 5, 20, 50, 100],
+                      'criterion': ['gini', 'entropy']},
+    'Random Forest': {'n_estimators': [50, 100, 200], 'max_depth': [4, 6, 8, 10, 12, None],
+                      'min_samples_leaf': [1, 5, 20, 50], 'max_features': ['sqrt', None]},
+    'Gradient Boosting (HistGB)': {'learning_rate': [0.03, 0.05, 0.1, 0.2, 0.3], 'max_leaf_nodes': [7, 15, 31, 63],
+                                   'min_samples_leaf': [5, 20, 50, 100], 'l2_regularization': [0.0, 0.1, 1.0]},
+}
+
+# Candidatos por modelo, fator de redução do halving, folds internos e métrica de seleção
+PARAMS_BUSCA = {'n_candidatos': 24, 'fator': 3, 'cv': 3, 'scoring': 'roc_auc', 'random_state': 42}
+
+# 'halving': HalvingRandomSearchCV (cada rodada mantém 1/fator dos candidatos, com fator x mais registros);
+# 'aleatoria': RandomizedSearchCV (todos os candidatos com todos os registros de treino)
+ESTRATEGIAS_BUSCA = ['halving', 'aleatoria']
+
+
+def chave_busca(X, y, estrategia='halving'):
+    """Hash dos dados de treino + modelos, espaços e parâmetros da busca"""
+    h = hashlib.sha256(chave_registro(X, y, CONFIG_BUSCA).encode())
+    h.update(json.dumps({'espacos': ESPACOS_BUSCA, 'busca': PARAMS_BUSCA, 'estrategia': estrategia},
+                        sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def curva_busca(cv_results, n_splits, n_registros):
+    """Curva tempo x qualidade: tempo de ajuste acumulado e melhor score a cada etapa da busca.
+
+    No halving, cada etapa é uma rodada (candidatos sobreviventes com mais
+    registros); na busca aleatória, cada candidato avaliado com os
+    ``n_registros`` de treino. O tempo soma o ajuste e a avaliação de todos os
+    folds (tempo de CPU dos workers, não de parede).
+    """
+    resultados = pd.DataFrame(cv_results)
+    resultados['custo_s'] = (resultados['mean_fit_time'] + resultados['mean_score_time']) * n_splits
+    if 'iter' in resultados.columns:
+        curva = resultados.groupby('iter').agg(
+            n_registros=('n_resources', 'first'), candidatos=('mean_test_score', 'size'),
+            custo_s=('custo_s', 'sum'), melhor_score=('mean_test_score', 'max'),
+        ).reset_index(drop=True)
+    else:
+        curva = pd.DataFrame({
+            'n_registros': n_registros, 'candidatos': 1, 'custo_s': resultados['custo_s'],
+            'melhor_score': resultados['mean_test_score'].cummax(),
+        })
+    curva.insert(0, 'etapa', np.arange(1, len(curva) + 1))
+    curva['tempo_acumulado_s'] = curva.pop('custo_s').cumsum()
+    return curva
+
+
+def _buscar_modelo(nome, estimador, params, espaco, X_train, y_train, X_test, y_test, estrategia, n_jobs, log):
+    """Busca de um modelo (folds em paralelo), reajuste com a melhor configuração e avaliação no teste"""
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV, RandomizedSearchCV, StratifiedKFold
+
+    cv = StratifiedKFold(n_splits=PARAMS_BUSCA['cv'], shuffle=True, random_state=PARAMS_BUSCA['random_state'])
+    modelo = carregar_estimador(estimador)(**params)
+    comum = {'scoring': PARAMS_BUSCA['scoring'], 'cv': cv, 'random_state': PARAMS_BUSCA['random_state'],
+             'n_jobs': n_jobs}
+    if estrategia == 'halving':
+        # 'exhaust': a última rodada usa (quase) todo o treino, e as anteriores 1/fator, 1/fator² dele
+        busca = HalvingRandomSearchCV(modelo, espaco, n_candidates=PARAMS_BUSCA['n_candidatos'],
+                                      factor=PARAMS_BUSCA['fator'], min_resources='exhaust', **comum)
+    elif estrategia == 'aleatoria':
+        busca = RandomizedSearchCV(modelo, espaco, n_iter=PARAMS_BUSCA['n_candidatos'], **comum)
+    else:
+        raise ValueError(f"Estratégia de busca desconhecida: {estrategia}")
+
+    inicio = time.perf_counter()
+    busca.fit(X_train, y_train)
+    tempo_busca = time.perf_counter() - inicio
+
+    curva = curva_busca(busca.cv_results_, cv.get_n_splits(), len(X_train))
+    # No log, só as etapas em que o melhor score muda (e a última)
+    for etapa in curva[(curva['melhor_score'].diff() != 0) | (curva['etapa'] == len(curva))].itertuples():
+        log(f"  {nome} | etapa {etapa.etapa}: {etapa.candidatos} candidato(s) com {etapa.n_registros:,} "
+            f"registros, {etapa.tempo_acumulado_s:.2f}s acumulados, "
+            f"melhor {PARAMS_BUSCA['scoring']} = {etapa.melhor_score:.4f}")
+    log(f"  {nome}: {busca.best_params_} ({tempo_busca:.2f}s)")
+
+    result = avaliar_modelo(busca.best_estimator_, X_test, y_test)
+    result['tempo_treino_s'] = tempo_busca
+    result['tempo_total_s'] = time.perf_counter() - inicio
+    result['melhores_params'] = busca.best_params_
+    result['melhor_score_cv'] = float(busca.best_score_)
+    result['curva'] = curva
+    return result
+
+
+def buscar_hiperparametros(X, y, estrategia='halving', n_jobs=N_JOBS_PADRAO, log=logger.info):
+    """Busca de hiperparâmetros de todos os modelos de CONFIG_BUSCA.
+
+    Usa o mesmo split de treino/teste de ``treinar_modelos``: a busca (com
+    validação cruzada interna) vê só o treino, e o modelo reajustado com a
+    melhor configuração é avaliado no teste. O registro tem o mesmo formato
+    do treino com hiperparâmetros fixos, mais a configuração escolhida e a
+    curva tempo x qualidade de cada modelo.
+    """
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, stratify=y, **PARAMS_SPLIT)
+
+    inicio = time.perf_counter()
+    results = {}
+    for nome, (estimador, params) in CONFIG_BUSCA.items():
+        log(f"Busca ({estrategia}): {nome}")
+        results[nome] = _buscar_modelo(nome, estimador, params, ESPACOS_BUSCA[nome], X_train, y_train,
+                                       X_test, y_test, estrategia, n_jobs, log)
+
+    return {
+        'n_treino': len(X_train),
+        'n_teste': len(X_test),
+        'resultados': results,
+        'n_jobs': n_jobs,
+        'tempo_total_s': time.perf_counter() - inicio,
+        'busca': {'estrategia': estrategia, **PARAMS_BUSCA},
+    }
+
+
+def config_ajustada(registro):
+    """Configuração dos modelos (formato de CONFIG_MODELOS) com os melhores hiperparâmetros da busca"""
+    return {
+        nome: (CONFIG_BUSCA[nome][0], {**CONFIG_BUSCA[nome][1], **resultado['melhores_params']})
+        for nome, resultado in registro['resultados'].items()
+    }
+
+
+def carregar_ou_buscar(X, y, chave=None, estrategia='halving', n_jobs=N_JOBS_PADRAO, log=logger.info):
+    """Modelos ajustados do registro em disco; faz a busca só se dados, espaços ou estratégia mudarem"""
+    chave = chave or chave_busca(X, y, estrategia)
+    caminho = caminho_registro(chave, prefixo='busca')
+    registro = ler_registro(caminho)
+    if registro is None:
+        registro = buscar_hiperparametros(X, y, estrategia, n_jobs, log)
+        registro['chave'] = chave
+        gravar_registro(registro, caminho)
+    return registro
+
+
+# ==================== VALIDAÇÃO CRUZADA ====================
+METRICAS_CV = ['accuracy', 'precision', 'recall', 'f1', 'roc_auc']
+
+
+def _avaliar_fold(estimador, params, X, y, idx_treino, idx_teste):
+    """Tarefa de um worker: treina em um fold e devolve as métricas de teste"""
+    from sklearn.metrics import accuracy_score, auc, f1_score, precision_score, recall_score, roc_curve
+
+    inicio = time.perf_counter()
+    model = carregar_estimador(estimador)(**params)
+    model.fit(X[idx_treino], y[idx_treino])
+    y_test = y[idx_teste]
+    y_pred = model.predict(X[idx_teste])
+    y_proba = model.predict_proba(X[idx_teste])[:, 1]
+    fpr, tpr, _ = roc_curve(y_test, y_proba)
+    return {
+        'accuracy': accuracy_score(y_test, y_pred),
+        'precision': precision_score(y_test, y_pred, zero_division=0),
+        'recall': recall_score(y_test, y_pred, zero_division=0),
+        'f1': f1_score(y_test, y_pred, zero_division=0),
+        'roc_auc': auc(fpr, tpr),
+        'tempo_s': time.perf_counter() - inicio,
+    }
+
+
+def intervalo_confianca(valores, nivel=0.95):
+    """Média e meia-largura do intervalo de confiança t de Student"""
+    valores = np.asarray(valores, dtype=float)
+    media = valores.mean()
+    if len(valores) < 2:
+        return media, 0.0
+    from scipy import stats
+
+    erro = valores.std(ddof=1) / np.sqrt(len(valores))
+    return media, float(stats.t.ppf((1 + nivel) / 2, len(valores) - 1) * erro)
+
+
+def validacao_cruzada(X, y, k=5, config=CONFIG_MODELOS, n_jobs=N_JOBS_PADRAO):
+    """k-fold estratificado de todos os modelos; todos os (modelo, fold) rodam em paralelo"""
+    from sklearn.model_selection import StratifiedKFold
+
+    folds = list(StratifiedKFold(n_splits=k, shuffle=True, random_state=42).split(X, y))
+    pares = [(nome, i) for nome in config for i in range(k)]
+
+    inicio = time.perf_counter()
+    saidas = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_avaliar_fold)(*config[nome], X, y, *folds[i]) for nome, i in pares
+    )
+
+    resultados = {}
+    for nome in config:
+        por_fold = [saida for (n, _), saida in zip(pares, saidas) if n == nome]
+        resultados[nome] = {
+            metrica: intervalo_confianca([f[metrica] for f in por_fold]) for metrica in METRICAS_CV
+        }
+        resultados[nome]['tempo_s'] = sum(f['tempo_s'] for f in por_fold)
+    return {'k': k, 'resultados': resultados, 'n_jobs': n_jobs,
+            'tempo_total_s': time.perf_counter() - inicio}
+
+
+def carregar_ou_validar(X, y, k=5, chave=None, config=CONFIG_MODELOS, n_jobs=N_JOBS_PADRAO):
+    """Validação cruzada do registro em disco; recalcula só se dados/config/k mudarem"""
+    chave = chave or chave_registro(X, y, config)
+    caminho = caminho_registro(f'{chave}_k{k}', prefixo='cv')
+    registro = ler_registro(caminho)
+    if registro is None:
+        registro = validacao_cruzada(X, y, k, config, n_jobs)
+        gravar_registro(registro, caminho)
+    return registro
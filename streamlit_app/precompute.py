@@ -0,0 +1,97 @@
+"""Pré-computa todos os artefatos do dashboard fora do Streamlit.
+
+Carrega o dataset, roda o prepare_data e materializa cubos de contagens,
+modal share, combinações de modais, regressão e classificadores (com
+validação cruzada) em um diretório versionado. Depois, suba o app com
+``DASHBOARD_MODO=precomputado`` para servir apenas esses artefatos.
+
+Com ``--csv`` (um ou mais arquivos) ou ``--bloco``, os arquivos são lidos em
+blocos e agregados incrementalmente (ver ingestao.py), sem carregar o
+dataset inteiro em memória, e os classificadores são treinados bloco a bloco
+(modelos incrementais, sem validação cruzada). Com ``--completo``, só as
+features de classificação de cada registro são guardadas e os classificadores
+do app são treinados no fim, com validação cruzada; a memória passa a crescer
+com o número de registros.
+
+Com ``--busca``, roda também a busca de hiperparâmetros dos classificadores
+(successive halving por padrão, ou ``--busca aleatoria``), com o log da curva
+tempo x qualidade de cada modelo; a melhor configuração fica no registro e
+nos artefatos, e o app serve os modelos ajustados sem refazer a busca.
+
+Uso:
+    python precompute.py [--destino DIR] [--n-jobs N] [--k-folds K]
+    python precompute.py --csv od_2016.csv od_2023.csv --bloco 500000
+    python precompute.py --csv od_2016.csv od_2023.csv --completo
+    python precompute.py --busca --n-jobs -1
+    python -m streamlit_app.precompute   # a partir da raiz do repositório
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+# Permite rodar como módulo a partir da raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from artefatos import (DIR_ARTEFATOS, K_FOLDS_PADRAO, diretorio_versao, identificar_fontes,  # noqa: E402
+                       materializar, materializar_dataframe)
+from dados import carregar_dataset, localizar_csv  # noqa: E402
+from ingestao import ingerir_em_blocos  # noqa: E402
+from modelos import ESTRATEGIAS_BUSCA, N_JOBS_PADRAO, TreinoIncremental  # noqa: E402
+from preparacao import preparar_dados  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--destino', default=DIR_ARTEFATOS, help='Diretório raiz dos artefatos')
+    parser.add_argument('--n-jobs', type=int, default=N_JOBS_PADRAO, help='Workers para o treino')
+    parser.add_argument('--k-folds', type=int, default=K_FOLDS_PADRAO, help='Folds da validação cruzada')
+    parser.add_argument('--csv', nargs='+', help='Arquivos de entrada (lidos em blocos)')
+    parser.add_argument('--bloco', type=int, help='Linhas por bloco na ingestão incremental')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Ingestão em blocos do dataset padrão, com treino incremental')
+    parser.add_argument('--completo', action='store_true',
+                        help='Na ingestão em blocos, treina os classificadores do app sobre todos os registros')
+    parser.add_argument('--busca', nargs='?', const='halving', choices=ESTRATEGIAS_BUSCA,
+                        help='Busca de hiperparâmetros dos classificadores (padrão: halving)')
+    args = parser.parse_args()
+    if args.completo and args.incremental:
+        parser.error('--completo não pode ser usado com --incremental')
+    em_blocos = args.csv or args.bloco or args.incremental
+    if args.busca and em_blocos and not args.completo:
+        parser.error('--busca na ingestão em blocos exige --completo (o treino incremental não faz a busca)')
+
+    inicio = time.perf_counter()
+    # Identidade dos arquivos antes da leitura: vai para o manifesto do build
+    caminhos = args.csv or [localizar_csv()]
+    fontes = identificar_fontes(caminhos)
+    if em_blocos:
+        print("Ingerindo em blocos...")
+        kwargs = {} if args.bloco is None else {'tamanho_bloco': args.bloco}
+        treino = None if args.completo else TreinoIncremental()
+        registros = f'{diretorio_versao(args.destino)}.registros.{os.getpid()}.tmp'
+        shutil.rmtree(registros, ignore_errors=True)
+        ingerido = ingerir_em_blocos(caminhos, treino=treino, destino_registros=registros, **kwargs)
+        print(f"  {ingerido['n_linhas']:,} registros ({ingerido['segundos']:.2f}s, "
+              f"{ingerido['linhas_por_s']:,.0f} linhas/s)")
+
+        print("Materializando artefatos...")
+        destino = materializar(
+            ingerido['agregados'], ingerido['X'], ingerido['y'], ingerido['n_linhas'], ingerido['n_colunas'],
+            args.destino, n_jobs=args.n_jobs, k_folds=args.k_folds, treino=treino, busca=args.busca,
+            registros=registros, fontes=fontes,
+        )
+    else:
+        print("Carregando e preparando o dataset...")
+        df = preparar_dados(carregar_dataset(caminho_csv=caminhos[0]))
+        print(f"  {len(df):,} registros ({time.perf_counter() - inicio:.2f}s)")
+
+        print("Materializando artefatos...")
+        destino = materializar_dataframe(df, args.destino, n_jobs=args.n_jobs, k_folds=args.k_folds,
+                                         busca=args.busca, fontes=fontes)
+    print(f"Artefatos gravados em {destino} ({time.perf_counter() - inicio:.2f}s no total)")
+
+
+if __name__ == '__main__':
+    main()
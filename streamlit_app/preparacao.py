@@ -0,0 +1,150 @@
+"""Preparação do dataframe do dashboard: flags, classificação de trajetos e bitmasks.
+
+Independente do Streamlit, para ser usada tanto pelo app quanto pelos
+scripts de linha de comando (pré-computação, benchmarks). O resultado é
+compartilhado entre as sessões do app, por isso é entregue somente leitura.
+
+Colunas de texto com poucos valores distintos (bairro, município,
+classificação dos trajetos, rótulos ``*_desc``) ficam como ``Categorical``:
+um código int8 por linha e cada texto guardado uma única vez.
+"""
+import numpy as np
+import pandas as pd
+
+from mapeamentos import FAIXA_ETARIA_MAP, RENDA_MAP, SEXO_MAP, TERMINAL_MAP
+from modais import analisar_modais, num_modais_por_tipo
+
+# Classificações possíveis de um trajeto, na ordem das páginas
+TIPOS_TRAJETO = ['monomodal', 'multimodal', 'sem_resposta']
+
+# Colunas de texto (do arquivo e das zonas de destino dos fluxos O-D) guardadas como categóricas
+COLUNAS_CATEGORICAS = [
+    'cidade_residencia', 'bairro_residencia', 'cidade_trabalho', 'bairro_trabalho', 'cidade_escola', 'bairro_escola',
+    'cidade_destino', 'bairro_destino',
+]
+
+
+def rotulos_categoricos(codigos, mapa):
+    """Rótulos do mapa como Categorical ordenado (na ordem do mapa); códigos fora do mapa viram nulos"""
+    posicoes = pd.Index(list(mapa)).get_indexer(np.asarray(codigos))
+    return pd.Categorical.from_codes(posicoes.astype(np.int8), categories=list(mapa.values()), ordered=True)
+
+
+def codigos_terminal(coluna):
+    """Código int8 do terminal (0 = não declarado, -1 = vazio ou fora do TERMINAL_MAP), lido do texto ou do número"""
+    valores = pd.to_numeric(coluna, errors='coerce').to_numpy(dtype=float)
+    # Fora do mapa vira -1 antes do cast: um 300 não pode dar a volta no int8 e virar o "Terminal 44"
+    return np.where(np.isin(valores, list(TERMINAL_MAP)), valores, -1).astype(np.int8)
+
+
+def preparar_dados(df):
+    """Prepara e enriquece o dataframe com variáveis derivadas"""
+    # Flags trabalho e estudo
+    df['trabalha_flag'] = df['trabalha'] == 1
+    df['estuda_flag'] = df['pesquisado_estuda'] == 1
+    
+    # Parsing vetorizado dos modais: listas, classificação e nº de modais
+    modais_trabalho = analisar_modais(df['meio_transporte_trab'])
+    modais_aula = analisar_modais(df['transporte_aula'])
+    modais_filhos = analisar_modais(df['meios_transporte_filhos'])
+    
+    # Classificação de trajetos
+    df['tipo_trajeto_trabalho'] = pd.Categorical(modais_trabalho['tipo'], categories=TIPOS_TRAJETO)
+    df['tipo_trajeto_aula'] = pd.Categorical(modais_aula['tipo'], categories=TIPOS_TRAJETO)
+    df['tipo_trajeto_filhos'] = pd.Categorical(modais_filhos['tipo'], categories=TIPOS_TRAJETO)
+    
+    # Uso de terminais e integração (código inteiro do terminal, calculado uma única vez)
+    df['terminal_trabalho_cod'] = codigos_terminal(df['terminal_int_trabalho'])
+    df['terminal_aula_cod'] = codigos_terminal(df['terminal_aula'])
+    df['usa_terminal_trabalho'] = df['terminal_trabalho_cod'] != 0
+    df['usa_integracao_aula'] = df['utiliza_integracao_aula'] == 1
+    
+    # Usuários de integração (integração formal ou terminal declarado: qualquer resposta preenchida
+    # diferente de 0, mesmo com código inválido, que fica fora só das análises por terminal)
+    terminal_trabalho = df['terminal_int_trabalho'].notna() & (df['terminal_trabalho_cod'] != 0)
+    terminal_aula = df['terminal_aula'].notna() & (df['terminal_aula_cod'] != 0)
+    usa_int_trabalho = (df['utiliza_terminal_int_trabalho'] == 1) | terminal_trabalho
+    usa_int_aula = (df['utiliza_integracao_aula'] == 1) | terminal_aula
+    df['usuario_integracao'] = usa_int_trabalho | usa_int_aula
+    
+    # Número de modais
+    df['num_modais_trabalho'] = num_modais_por_tipo(df['tipo_trajeto_trabalho'])
+    df['num_modais_aula'] = num_modais_por_tipo(df['tipo_trajeto_aula'])
+    df['num_modais'] = df[['num_modais_trabalho', 'num_modais_aula']].max(axis=1)
+    # Nº de modais declarados (feature dos classificadores; conta repetições e códigos fora do mapa)
+    df['num_modais_declarados_trabalho'] = modais_trabalho['num_modais'].to_numpy(dtype=np.int8)
+    
+    # Variável binária de integração
+    df['usa_integracao'] = ((df['usa_terminal_trabalho']) | (df['usa_integracao_aula'])).astype(int)
+    
+    # Conjuntos de modais em bitmask (bit i = código de modal i)
+    df['modal_trabalho_mask'] = modais_trabalho['mascara']
+    df['modal_aula_mask'] = modais_aula['mascara']
+    df['modal_filhos_mask'] = modais_filhos['mascara']
+    
+    # Mapeamentos descritivos (categorias na ordem dos códigos)
+    df['sexo_desc'] = rotulos_categoricos(df['sexo'], SEXO_MAP)
+    df['faixa_etaria_desc'] = rotulos_categoricos(df['faixa_etaria'], FAIXA_ETARIA_MAP)
+    df['renda_desc'] = rotulos_categoricos(df['renda'], RENDA_MAP)
+    
+    categorizar(df)
+    
+    return df
+
+
+def categorizar(df, colunas=COLUNAS_CATEGORICAS):
+    """Colunas de texto como Categorical com as categorias presentes, em ordem.
+
+    Colunas que já são categóricas (ex.: partes concatenadas na atualização
+    incremental) só perdem as categorias sem uso, sem voltar a texto.
+    """
+    for coluna in colunas:
+        if coluna not in df.columns:
+            continue
+        valores = df[coluna]
+        if isinstance(valores.dtype, pd.CategoricalDtype):
+            valores = valores.cat.remove_unused_categories()
+            df[coluna] = valores.cat.reorder_categories(sorted(valores.cat.categories))
+        else:
+            df[coluna] = valores.astype('category')
+    return df
+
+
+def concatenar(partes, colunas=COLUNAS_CATEGORICAS):
+    """pd.concat de partes preparadas separadamente, com a união das categorias das colunas de texto"""
+    partes = [parte for parte in partes if len(parte)] or partes[:1]
+    for coluna in colunas:
+        if not all(coluna in parte.columns and isinstance(parte[coluna].dtype, pd.CategoricalDtype)
+                   for parte in partes):
+            continue
+        categorias = partes[0][coluna].cat.categories
+        for parte in partes[1:]:
+            categorias = categorias.union(parte[coluna].cat.categories)
+        partes = [parte.assign(**{coluna: parte[coluna].cat.set_categories(categorias)}) for parte in partes]
+    return pd.concat(partes, ignore_index=True)
+
+
+class DataFrameSomenteLeitura(pd.DataFrame):
+    """DataFrame compartilhado: não aceita novas colunas nem atribuição de colunas.
+
+    Operações que geram outro dataframe (filtros, ``copy``, ``assign``...)
+    devolvem um ``pd.DataFrame`` comum, que pode ser alterado livremente.
+    """
+
+    def __setitem__(self, chave, valor):
+        raise TypeError("Dataframe compartilhado é somente leitura; use df.copy() ou df.assign()")
+
+    def insert(self, *args, **kwargs):
+        raise TypeError("Dataframe compartilhado é somente leitura; use df.copy() ou df.assign()")
+
+
+def somente_leitura(df):
+    """Versão do dataframe cujos arrays não podem ser alterados in-place"""
+    colunas = {}
+    for coluna in df.columns:
+        valores = df[coluna].array
+        if isinstance(df[coluna].dtype, np.dtype):
+            valores = df[coluna].to_numpy(copy=True)
+            valores.flags.writeable = False
+        colunas[coluna] = valores
+    return DataFrameSomenteLeitura(colunas, index=df.index, copy=False)
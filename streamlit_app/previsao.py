@@ -0,0 +1,122 @@
+"""Previsão de uso de integração (usa_integracao) com os classificadores persistidos.
+
+``Preditor`` recebe um registro de modelos (do treino, da busca de
+hiperparâmetros ou dos artefatos pré-computados) e responde a lotes de
+registros (renda, faixa_etaria, sexo, num_modais_trabalho) com a
+probabilidade de uso de integração. Como as features são códigos de poucas
+categorias, o ``predict_proba`` vetorizado roda só sobre as combinações
+distintas do lote, e cada registro recebe a probabilidade da sua
+combinação; cada chamada mede o throughput em registros/s.
+
+Os cenários de planejamento ("e se a renda deste bairro subisse uma faixa?")
+partem do agregado ``perfis`` (registros do recorte contados por features e
+alvo): as features de cada perfil são alteradas e a participação prevista é
+a média das probabilidades ponderada pela contagem.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from modelos import FEATURES, registros_validos
+
+# Faixas de renda do domínio dos classificadores
+RENDA_MIN, RENDA_MAX = 1, 7
+
+# Bits de cada feature na chave inteira de um registro
+BITS_FEATURE = 16
+
+
+def matriz_features(registros):
+    """Matriz int64 (n x 4) na ordem de FEATURES, a partir de um DataFrame/dict com essas colunas ou de um array"""
+    if isinstance(registros, (pd.DataFrame, dict)):
+        faltando = [c for c in FEATURES if c not in registros]
+        if faltando:
+            raise ValueError(f"Colunas ausentes: {', '.join(faltando)}")
+        colunas = [pd.to_numeric(pd.Series(registros[c]), errors='coerce').to_numpy() for c in FEATURES]
+        X = np.column_stack(colunas) if len(colunas[0]) else np.empty((0, len(FEATURES)))
+    else:
+        X = np.asarray(registros, dtype=float).reshape(-1, len(FEATURES))
+    # Valores ausentes ou não inteiros ficam fora do domínio (código 0)
+    inteiros = np.isfinite(X) & (X == np.round(X))
+    return np.where(inteiros, X, 0).astype(np.int64)
+
+
+def empacotar(X):
+    """Uma chave int64 por linha de features (códigos válidos cabem em 16 bits cada)"""
+    chaves = np.zeros(len(X), dtype=np.int64)
+    for j in range(len(FEATURES)):
+        chaves = chaves << BITS_FEATURE | np.minimum(X[:, j], (1 << BITS_FEATURE) - 1)
+    return chaves
+
+
+def desempacotar(chaves):
+    """Linhas de features (n x 4) a partir das chaves de ``empacotar``"""
+    deslocamentos = BITS_FEATURE * np.arange(len(FEATURES) - 1, -1, -1)
+    return (chaves[:, None] >> deslocamentos) & ((1 << BITS_FEATURE) - 1)
+
+
+class Preditor:
+    """Classificadores de um registro, carregados uma vez, prevendo lotes de registros"""
+
+    def __init__(self, registro):
+        self.modelos = {nome: resultado['model'] for nome, resultado in registro['resultados'].items()}
+        self.chave = registro.get('chave')
+
+    def probabilidades(self, registros, modelo):
+        """Probabilidade de uso de integração de cada registro (NaN fora do domínio dos modelos)"""
+        return self.prever_lote(registros, modelo)[0]
+
+    def prever_lote(self, registros, modelo):
+        """Probabilidades e medição do lote: registros, combinações distintas, segundos e registros/s"""
+        inicio = time.perf_counter()
+        X = matriz_features(registros)
+        validos = registros_validos(*X.T)
+        probabilidades = np.full(len(X), np.nan)
+        # Cada registro válido vira um int64 (16 bits por feature), e o unique é unidimensional
+        chaves, inverso = np.unique(empacotar(X[validos]), return_inverse=True)
+        distintas = desempacotar(chaves)
+        if len(distintas):
+            probabilidades[validos] = self.modelos[modelo].predict_proba(distintas)[:, 1][inverso.ravel()]
+        segundos = time.perf_counter() - inicio
+        return probabilidades, {
+            'registros': len(X),
+            'validos': int(validos.sum()),
+            'distintos': len(distintas),
+            'segundos': segundos,
+            'registros_por_s': len(X) / segundos if segundos > 0 else float('inf'),
+        }
+
+
+# ==================== CENÁRIOS ====================
+def deslocar_renda(perfis, deslocamento):
+    """Perfis com a renda deslocada em ``deslocamento`` faixas (limitada ao domínio dos modelos)"""
+    return perfis.assign(renda=np.clip(perfis['renda'].to_numpy(dtype=np.int64) + deslocamento,
+                                       RENDA_MIN, RENDA_MAX))
+
+
+def participacao_prevista(preditor, perfis, modelo):
+    """Participação prevista de usuários de integração (%) nos perfis, ponderada pela contagem"""
+    contagem = perfis['contagem'].to_numpy(dtype=float)
+    if contagem.sum() == 0:
+        return np.nan
+    return float(np.average(preditor.probabilidades(perfis, modelo), weights=contagem) * 100)
+
+
+def curva_renda(preditor, perfis, modelo, deslocamentos=range(-3, 4)):
+    """Participação prevista para cada deslocamento da renda, com a observada nos perfis como referência.
+
+    Todos os cenários vão em um único lote (um ``predict_proba`` sobre as
+    combinações distintas de todos eles).
+    """
+    deslocamentos = list(deslocamentos)
+    cenarios = pd.concat([deslocar_renda(perfis, d) for d in deslocamentos], ignore_index=True)
+    probabilidades = preditor.probabilidades(cenarios, modelo).reshape(len(deslocamentos), len(perfis))
+    contagem = perfis['contagem'].to_numpy(dtype=float)
+    total = contagem.sum()
+    observada = (perfis['usa_integracao'].to_numpy() * contagem).sum() / total * 100 if total else np.nan
+    return pd.DataFrame({
+        'deslocamento': deslocamentos,
+        'participacao_prevista': probabilidades @ contagem / total * 100 if total else np.nan,
+        'participacao_observada': observada,
+    })
@@ -0,0 +1,157 @@
+"""Análises por terminal de integração, sobre um índice de códigos inteiros.
+
+O terminal declarado (``terminal_int_trabalho`` para o trabalho,
+``terminal_aula`` para o estudo) vira um código int8 uma única vez, na
+preparação. O agregado ``terminais`` conta quem declarou um terminal por
+contexto, terminal e cada quebra da página em separado (conjunto de modais,
+perfil demográfico, zona de residência), de modo que o tamanho depende só
+dos domínios de cada quebra. Como os demais agregados somáveis, é acumulado
+na ingestão em blocos e atualizado pela diferença; no filtro global, é
+recalculado com os registros do recorte.
+
+``IndiceTerminais`` guarda as quebras de um contexto como arrays de
+inteiros pequenos: terminal, sexo, faixa etária, renda, zona de residência
+e bitmask. Usuários por terminal, composição demográfica, combinações de
+modais e bacia de captação saem de ``np.bincount`` sobre esses códigos, sem
+nenhuma comparação de texto.
+"""
+import numpy as np
+import pandas as pd
+
+from agregacao import contar_grupos
+from dados import COLUNA_PESO
+from mapeamentos import TERMINAL_MAP
+from modais import N_MODAIS, popcount
+from preparacao import categorizar, concatenar
+
+# Contexto -> (código do terminal, bitmask dos modais)
+CONTEXTOS_TERMINAL = {
+    'trabalho': ('terminal_trabalho_cod', 'modal_trabalho_mask'),
+    'aula': ('terminal_aula_cod', 'modal_aula_mask'),
+}
+
+# Quebras do agregado: usuários por terminal e pelas colunas de cada uma (as das outras ficam nulas)
+QUEBRAS_TERMINAL = {
+    'modais': ['mascara'],
+    'demografia': ['sexo', 'faixa_etaria', 'renda'],
+    'zona': ['cidade_residencia', 'bairro_residencia'],
+}
+COLUNAS_QUEBRAS = [coluna for colunas in QUEBRAS_TERMINAL.values() for coluna in colunas]
+
+# Códigos dos terminais de fato (0 é "não declarado")
+CODIGOS_TERMINAIS = [c for c in TERMINAL_MAP if c > 0]
+
+
+# ==================== AGREGADO ====================
+def calcular_terminais(df):
+    """Usuários por (contexto, terminal) em cada quebra: bitmask dos modais, perfil demográfico, zona"""
+    partes = []
+    for contexto, (terminal, mascara) in CONTEXTOS_TERMINAL.items():
+        usuarios = df.loc[
+            df[terminal] > 0,
+            [c for c in [terminal, mascara, *QUEBRAS_TERMINAL['demografia'], *QUEBRAS_TERMINAL['zona'], COLUNA_PESO]
+             if c in df.columns]
+        ].rename(columns={terminal: 'terminal', mascara: 'mascara'})
+        for quebra, colunas in QUEBRAS_TERMINAL.items():
+            contagens = contar_grupos(usuarios, ['terminal'] + colunas)
+            contagens.insert(0, 'quebra', quebra)
+            contagens.insert(0, 'contexto', contexto)
+            partes.append(contagens)
+    terminais = concatenar(partes)
+    terminais['terminal'] = terminais['terminal'].astype(np.int8)
+    # Fora da quebra de modais, a bitmask fica 0 (as colunas das outras quebras ficam nulas)
+    terminais['mascara'] = terminais['mascara'].fillna(0).astype(np.uint16)
+    return categorizar(terminais)
+
+
+# ==================== ÍNDICE ====================
+def nome_terminal(codigo):
+    return TERMINAL_MAP.get(int(codigo), f"Terminal {codigo}")
+
+
+class IndiceTerminais:
+    """Quebras de um contexto em códigos inteiros; cada análise é um bincount sobre elas"""
+
+    def __init__(self, terminais, contexto):
+        recorte = terminais[terminais['contexto'].to_numpy() == contexto]
+        quebras = recorte['quebra'].to_numpy()
+        modais = recorte[quebras == 'modais']
+        demografia = recorte[quebras == 'demografia']
+        zona = recorte[quebras == 'zona']
+
+        # Quebra de modais: cobre todos os usuários (usuários por terminal, total e combinações)
+        self.terminal = modais['terminal'].to_numpy(dtype=np.int64)
+        self.mascara = modais['mascara'].to_numpy(dtype=np.uint16)
+        self.contagem = modais['contagem'].to_numpy(dtype=float)
+
+        self.terminal_demografia = demografia['terminal'].to_numpy(dtype=np.int64)
+        self.contagem_demografia = demografia['contagem'].to_numpy(dtype=float)
+        self.codigos = {d: demografia[d].to_numpy() for d in QUEBRAS_TERMINAL['demografia']}
+
+        # Zona = par (município, bairro) de residência, numerado a partir dos códigos das categorias
+        self.terminal_zona = zona['terminal'].to_numpy(dtype=np.int64)
+        self.contagem_zona = zona['contagem'].to_numpy(dtype=float)
+        cidade = zona['cidade_residencia'].astype('category').cat
+        bairro = zona['bairro_residencia'].astype('category').cat
+        self.municipio, self.municipios = cidade.codes.to_numpy(dtype=np.int64), cidade.categories
+        codigos_bairro, n_bairros = bairro.codes.to_numpy(dtype=np.int64), len(bairro.categories)
+        validos = (self.municipio >= 0) & (codigos_bairro >= 0)
+        pares, inverso = np.unique(self.municipio[validos] * n_bairros + codigos_bairro[validos], return_inverse=True)
+        self.zona = np.full(len(zona), -1, dtype=np.int64)
+        self.zona[validos] = inverso
+        self.zonas = pd.MultiIndex.from_arrays(
+            [self.municipios[pares // max(n_bairros, 1)], bairro.categories[pares % max(n_bairros, 1)]],
+            names=['cidade', 'bairro'],
+        )
+        self.n_terminais = max(max(CODIGOS_TERMINAIS), int(self.terminal.max(initial=0))) + 1
+
+    @staticmethod
+    def _somar(codigos, n, contagem, selecao=None):
+        if selecao is None:
+            return np.bincount(codigos, weights=contagem, minlength=n)
+        return np.bincount(codigos[selecao], weights=contagem[selecao], minlength=n)
+
+    def total(self):
+        return float(self.contagem.sum())
+
+    def usuarios(self):
+        """Usuários de cada terminal com algum usuário no recorte, em ordem decrescente"""
+        contagens = self._somar(self.terminal, self.n_terminais, self.contagem)
+        presentes = np.flatnonzero(contagens)
+        serie = pd.Series(contagens[presentes], index=presentes, name='usuarios')
+        return serie.sort_values(ascending=False, kind='stable')
+
+    def composicao(self, dimensao, mapa):
+        """Usuários terminal x categoria da dimensão (códigos fora do mapa ficam de fora)"""
+        posicoes = pd.Index(list(mapa)).get_indexer(self.codigos[dimensao])
+        validos = posicoes >= 0
+        chave = self.terminal_demografia * len(mapa) + posicoes
+        tabela = self._somar(chave, self.n_terminais * len(mapa), self.contagem_demografia, validos)
+        tabela = tabela.reshape(-1, len(mapa))
+        presentes = np.flatnonzero(tabela.sum(axis=1))
+        return pd.DataFrame(tabela[presentes], index=presentes, columns=list(mapa.values()))
+
+    def combinacoes(self, terminal=None):
+        """Usuários por (terminal, conjunto de modais declarado), do mais para o menos frequente"""
+        selecao = self.mascara > 0
+        if terminal is not None:
+            selecao &= self.terminal == terminal
+        chaves, inverso = np.unique(self.terminal[selecao] << N_MODAIS | self.mascara[selecao],
+                                    return_inverse=True)
+        contagens = np.bincount(inverso, weights=self.contagem[selecao], minlength=len(chaves))
+        mascaras = (chaves & ((1 << N_MODAIS) - 1)).astype(np.uint16)
+        ordem = np.lexsort((mascaras, -contagens, chaves >> N_MODAIS))
+        return pd.DataFrame({
+            'terminal': (chaves >> N_MODAIS)[ordem],
+            'mascara': mascaras[ordem],
+            'n_modais': popcount(mascaras[ordem]),
+            'usuarios': contagens[ordem],
+        })
+
+    def bacia(self, terminal, nivel='bairro'):
+        """Usuários de um terminal por zona (bairro) ou município de residência, em ordem decrescente"""
+        codigos, rotulos = (self.zona, self.zonas) if nivel == 'bairro' else (self.municipio, self.municipios)
+        selecao = (self.terminal_zona == terminal) & (codigos >= 0)
+        contagens = self._somar(codigos, len(rotulos), self.contagem_zona, selecao)
+        presentes = np.flatnonzero(contagens)
+        return pd.Series(contagens[presentes], index=rotulos[presentes]).sort_values(ascending=False, kind='stable')